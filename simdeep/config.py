@@ -28,6 +28,30 @@ CLUSTER_ARRAY = []
 PVALUE_THRESHOLD = 0.01 # Threshold for survival significance to set a node as valid
 CINDEX_THRESHOLD = 0.65 # experimental
 NB_THREADS_COXPH = 10
+# Newton-Raphson iterations and convergence precision of the univariate Cox-PH
+# models fitted together on all the nodes (coxph_columns)
+COXPH_MAX_ITER = 50
+COXPH_PRECISION = 1e-7
+COXPH_MAX_STEP = 2.0 # maximum Newton-Raphson step, for standardized columns
+# test of the cluster labels (few integer values) by coxph when no metadata
+# are used with the python backend: 'logrank' (k-group log-rank test) or
+# 'coxph' (Cox-PH model of the labels)
+LABELS_SURVIVAL_TEST = 'logrank'
+LOGRANK_MAX_GROUPS = 20 # maximum number of distinct labels for the log-rank test
+# concordance index of the python backend: 'harrell' (tied scores count for
+# one half, as lifelines) or 'noether' (tied scores left out, as survcomp)
+C_INDEX_METHOD = 'harrell'
+# number of nodes scored together by the C-index node selection (the chunks
+# of very wide embeddings are scored in parallel with nb_threads_coxph)
+CINDEX_NODES_CHUNK_SIZE = 2000
+NB_THREADS_LOADING = 1 # number of input matrices parsed in parallel (1: sequential)
+# floating point type of the input matrices, from the parsing to the normalization
+# steps. 'float32' halves the memory used by the matrices
+DTYPE = 'float64'
+# omics (keys of the training tsv dict) loaded as scipy sparse matrices, such as binary
+# mutation matrices. They are converted to dense matrices after the feature selection
+# (NB_FEATURES_TO_KEEP) of the normalization
+SPARSE_OMICS = []
 STACK_MULTI_OMIC = False
 
 #### Boosting values
@@ -83,6 +107,19 @@ TEST_TSV = {
 
 DEFAULTSEP = '\t'
 
+# Number of matrix cells parsed per block when loading the input tsv files
+# (bounds the memory used by the parser on top of the final matrix)
+PARSING_CHUNK_SIZE = 2 ** 23
+
+# Number of matrix cells ranked, scaled or correlated at once by the RankNorm,
+# MadScaler and CorrelationReducer normalizations (bounds their temporary arrays)
+NORMALIZATION_CHUNK_SIZE = 2 ** 23
+
+# Number of features with the highest variance kept for each input matrix
+# when parsing the training files (0: all the features are loaded). The
+# variances are computed on all the training samples, before any fold split
+NB_FEATURES_TO_LOAD = 0
+
 SEPARATOR = {
     '0717_methyl_cnv_inter_matrix.tsv' : ' ',
     '0717_expr_methyl_inter_matrix.tsv': ' ',
@@ -95,6 +132,13 @@ PATH_TO_SAVE_MODEL = './'
 # Path to generate png images
 PATH_RESULTS = './'
 
+# Folder where the parsed input matrices are cached as binary files
+# (None: the input files are parsed at each loading)
+PATH_CACHE = None
+# Maximum size (in bytes) of the cache folder. The least recently used
+# matrices are removed when the limit is exceeded
+CACHE_MAX_SIZE = 2 ** 34
+
 ######## Cross-validation on the training set ############
 CROSS_VALIDATION_INSTANCE = KFold(n_splits=5, shuffle=True, random_state=1)
 
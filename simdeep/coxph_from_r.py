@@ -6,6 +6,14 @@ from lifelines import CoxPHFitter
 from lifelines import KaplanMeierFitter
 
 from simdeep.config import USE_R_PACKAGES_FOR_SURVIVAL
+from simdeep.config import COXPH_MAX_ITER
+from simdeep.config import COXPH_PRECISION
+from simdeep.config import COXPH_MAX_STEP
+from simdeep.config import LABELS_SURVIVAL_TEST
+from simdeep.config import LOGRANK_MAX_GROUPS
+from simdeep.config import C_INDEX_METHOD
+
+from scipy.stats import chi2
 
 import matplotlib
 matplotlib.use('Agg')
@@ -113,13 +121,19 @@ def coxph_from_python(
         fig_name='KM_plot.pdf',
         penalizer=0.01,
         l1_ratio=0.0,
-        isfactor=False):
+        isfactor=False,
+        design=None):
     """
+    design: SurvivalDesign of isdead and nbdays. The univariate models of
+            numerical values are fitted with it (coxph_columns)
     """
     values = np.asarray(values)
     isdead = np.asarray(isdead)
     nbdays = np.asarray(nbdays)
 
+    if metadata_mat is None and not isfactor and not do_KM_plot:
+        return coxph_columns(values, isdead, nbdays, design=design)[0]
+
     if isfactor:
         values = np.asarray(values).astype("str")
 
@@ -131,7 +145,12 @@ def coxph_from_python(
         }
 
         for key in metadata_mat:
-            frame[key] = metadata_mat[key]
+            # constant covariates (such as metadata categories absent
+            # from the samples) cannot be fitted
+            if metadata_mat[key].nunique() < 2:
+                continue
+
+            frame[key] = np.asarray(metadata_mat[key])
 
         frame = pd.DataFrame(frame)
 
@@ -191,6 +210,490 @@ def coxph_from_python(
 
     return pvalue
 
+class SurvivalDesign():
+    """
+    risk-set structure of the survival of a cohort, computed once and shared
+    by all the survival tests done on the cohort: the samples sorted by
+    survival time and the groups of tied times, with their numbers of events
+    and of samples at risk
+    """
+    def __init__(self, isdead, nbdays):
+        """ """
+        self.event = np.asarray(isdead, dtype=np.float64).reshape(-1)
+        self.time = np.asarray(nbdays, dtype=np.float64).reshape(-1)
+
+        assert(len(self.event) == len(self.time))
+
+        self.order = np.argsort(self.time, kind='stable')
+        self._set_risk_sets()
+
+    def _set_risk_sets(self):
+        """ """
+        nb_samples = len(self.order)
+
+        self.sorted_time = self.time[self.order]
+        self.sorted_event = self.event[self.order]
+
+        # first (start) and after last (end) sorted positions of each time
+        is_start = np.ones(nb_samples, dtype=bool)
+        is_start[1:] = self.sorted_time[1:] != self.sorted_time[:-1]
+
+        self.starts = np.flatnonzero(is_start)
+        self.ends = np.r_[self.starts[1:], nb_samples].astype(int)
+
+        self.unique_time = self.sorted_time[self.starts]
+        self.nb_at_risk = nb_samples - self.starts
+        self.nb_events = np.add.reduceat(self.sorted_event, self.starts) \
+            if nb_samples else np.zeros(0)
+
+    def __len__(self):
+        """ """
+        return len(self.time)
+
+    def subset(self, mask):
+        """
+        design of the samples of a boolean mask, reusing the sort order
+        """
+        mask = np.asarray(mask, dtype=bool)
+
+        positions = np.cumsum(mask) - 1
+
+        design = SurvivalDesign.__new__(SurvivalDesign)
+        design.event = self.event[mask]
+        design.time = self.time[mask]
+        design.order = positions[self.order[mask[self.order]]]
+        design._set_risk_sets()
+
+        return design
+
+    def kaplan_meier(self):
+        """
+        times and values of the Kaplan-Meier survival function, starting
+        at time 0
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            survival = np.exp(np.cumsum(
+                np.log(self.nb_at_risk - self.nb_events) - np.log(self.nb_at_risk)))
+
+        if len(self.unique_time) and self.unique_time[0] == 0:
+            return self.unique_time, survival
+
+        return np.r_[0.0, self.unique_time], np.r_[1.0, survival]
+
+    def median(self):
+        """
+        median survival time (inf if the survival stays above 0.5)
+        """
+        times, survival = self.kaplan_meier()
+        below = np.flatnonzero(survival <= 0.5)
+
+        if not len(below):
+            return np.inf
+
+        return times[below[0]]
+
+    def restricted_mean(self):
+        """
+        area under the Kaplan-Meier survival function (inf if the last
+        sample is censored)
+        """
+        times, survival = self.kaplan_meier()
+        mean = (np.diff(times) * survival[:-1]).sum()
+
+        if survival[-1] > 0:
+            return np.inf
+
+        return mean
+
+
+def coxph_columns(matrix,
+                  isdead,
+                  nbdays,
+                  max_iter=COXPH_MAX_ITER,
+                  precision=COXPH_PRECISION,
+                  design=None):
+    """
+    likelihood ratio test p-values of the univariate Cox-PH models (Efron
+    ties) of each column of matrix, such as the nodes of an autoencoder.
+    The models are fitted together: the risk set sums are cumulative sums
+    along the sort order of the SurvivalDesign, shared by all the columns,
+    and the Newton-Raphson steps are done for all the columns at once.
+    Columns without variance or with NaN values have a NaN p-value
+    """
+    loglik, loglik_null, _ = _fit_coxph_columns(
+        matrix, isdead, nbdays, max_iter, precision, design)
+
+    stats = np.clip(2.0 * (loglik - loglik_null), 0, None)
+
+    return chi2.sf(stats, 1)
+
+
+def _fit_coxph_columns(matrix,
+                       isdead,
+                       nbdays,
+                       max_iter=COXPH_MAX_ITER,
+                       precision=COXPH_PRECISION,
+                       design=None,
+                       max_step=COXPH_MAX_STEP):
+    """
+    return the fitted and null partial log-likelihoods and the coefficients
+    of the univariate Cox-PH models of the columns of matrix (NaN for the
+    columns that cannot be fitted)
+    """
+    if design is None:
+        design = SurvivalDesign(isdead, nbdays)
+
+    matrix = np.asarray(matrix, dtype=np.float64).reshape(len(design), -1)
+    nb_samples, nb_columns = matrix.shape
+
+    loglik = np.full(nb_columns, np.nan)
+    loglik_null = np.full(nb_columns, np.nan)
+    coefs = np.full(nb_columns, np.nan)
+
+    std = matrix.std(axis=0)
+    valid = np.isfinite(std) & (std > 0)
+
+    with_events = design.nb_events > 0
+
+    if not valid.any() or not with_events.any():
+        return loglik, loglik_null, coefs
+
+    events = design.sorted_event
+    matrix = matrix[design.order][:, valid]
+    matrix = (matrix - matrix.mean(axis=0)) / std[valid]
+
+    # samples at risk at a time: the samples from the start of its group
+    # to the end of the sorted samples
+    at_risk = nb_samples - 1 - design.starts[with_events]
+    starts = design.starts[with_events]
+    ends = design.ends[with_events] - 1
+
+    nb_deaths = design.nb_events[with_events].astype(int)
+    death_sum = (matrix * events[:, None]).sum(axis=0)
+
+    # one Efron term per death: fraction l / d of the tied deaths removed
+    # from the risk set, for l in 0..d-1
+    group = np.repeat(np.arange(len(nb_deaths)), nb_deaths)
+    first = np.repeat(np.cumsum(nb_deaths) - nb_deaths, nb_deaths)
+    frac = ((np.arange(len(group)) - first) / nb_deaths[group])[:, None]
+
+    def efron(beta):
+        """
+        partial log-likelihood, gradient and hessian for each column
+        """
+        linear = matrix * beta
+        shift = linear.max(axis=0)
+        risk = np.exp(linear - shift)
+
+        sums = []
+
+        for weights in (risk, risk * matrix, risk * matrix * matrix):
+            risk_set = np.cumsum(weights[::-1], axis=0)[at_risk]
+            tied = _tied_sums(weights * events[:, None], starts, ends)
+            sums.append(risk_set[group] - frac * tied[group])
+
+        den, num1, num2 = sums
+
+        # the risk sets of diverging coefficients can underflow to 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean1 = num1 / den
+
+            loglik = beta * death_sum - (np.log(den) + shift).sum(axis=0)
+            gradient = death_sum - mean1.sum(axis=0)
+            hessian = -(num2 / den - mean1 ** 2).sum(axis=0)
+
+        return loglik, gradient, hessian
+
+    beta = np.zeros(matrix.shape[1])
+    fitted, gradient, hessian = efron(beta)
+    loglik_null[valid] = fitted
+
+    for _ in range(max_iter):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = np.nan_to_num(-gradient / hessian)
+
+        # capped steps: the coefficients of separated columns diverge
+        step = np.clip(step, -max_step, max_step)
+
+        if np.abs(step).max() < precision:
+            break
+
+        # step halving for the columns with a lower or non-finite likelihood
+        for _ in range(20):
+            new = efron(beta + step)
+            worse = ~np.isfinite(new[0]) | (new[0] < fitted)
+
+            if not worse.any():
+                break
+
+            step[worse] /= 2.0
+
+        # the columns still worse keep their last coefficients
+        step[worse] = 0.0
+        improvement = np.where(worse, 0.0, new[0] - fitted)
+
+        beta = beta + step
+        fitted = np.where(worse, fitted, new[0])
+        gradient = np.where(worse, gradient, new[1])
+        hessian = np.where(worse, hessian, new[2])
+
+        if np.all(improvement <= precision * np.abs(fitted)):
+            break
+
+    loglik[valid] = fitted
+    coefs[valid] = beta / std[valid]
+
+    return loglik, loglik_null, coefs
+
+
+def logrank(labels, isdead, nbdays, design=None):
+    """
+    p-value of the k-group log-rank test of the labels. The numbers of
+    events and of samples at risk of each label are computed at all the
+    event times at once from the sort order of the SurvivalDesign
+    """
+    if design is None:
+        design = SurvivalDesign(isdead, nbdays)
+
+    groups, codes = np.unique(np.asarray(labels), return_inverse=True)
+    nb_groups = len(groups)
+
+    if nb_groups < 2 or not design.nb_events.any():
+        return np.nan
+
+    # (time, label) table of the samples and of the events
+    time_group = np.repeat(np.arange(len(design.starts)),
+                           design.ends - design.starts)
+    cell = time_group * nb_groups + codes[design.order]
+    size = len(design.starts) * nb_groups
+
+    samples = np.bincount(cell, minlength=size).reshape(-1, nb_groups)
+    events = np.bincount(cell, weights=design.sorted_event,
+                         minlength=size).reshape(-1, nb_groups)
+
+    at_risk = np.cumsum(samples[::-1], axis=0)[::-1]
+    with_events = design.nb_events > 0
+
+    at_risk = at_risk[with_events]
+    events = events[with_events]
+    total = design.nb_at_risk[with_events].astype(np.float64)
+    deaths = design.nb_events[with_events]
+
+    proportion = at_risk / total[:, None]
+    expected = (deaths[:, None] * proportion).sum(axis=0)
+    observed = events.sum(axis=0)
+
+    # hypergeometric variance of the numbers of events
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight = np.where(total > 1, deaths * (total - deaths) / (total - 1), 0.0)
+
+    covariance = np.diag((weight[:, None] * proportion).sum(axis=0)) \
+        - np.dot((weight[:, None] * proportion).T, proportion)
+
+    diff = (observed - expected)[:-1]
+    covariance = covariance[:-1, :-1]
+
+    stat = np.dot(diff, np.dot(np.linalg.pinv(covariance), diff))
+
+    return chi2.sf(stat, nb_groups - 1)
+
+
+def c_index_columns(matrix,
+                    isdead,
+                    nbdays,
+                    matrix_test,
+                    isdead_test,
+                    nbdays_test,
+                    method=C_INDEX_METHOD,
+                    design=None,
+                    design_test=None):
+    """
+    c-index of each column of matrix_test (c_index_from_python of each
+    column): the univariate Cox-PH models of the columns of matrix are
+    fitted together (coxph_columns) and the signs of their coefficients
+    orient the concordances, computed together (concordance_columns)
+    """
+    coefs = _fit_coxph_columns(matrix, isdead, nbdays, design=design)[2]
+    matrix_test = np.asarray(matrix_test, dtype=np.float64).reshape(
+        len(isdead_test), -1)
+
+    return concordance_columns(-coefs * matrix_test, isdead_test, nbdays_test,
+                               method=method, design=design_test)
+
+
+def concordance(scores, isdead, nbdays, method=C_INDEX_METHOD, design=None):
+    """
+    concordance index of a score with the survival (see concordance_columns)
+    """
+    return concordance_columns(scores, isdead, nbdays,
+                               method=method, design=design)[0]
+
+
+def concordance_columns(matrix,
+                        isdead,
+                        nbdays,
+                        method=C_INDEX_METHOD,
+                        design=None):
+    """
+    concordance index of each column of matrix with the survival: fraction
+    of the comparable pairs (a sample with an event exiting before the
+    other one) where the sample exiting later has the higher score.
+    Tied scores count for one half ('harrell', as lifelines) or are left
+    out ('noether', as the survcomp concordance.index of the R path).
+
+    The pairs are counted with a bottom-up merge sort of the samples along
+    their exit order (shared by all the columns): at each level, the
+    samples of the right half of each block are compared to the left half
+    with one sort, for O(n log(n)^2) vectorized operations instead of the
+    O(n^2) pairs. Columns with NaN values or without comparable pairs have
+    a NaN concordance
+    """
+    assert(method in ['harrell', 'noether'])
+
+    if design is None:
+        design = SurvivalDesign(isdead, nbdays)
+
+    matrix = np.asarray(matrix, dtype=np.float64).reshape(len(design), -1)
+    nb_samples, nb_columns = matrix.shape
+
+    # exit batches: at a given time, the samples with an event exit before
+    # the censored ones, and the samples of a batch are not comparable
+    time_group = np.repeat(np.arange(len(design.starts)),
+                           design.ends - design.starts)
+    batch = np.empty(nb_samples, dtype=np.int64)
+    batch[design.order] = 2 * time_group + (design.sorted_event == 0)
+    died = design.event > 0
+
+    ranks = _dense_ranks(matrix)
+
+    # samples sorted by exit batch, then by score
+    keys = batch[:, None] * (nb_samples + 1) + ranks
+    order = np.argsort(keys, axis=0, kind='stable')
+    ranks = np.take_along_axis(ranks, order, axis=0)
+    died_sorted = died[order]
+
+    # padding to a power of 2, with samples exiting last and never counted
+    size = 1 << max(nb_samples - 1, 0).bit_length()
+    padding = ((0, size - nb_samples), (0, 0))
+
+    ranks = np.pad(ranks, padding)
+    valid = np.pad(np.ones((nb_samples, nb_columns)), padding)
+    died_padded = np.pad(died_sorted.astype(np.float64), padding)
+
+    pairs = np.zeros(nb_columns)
+    lower = np.zeros(nb_columns)
+    lower_or_tied = np.zeros(nb_columns)
+
+    half = 1
+
+    while half < size:
+        shape = (size // (2 * half), 2 * half, nb_columns)
+        is_right = (np.arange(2 * half) >= half)[None, :, None]
+
+        block_ranks = ranks.reshape(shape)
+        left_died = died_padded.reshape(shape) * ~is_right
+        right_valid = valid.reshape(shape) * is_right
+
+        pairs += (left_died.sum(axis=1) * right_valid.sum(axis=1)).sum(axis=0)
+
+        # number of the left samples with an event sorted before each right
+        # sample: with a lower score (right sample first for the ties) or
+        # with a lower or tied score (left samples first)
+        for count, tie_order in ((lower, ~is_right), (lower_or_tied, is_right)):
+            block_order = np.argsort(2 * block_ranks + tie_order, axis=1)
+            before = np.cumsum(np.take_along_axis(
+                left_died, block_order, axis=1), axis=1)
+            count += (before * np.take_along_axis(
+                right_valid, block_order, axis=1)).sum(axis=(0, 1))
+
+        half *= 2
+
+    # pairs of the same exit batch counted by the merge sort: all tied
+    # or sorted by score
+    batch = batch[order]
+    keys = np.take_along_axis(keys, order, axis=0)
+
+    within = _rank_in_run(batch) * died_sorted
+    within_tied = _rank_in_run(keys) * died_sorted
+
+    pairs -= within.sum(axis=0)
+    lower -= within.sum(axis=0) - within_tied.sum(axis=0)
+    lower_or_tied -= within.sum(axis=0)
+
+    tied = lower_or_tied - lower
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if method == 'harrell':
+            cindex = (lower + 0.5 * tied) / pairs
+        else:
+            cindex = lower / (pairs - tied)
+
+    cindex[np.isnan(matrix).any(axis=0)] = np.nan
+
+    return cindex
+
+
+def _dense_ranks(matrix):
+    """
+    dense ranks (0 for the lowest value) of the values of each column
+    """
+    order = np.argsort(matrix, axis=0, kind='stable')
+    sorted_values = np.take_along_axis(matrix, order, axis=0)
+
+    is_new = np.zeros(matrix.shape, dtype=np.int64)
+    is_new[1:] = sorted_values[1:] != sorted_values[:-1]
+
+    ranks = np.empty(matrix.shape, dtype=np.int64)
+    np.put_along_axis(ranks, order, np.cumsum(is_new, axis=0), axis=0)
+
+    return ranks
+
+
+def _rank_in_run(values):
+    """
+    position of each value in its run of consecutive identical values
+    (along the first axis)
+    """
+    values = values.reshape(len(values), -1)
+    index = np.arange(len(values))[:, None]
+
+    is_start = np.ones(values.shape, dtype=bool)
+    is_start[1:] = values[1:] != values[:-1]
+
+    return index - np.maximum.accumulate(np.where(is_start, index, 0), axis=0)
+
+
+def _is_label_vector(values, max_groups=LOGRANK_MAX_GROUPS):
+    """
+    test if values are labels: a few distinct integer values
+    """
+    values = np.asarray(values)
+
+    if values.ndim != 1:
+        return False
+
+    uniques = np.unique(values)
+
+    if len(uniques) > max_groups:
+        return False
+
+    if np.issubdtype(uniques.dtype, np.number):
+        return bool(np.all(uniques == np.round(uniques)))
+
+    return True
+
+
+def _tied_sums(weights, starts, ends):
+    """
+    sums of the rows of weights between each start and end (included)
+    """
+    cumsum = np.cumsum(weights, axis=0)
+    before = np.zeros((len(starts), weights.shape[1]))
+    before[starts > 0] = cumsum[starts[starts > 0] - 1]
+
+    return cumsum[ends] - before
+
+
 def coxph(values,
           isdead,
           nbdays,
@@ -202,16 +705,42 @@ def coxph(values,
           isfactor=False,
           use_r_packages=USE_R_PACKAGES_FOR_SURVIVAL,
           seed=None,
+          design=None,
+          labels_test=LABELS_SURVIVAL_TEST,
 ):
     """
+    design: SurvivalDesign of isdead and nbdays, shared by the tests done
+            on the same samples
+    labels_test: 'logrank' or 'coxph', test of the labels (values with a
+                 few distinct integers) without metadata, for the python
+                 backend. With 'logrank', the Kaplan-Meier plot still
+                 shows the p-value of the Cox-PH model
     """
     if seed:
         np.random.seed(int(seed))
 
+    if labels_test == 'logrank' and metadata_mat is None and \
+       not use_r_packages and _is_label_vector(values):
+        pvalue = logrank(values, isdead, nbdays, design=design)
+
+        if do_KM_plot:
+            coxph_from_python(
+                values, isdead, nbdays,
+                do_KM_plot=True,
+                png_path=png_path,
+                dichotomize_afterward=dichotomize_afterward,
+                fig_name=fig_name,
+                isfactor=isfactor)
+
+        return pvalue
+
+    kwargs = {}
+
     if use_r_packages:
         func = coxph_from_r
     else:
         func = coxph_from_python
+        kwargs['design'] = design
 
     return func(
         values,
@@ -222,7 +751,8 @@ def coxph(values,
         dichotomize_afterward=dichotomize_afterward,
         fig_name=fig_name,
         metadata_mat=metadata_mat,
-        isfactor=isfactor
+        isfactor=isfactor,
+        **kwargs
     )
 
 def coxph_from_r(
@@ -316,16 +846,23 @@ def c_index(
         isfactor=False,
         use_r_packages=USE_R_PACKAGES_FOR_SURVIVAL,
         seed=None,
+        design=None,
+        design_test=None,
         ):
     """
+    design, design_test: SurvivalDesign of the reference and test samples
     """
     if seed:
         np.random.seed(int(seed))
 
+    kwargs = {}
+
     if use_r_packages:
         func = c_index_from_r
     else:
         func = c_index_from_python
+        kwargs['design'] = design
+        kwargs['design_test'] = design_test
 
     return func(
         values,
@@ -334,7 +871,8 @@ def c_index(
         values_test,
         isdead_test,
         nbdays_test,
-        isfactor=isfactor
+        isfactor=isfactor,
+        **kwargs
     )
 
 
@@ -348,16 +886,21 @@ def c_index_multiple(
         isfactor=False,
         use_r_packages=USE_R_PACKAGES_FOR_SURVIVAL,
         seed=None,
+        design_test=None,
         ):
     """
+    design_test: SurvivalDesign of the test samples
     """
     if seed:
         np.random.seed(int(seed))
 
+    kwargs = {}
+
     if use_r_packages:
         func = c_index_multiple_from_r
     else:
         func = c_index_multiple_from_python
+        kwargs['design_test'] = design_test
 
     return func(
         values,
@@ -366,7 +909,8 @@ def c_index_multiple(
         values_test,
         isdead_test,
         nbdays_test,
-        isfactor=isfactor
+        isfactor=isfactor,
+        **kwargs
     )
 
 def c_index_from_python(
@@ -376,13 +920,26 @@ def c_index_from_python(
         values_test,
         isdead_test,
         nbdays_test,
-        isfactor=False):
+        isfactor=False,
+        design=None,
+        design_test=None):
     """
+    design, design_test: SurvivalDesign of the reference and test samples.
+                         The univariate model of numerical values is fitted
+                         with design: the concordance only depends on the
+                         sign of its coefficient
     """
+    if not isfactor:
+        coef = _fit_coxph_columns(values, isdead, nbdays, design=design)[2][0]
 
-    if isfactor:
-        values = np.asarray(values).astype("str")
-        values_test = np.asarray(values_test).astype("str")
+        if np.isnan(coef):
+            return np.nan
+
+        return concordance(-coef * np.asarray(values_test, dtype=np.float64),
+                           isdead_test, nbdays_test, design=design_test)
+
+    values = np.asarray(values).astype("str")
+    values_test = np.asarray(values_test).astype("str")
 
     frame = pd.DataFrame({
         "values": values,
@@ -406,10 +963,8 @@ def c_index_from_python(
         print(e)
         return np.nan
 
-    cindex = cph.score(frame_test,
-                       scoring_method="concordance_index")
-
-    return cindex
+    return concordance(-np.asarray(cph.predict_partial_hazard(frame_test)),
+                       isdead_test, nbdays_test, design=design_test)
 
 
 def c_index_multiple_from_python(
@@ -419,8 +974,10 @@ def c_index_multiple_from_python(
         matrix_test,
         isdead_test,
         nbdays_test,
-        isfactor=False):
+        isfactor=False,
+        design_test=None):
     """
+    design_test: SurvivalDesign of the test samples
     """
     frame = pd.DataFrame(matrix)
     frame["isdead"] = isdead
@@ -440,10 +997,8 @@ def c_index_multiple_from_python(
         print(e)
         return np.nan
 
-    cindex = cph.score(frame_test,
-                       scoring_method="concordance_index")
-
-    return cindex
+    return concordance(-np.asarray(cph.predict_partial_hazard(frame_test)),
+                       isdead_test, nbdays_test, design=design_test)
 
 
 def c_index_from_r(values,
@@ -511,8 +1066,8 @@ def c_index_multiple_from_r(
     if matrix.shape[1] < 2:
         return np.nan
 
-    nbdays[nbdays == 0] = 1
-    nbdays_test[nbdays_test == 0] = 1
+    nbdays = np.where(np.asarray(nbdays) == 0, 1, nbdays)
+    nbdays_test = np.where(np.asarray(nbdays_test) == 0, 1, nbdays_test)
 
     isdead = FloatVector(isdead)
     isdead_test = FloatVector(isdead_test)
@@ -567,7 +1122,7 @@ def predict_with_coxph_glmnet(
     if matrix.shape[1] < 2:
         return np.nan
 
-    nbdays[nbdays == 0] = 1
+    nbdays = np.where(np.asarray(nbdays) == 0, 1, nbdays)
 
     isdead = FloatVector(isdead)
 
@@ -605,55 +1160,43 @@ def convert_to_rmatrix(data):
 
 
 def surv_mean(isdead, nbdays,
-              use_r_packages=USE_R_PACKAGES_FOR_SURVIVAL):
+              use_r_packages=USE_R_PACKAGES_FOR_SURVIVAL,
+              design=None):
     """
     """
     if use_r_packages:
-        func = surv_mean_from_r
-    else:
-        func = surv_mean_from_python
+        return surv_mean_from_r(isdead, nbdays)
 
-    return func(isdead, nbdays)
+    return surv_mean_from_python(isdead, nbdays, design=design)
 
 def surv_median(
         isdead, nbdays,
-        use_r_packages=USE_R_PACKAGES_FOR_SURVIVAL):
+        use_r_packages=USE_R_PACKAGES_FOR_SURVIVAL,
+        design=None):
     """
     """
     if use_r_packages:
-        func = surv_median_from_r
-    else:
-        func = surv_median_from_python
+        return surv_median_from_r(isdead, nbdays)
 
-    return func(isdead, nbdays)
+    return surv_median_from_python(isdead, nbdays, design=design)
 
-def surv_mean_from_python(isdead,nbdays):
+def surv_mean_from_python(isdead, nbdays, design=None):
     """
+    restricted mean of the Kaplan-Meier survival function
     """
-    from lifelines.utils import restricted_mean_survival_time
+    if design is None:
+        design = SurvivalDesign(isdead, nbdays)
 
-    kaplan = KaplanMeierFitter()
+    return design.restricted_mean()
 
-    kaplan.fit(
-        nbdays,
-        event_observed=isdead,
-    )
-
-    survmean = restricted_mean_survival_time(kaplan)
-
-    return survmean
-
-def surv_median_from_python(isdead,nbdays):
+def surv_median_from_python(isdead, nbdays, design=None):
     """
+    median of the Kaplan-Meier survival function
     """
-    kaplan = KaplanMeierFitter()
-    np.random.seed(2020)
-    kaplan.fit(
-        nbdays,
-        event_observed=isdead,
-    )
+    if design is None:
+        design = SurvivalDesign(isdead, nbdays)
 
-    return kaplan.median_survival_time_
+    return design.median()
 
 def surv_mean_from_r(isdead,nbdays):
     """ """
@@ -161,10 +161,7 @@ class DeepBase(object):
         """
         load training dataset and surival
         """
-        self.dataset.load_array()
-        self.dataset.load_survival()
-        self.dataset.load_meta_data()
-        self.dataset.subset_training_sets()
+        self.dataset.load_training_samples()
 
         self.dataset.create_a_cv_split()
         self.dataset.normalize_training_array()
@@ -172,7 +169,7 @@ class DeepBase(object):
         self.matrix_train_array = self.dataset.matrix_train_array
 
         for key in self.matrix_train_array:
-            self.matrix_train_array[key] = self.matrix_train_array[key].astype('float32')
+            self.matrix_train_array[key] = self.matrix_train_array[key].astype('float32', copy=False)
 
     def load_test_dataset(self):
         """
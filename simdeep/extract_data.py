@@ -11,6 +11,11 @@ from simdeep.config import TEST_TSV
 from simdeep.config import SURVIVAL_TSV_TEST
 
 from simdeep.config import PATH_DATA
+from simdeep.config import PATH_CACHE
+from simdeep.config import NB_FEATURES_TO_LOAD
+from simdeep.config import NB_THREADS_LOADING
+from simdeep.config import DTYPE
+from simdeep.config import SPARSE_OMICS
 from simdeep.config import STACK_MULTI_OMIC
 
 from simdeep.config import NORMALIZATION
@@ -23,30 +28,43 @@ from simdeep.config import TEST_FOLD
 from simdeep.config import SURVIVAL_FLAG
 
 from simdeep.survival_utils import load_data_from_tsv
+from simdeep.survival_utils import _process_parallel_load_data
 from simdeep.survival_utils import load_survival_file
+from simdeep.survival_utils import Survival
 from simdeep.survival_utils import return_intersection_indexes
 from simdeep.survival_utils import translate_index
+from simdeep.survival_utils import SampleIndex
+from simdeep.survival_utils import FeatureIndex
 from simdeep.survival_utils import MadScaler
 from simdeep.survival_utils import RankNorm
 from simdeep.survival_utils import CorrelationReducer
 from simdeep.survival_utils import VarianceReducer
 from simdeep.survival_utils import SampleReducer
-from simdeep.survival_utils import convert_metadata_frame_to_matrix
+from simdeep.survival_utils import MetadataEncoder
+from simdeep.survival_utils import to_dense
+from simdeep.survival_utils import select_columns
+from simdeep.survival_utils import StackedMatrices
+from simdeep.survival_utils import log2_1p
 
 from simdeep.survival_utils import save_matrix
 
 from collections import defaultdict
 
+import weakref
+
 from os.path import isfile
 
 from time import time
 
+from multiprocessing import Pool
+from multiprocessing import current_process
+
 import numpy as np
 
 import pandas as pd
 
+
 from numpy import hstack
-from numpy import vstack
 
 
 ######################## VARIABLE ############################
@@ -55,6 +73,295 @@ QUANTILE_OPTION = {'n_quantiles': 100,
 ###############################################################
 
 
+class NormalizationPipeline():
+    """
+    normalization steps of an omic matrix, fitted once on a reference
+    matrix (the training samples) with fit_transform, then applied to new
+    matrices with transform. The fitted statistics are kept, so a pipeline
+    saved with the model does not need to be fitted again
+    """
+    def __init__(self, normalization=NORMALIZATION, dtype=DTYPE,
+                 training=False):
+        """
+        normalization: dict of the normalization steps (see NORMALIZATION)
+        dtype: floating point type of the normalized matrices
+        training: steps of the training matrices (LoadData._normalize):
+                  no log, the custom normalization after the variance
+                  selection and TRAIN_CORR_QUANTILE_NORM. Otherwise, the
+                  steps of the reference and test matrices
+                  (LoadData.transform_matrices): log, the custom
+                  normalization before the variance selection and
+                  TRAIN_CORR_QUANTILE_TRANSFORM (see _same_step_order)
+        """
+        self.normalization = defaultdict(bool, normalization)
+        self.dtype = np.dtype(dtype)
+        self.training = training
+
+        self.variance_reducer = VarianceReducer()
+        self.custom_norm = None
+        self.robust_scaler = None
+        self.corr_reducer = None
+
+        # weak reference to the fitted matrix: the pipeline is reused for
+        # this matrix object only, without keeping it in memory
+        self._fitted_matrix = None
+
+    def fit(self, matrix, survival=None, landmark_groups=None):
+        """ """
+        self.fit_transform(matrix, survival, landmark_groups)
+
+        return self
+
+    def fit_transform(self, matrix, survival=None, landmark_groups=None,
+                      matrix_rows=None):
+        """
+        survival: survival of the reference samples, used by the survival
+                  landmarks of the correlation reduction
+        landmark_groups: landmarks of a correlation reduction fitted on
+                         the same samples
+        matrix_rows: matrix already normalized with the row-wise steps
+                     (see transform_rows). Only the remaining steps are
+                     applied to it
+        """
+        self._fitted_matrix = weakref.ref(matrix)
+
+        if matrix_rows is not None:
+            return self._apply(matrix_rows, True, True, survival,
+                               landmark_groups, rows_normalized=True)
+
+        return self._apply(matrix, True, True, survival, landmark_groups)
+
+    def transform(self, matrix, reference=False, rows_normalized=False):
+        """
+        reference: the matrix is a reference matrix (LOG_REF_MATRIX is
+                   used instead of LOG_TEST_MATRIX)
+        rows_normalized: the matrix is already normalized with the
+                         row-wise steps (see transform_rows)
+        """
+        return self._apply(matrix, False, reference,
+                           rows_normalized=rows_normalized)
+
+    def row_wise_steps(self):
+        """
+        return the leading normalization steps computed independently for
+        each sample, before any step using the features or the other
+        samples of the matrix. Their results do not depend on the samples
+        of the reference, so they can be computed once for all the samples
+        (see transform_rows). Empty if no such scaling step is used
+        """
+        norm = self.normalization
+
+        if norm['NB_FEATURES_TO_KEEP'] or norm['CUSTOM'] or \
+           norm['LOG_REF_MATRIX'] or norm['LOG_TEST_MATRIX']:
+            return []
+
+        steps = []
+
+        for step in _SCALING_STEPS:
+            if step in _COLUMN_WISE_STEPS:
+                if norm[step]:
+                    break
+            elif norm[step]:
+                steps.append(step)
+
+        return steps
+
+    def transform_rows(self, matrix):
+        """
+        apply only the row-wise steps (see row_wise_steps) to a matrix of
+        any samples. The remaining steps are done with the rows_normalized
+        option of fit_transform and transform
+        """
+        steps = self.row_wise_steps()
+        input_matrix = matrix
+
+        matrix = to_dense(matrix)
+
+        if 'TRAIN_MIN_MAX' in steps:
+            matrix = MinMaxScaler().fit_transform(matrix.T).T
+
+        if 'TRAIN_NORM_SCALE' in steps:
+            matrix = Normalizer().fit_transform(matrix)
+
+        if 'TRAIN_RANK_NORM' in steps:
+            matrix = RankNorm(inplace=matrix is not input_matrix).fit_transform(
+                matrix)
+
+        return matrix
+
+    def is_fitted_on(self, matrix, normalization=None):
+        """
+        test if the pipeline was fitted on the matrix object matrix (and
+        with the same normalization steps). The matrices are compared by
+        identity: a matrix replaced in the dataset is not reused
+        """
+        if self._fitted_matrix is None or self._fitted_matrix() is not matrix:
+            return False
+
+        if normalization is not None and \
+           _used_steps(normalization) != _used_steps(self.normalization):
+            return False
+
+        return True
+
+    def __getstate__(self):
+        """
+        the weak reference to the fitted matrix is not saved
+        """
+        state = self.__dict__.copy()
+        state['_fitted_matrix'] = None
+
+        return state
+
+    def _apply(self, matrix, fit, reference,
+               survival=None, landmark_groups=None, rows_normalized=False):
+        """ """
+        norm = self.normalization
+        input_matrix = matrix
+
+        if rows_normalized:
+            # the row-wise steps were already computed
+            norm = defaultdict(bool, norm)
+
+            for step in self.row_wise_steps():
+                norm[step] = False
+
+        if not self.training and (
+                (reference and norm['LOG_REF_MATRIX']) or
+                (not reference and norm['LOG_TEST_MATRIX'])):
+            matrix = log2_1p(matrix)
+
+        if norm['CUSTOM'] and not self.training:
+            matrix = self._custom_normalize(to_dense(matrix), input_matrix, fit)
+
+        if norm['NB_FEATURES_TO_KEEP']:
+            if fit:
+                self.variance_reducer.nb_features = norm['NB_FEATURES_TO_KEEP']
+                matrix = self.variance_reducer.fit_transform(matrix)
+            else:
+                matrix = self.variance_reducer.transform(matrix)
+
+        matrix = to_dense(matrix)
+
+        if norm['CUSTOM'] and self.training:
+            matrix = self._custom_normalize(matrix, input_matrix, fit)
+
+        if norm['TRAIN_MIN_MAX']:
+            matrix = MinMaxScaler().fit_transform(matrix.T).T
+
+        if norm['TRAIN_MAD_SCALE']:
+            matrix = MadScaler(inplace=matrix is not input_matrix).fit_transform(
+                matrix.T).T
+
+        if norm['TRAIN_ROBUST_SCALE'] or norm['TRAIN_ROBUST_SCALE_TWO_WAY']:
+            if fit:
+                self.robust_scaler = RobustScaler()
+                matrix = self.robust_scaler.fit_transform(matrix)
+            else:
+                matrix = self.robust_scaler.transform(matrix)
+
+        if norm['TRAIN_NORM_SCALE']:
+            matrix = Normalizer().fit_transform(matrix)
+
+        if norm['TRAIN_QUANTILE_TRANSFORM']:
+            matrix = quantile_transform(matrix, **QUANTILE_OPTION)
+
+        if norm['TRAIN_RANK_NORM']:
+            matrix = RankNorm(inplace=matrix is not input_matrix).fit_transform(
+                matrix)
+
+        if norm['TRAIN_CORR_REDUCTION']:
+            if fit:
+                args = norm['TRAIN_CORR_REDUCTION']
+
+                if args == True:
+                    args = {}
+
+                self.corr_reducer = CorrelationReducer(**args)
+                matrix = self.corr_reducer.fit_transform(
+                    matrix, survival=survival, landmark_groups=landmark_groups)
+            else:
+                matrix = self.corr_reducer.transform(matrix)
+
+            if norm['TRAIN_CORR_RANK_NORM']:
+                matrix = RankNorm(inplace=True).fit_transform(matrix)
+
+            if (self.training and norm['TRAIN_CORR_QUANTILE_NORM']) or \
+               (not self.training and norm['TRAIN_CORR_QUANTILE_TRANSFORM']):
+                matrix = quantile_transform(matrix, **QUANTILE_OPTION)
+
+            if norm['TRAIN_CORR_NORM_SCALE']:
+                matrix = Normalizer().fit_transform(matrix)
+
+        # the input matrix is never modified
+        if matrix is input_matrix:
+            matrix = np.array(matrix, dtype=self.dtype, subok=True)
+
+        return np.nan_to_num(matrix, copy=False).astype(self.dtype, copy=False)
+
+    def _custom_normalize(self, matrix, input_matrix, fit):
+        """ """
+        # the custom normalization might modify its input
+        if matrix is input_matrix:
+            matrix = matrix.copy()
+
+        if fit:
+            self.custom_norm = self.normalization['CUSTOM']()
+            assert(hasattr(self.custom_norm, 'fit') and hasattr(
+                self.custom_norm, 'fit_transform'))
+            return self.custom_norm.fit_transform(matrix)
+
+        return self.custom_norm.transform(matrix)
+
+
+# order of the scaling steps of NormalizationPipeline until the correlation
+# reduction, and the steps among them fitted on the columns of the matrix
+_SCALING_STEPS = ['TRAIN_MIN_MAX',
+                  'TRAIN_MAD_SCALE',
+                  'TRAIN_ROBUST_SCALE',
+                  'TRAIN_ROBUST_SCALE_TWO_WAY',
+                  'TRAIN_NORM_SCALE',
+                  'TRAIN_QUANTILE_TRANSFORM',
+                  'TRAIN_RANK_NORM',
+                  'TRAIN_CORR_REDUCTION']
+
+_COLUMN_WISE_STEPS = {'TRAIN_MAD_SCALE',
+                      'TRAIN_ROBUST_SCALE',
+                      'TRAIN_ROBUST_SCALE_TWO_WAY',
+                      'TRAIN_QUANTILE_TRANSFORM',
+                      'TRAIN_CORR_REDUCTION'}
+
+# steps of LoadData.transform_matrices always read in the normalization of
+# the dataset, even when another normalization is given
+_DATASET_STEPS = ['CUSTOM',
+                  'TRAIN_QUANTILE_TRANSFORM',
+                  'TRAIN_CORR_QUANTILE_TRANSFORM',
+                  'TRAIN_CORR_NORM_SCALE']
+
+
+def _same_step_order(normalization):
+    """
+    test if the training and the test steps of a NormalizationPipeline
+    give the same normalization: a pipeline fitted on the training matrix
+    can then transform the test matrices
+    """
+    norm = defaultdict(bool, normalization)
+
+    return not (norm['LOG_REF_MATRIX'] or norm['LOG_TEST_MATRIX'] or
+                (norm['CUSTOM'] and norm['NB_FEATURES_TO_KEEP']) or
+                (norm['TRAIN_CORR_REDUCTION'] and (
+                    norm['TRAIN_CORR_QUANTILE_NORM'] or
+                    norm['TRAIN_CORR_QUANTILE_TRANSFORM'])))
+
+
+def _used_steps(normalization):
+    """
+    return the normalization steps used by a normalization dict
+    """
+    return {key: value for key, value in normalization.items() if value}
+
+
+
 class LoadData():
     """
     """
@@ -75,6 +382,12 @@ class LoadData():
             normalization=NORMALIZATION,
             survival_flag=SURVIVAL_FLAG,
             subset_training_with_meta={},
+            path_cache=PATH_CACHE,
+            nb_features_to_load=NB_FEATURES_TO_LOAD,
+            nb_threads_loading=NB_THREADS_LOADING,
+            dtype=DTYPE,
+            sparse_omics=SPARSE_OMICS,
+            _shared_dataset=None,
             _autoencoder_parameters={},
             verbose=True,
     ):
@@ -93,11 +406,22 @@ class LoadData():
         :tsv_test: str    name of the file containing the test dataset
         :data_type_test: str    name of the data type of the test set
                                 must match a key existing in training_tsv
+        :path_cache: str    folder used to cache the parsed matrices (None: no cache)
+        :nb_features_to_load: int    number of features with the highest variance
+                                     loaded for each training matrix (0: all)
+        :nb_threads_loading: int    number of input matrices parsed in parallel
+        :dtype: str    floating point type of the matrices (float64 or float32)
+        :sparse_omics: list    omics loaded as sparse matrices
         """
 
         self.verbose = verbose
         self.do_stack_multi_omic = stack_multi_omic
         self.path_data = path_data
+        self.path_cache = path_cache
+        self.nb_features_to_load = nb_features_to_load
+        self.nb_threads_loading = nb_threads_loading
+        self.dtype = np.dtype(dtype)
+        self.sparse_omics = sparse_omics
         self.survival_tsv = survival_tsv
         self.metadata_tsv = metadata_tsv
         self.training_tsv = training_tsv
@@ -147,6 +471,8 @@ class LoadData():
         self.metadata_mat_cv = None
         self.metadata_mat_test = None
         self.metadata_mat = None
+        # encoding of the metadata fitted on the training samples
+        self.metadata_encoder = None
 
         self.survival_test = None
         self.sample_ids_test = None
@@ -156,12 +482,16 @@ class LoadData():
 
         self.do_feature_reduction = None
 
-        self.normalizer = Normalizer()
-        self.mad_scaler = MadScaler()
-        self.robust_scaler = RobustScaler()
-        self.min_max_scaler = MinMaxScaler()
-        self.dim_reducer = CorrelationReducer()
         self.variance_reducer = VarianceReducer()
+        # normalization pipelines fitted on the training matrices, per omic
+        self.normalization_pipeline_array = {}
+        # loaded matrices normalized once with the row-wise steps of the
+        # normalization, shared by the instances using this dataset
+        self.matrix_row_norm_array = {}
+        self._row_norm_index = None
+
+        self._shared_dataset = _shared_dataset
+        self._shared_loaded = False
 
         self._autoencoder_parameters = _autoencoder_parameters
         self.normalization = defaultdict(bool, normalization)
@@ -192,13 +522,11 @@ class LoadData():
         if not features:
             return
 
-        features['STACKED'] = [feat for key in features
-                               for feat in features[key]]
+        features['STACKED'] = FeatureIndex.concatenate(features.values())
         for key in list(features.keys()):
             features.pop(key) if key != 'STACKED' else True
 
-        self.feature_ref_index['STACKED'] = {feature: pos for pos, feature
-                                             in enumerate(features['STACKED'])}
+        self.feature_ref_index['STACKED'] = features['STACKED']
 
     def load_matrix_test_fold(self):
         """ """
@@ -206,16 +534,24 @@ class LoadData():
             return
 
         for key in self.matrix_array:
+            pipeline = self._get_normalization_pipeline(
+                key, self.matrix_array[key], self.normalization)
 
-            matrix_test = self.matrix_cv_array[key].copy()
-            matrix_ref = self.matrix_array[key].copy()
+            matrix_rows = self._get_matrix_rows(key, fold=1)
 
-            matrix_ref, matrix_test = self.transform_matrices(
-                matrix_ref, matrix_test, key,
-            )
+            if pipeline is not None and matrix_rows is not None:
+                matrix_test = pipeline.transform(matrix_rows,
+                                                 rows_normalized=True)
+            elif pipeline is not None:
+                # the test fold is normalized with the training pipeline
+                matrix_test = pipeline.transform(self.matrix_cv_array[key])
+            else:
+                matrix_ref, matrix_test = self.transform_matrices(
+                    self.matrix_array[key], self.matrix_cv_array[key], key,
+                )
 
-            self.matrix_cv_unormalized_array[key] = \
-                self.matrix_cv_array[key].copy()
+            # the normalization does not modify the fold matrix
+            self.matrix_cv_unormalized_array[key] = self.matrix_cv_array[key]
             self.matrix_cv_array[key] = matrix_test
 
         self._stack_multiomics(self.matrix_cv_array)
@@ -228,44 +564,45 @@ class LoadData():
         else:
             self.normalization_test = self.normalization
 
-        for key in self.test_tsv:
-            sample_ids, feature_ids, matrix = load_data_from_tsv(
-                f_name=self.test_tsv[key],
-                key=key,
-                path_data=self.path_data)
+        loaded_array = self._load_matrices([
+            {'f_name': self.test_tsv[key],
+             'key': key,
+             'path_data': self.path_data,
+             'path_cache': self.path_cache,
+             'f_type': self.dtype,
+             'sparse': key in self.sparse_omics}
+            for key in self.test_tsv])
+
+        for key, loaded in zip(self.test_tsv, loaded_array):
+            sample_ids, feature_ids, matrix = loaded
 
             feature_ids_ref = self.feature_array[key]
-            matrix_ref = self.matrix_array[key].copy()
 
-            common_features = set(feature_ids).intersection(feature_ids_ref)
+            # position of the reference features in the test matrix
+            feature_index = FeatureIndex(feature_ids).get_indexer(feature_ids_ref)
+            is_common = feature_index != -1
+            nb_missing = len(feature_index) - is_common.sum()
 
             if self.verbose:
-                print('nb common features for the test set:{0}'.format(len(common_features)))
-
-            feature_ids_dict = {feat: i for i,feat in enumerate(feature_ids)}
-            feature_ids_ref_dict = {feat: i for i,feat in enumerate(feature_ids_ref)}
-
-            if len(common_features) < len(feature_ids_ref) and self.fill_unkown_feature_with_0:
-                missing_features = set(feature_ids_ref).difference(common_features)
+                print('nb common features for the test set:{0}'.format(is_common.sum()))
 
+            if nb_missing and self.fill_unkown_feature_with_0:
                 if self.verbose:
                     print('filling {0} with 0 for {1} additional features'.format(
-                        key, len(missing_features)))
-
-                matrix = hstack([matrix, np.zeros((len(sample_ids), len(missing_features)))])
-
-                for i, feat in enumerate(missing_features):
-                    feature_ids_dict[feat] = i + len(feature_ids)
+                        key, nb_missing))
 
+                # the missing features (index -1) are filled with 0
+                feature_ref_index = np.arange(len(feature_ids_ref))
                 common_features = feature_ids_ref
+            else:
+                feature_ref_index = np.flatnonzero(is_common)
+                feature_index = feature_index[is_common]
+                common_features = feature_ids_ref.subset(feature_ref_index)
 
-            feature_index = [feature_ids_dict[feature] for feature in common_features]
-            feature_ref_index = [feature_ids_ref_dict[feature] for feature in common_features]
-
-            matrix_test = np.nan_to_num(matrix.T[feature_index].T)
-            matrix_ref = np.nan_to_num(matrix_ref.T[feature_ref_index].T)
+            matrix_test = select_columns(matrix, feature_index)
+            matrix_ref = select_columns(self.matrix_array[key], feature_ref_index)
 
-            self.feature_test_array[key] = list(common_features)
+            self.feature_test_array[key] = common_features
 
             if not isinstance(self.sample_ids_test, type(None)):
                 try:
@@ -283,7 +620,7 @@ class LoadData():
             self.matrix_test_array[key] = matrix_test
             self.matrix_ref_array[key] = matrix_ref
             self.feature_ref_array[key] = self.feature_test_array[key]
-            self.feature_ref_index[key] = {feat: pos for pos, feat in enumerate(common_features)}
+            self.feature_ref_index[key] = common_features
 
             self._define_ref_features(key, normalization)
 
@@ -314,9 +651,8 @@ class LoadData():
                 "Error! samples from the tes dataset not present in metadata: {0}".format(
                     list(diff)[:5])))
 
-        self.metadata_frame_test = frame.T[self.sample_ids_test].T
-        self.metadata_mat_test = convert_metadata_frame_to_matrix(
-            self.metadata_frame_test)
+        self.metadata_frame_test = frame.loc[self.sample_ids_test]
+        self.metadata_mat_test = self._encode_metadata(self.metadata_frame_test)
 
     def load_meta_data(self, sep="\t"):
         """
@@ -331,17 +667,28 @@ class LoadData():
 
         frame = pd.read_csv(self.metadata_tsv, sep=sep, index_col=0)
 
+        ## ALL ##
+        diff = set(self.sample_ids).difference(frame.index)
+
+        if diff:
+            raise(Exception("Error! sample not present in metadata: {0}".format(
+                list(diff)[:5])))
+
+        # the encoding is fitted once on the training metadata
+        self.metadata_frame = frame.loc[self.sample_ids]
+        self.metadata_encoder = MetadataEncoder().fit(self.metadata_frame)
+        self.metadata_mat = self.metadata_encoder.transform(self.metadata_frame)
+
         ## FULL ##
-        if self.sample_ids_full:
+        if len(self.sample_ids_full):
             diff = set(self.sample_ids_full).difference(frame.index)
 
             if diff:
                 raise(Exception("Error! sample not present in metadata: {0}".format(
                     list(diff)[:5])))
 
-            self.metadata_frame_full = frame.T[self.sample_ids_full].T
-
-            self.metadata_mat_full = convert_metadata_frame_to_matrix(
+            self.metadata_frame_full = frame.loc[self.sample_ids_full]
+            self.metadata_mat_full = self.metadata_encoder.transform(
                 self.metadata_frame_full)
 
         ## CV ##
@@ -352,20 +699,19 @@ class LoadData():
                 raise(Exception("Error! sample not present in metadata: {0}".format(
                     list(diff)[:5])))
 
-            self.metadata_frame_cv = frame.T[self.sample_ids_cv].T
-            self.metadata_mat_cv = convert_metadata_frame_to_matrix(
+            self.metadata_frame_cv = frame.loc[self.sample_ids_cv]
+            self.metadata_mat_cv = self.metadata_encoder.transform(
                 self.metadata_frame_cv)
 
-        ## ALL ##
-        diff = set(self.sample_ids).difference(frame.index)
-
-        if diff:
-            raise(Exception("Error! sample not present in metadata: {0}".format(
-                list(diff)[:5])))
+    def _encode_metadata(self, frame):
+        """
+        encode a metadata frame with the encoding fitted on the training
+        metadata (fitted on frame if no training metadata is loaded)
+        """
+        if self.metadata_encoder is None:
+            self.metadata_encoder = MetadataEncoder().fit(frame)
 
-        self.metadata_frame = frame.T[self.sample_ids].T
-        self.metadata_mat = convert_metadata_frame_to_matrix(
-            self.metadata_frame)
+        return self.metadata_encoder.transform(frame)
 
     def subset_training_sets(self, change_cv=False):
         """ """
@@ -397,6 +743,8 @@ class LoadData():
 
                 samples_subset.update(index)
 
+        samples_subset = SampleIndex(self.sample_ids).intersection(
+            samples_subset).tolist()
         new_index = translate_index(self.sample_ids, samples_subset)
 
         for key in self.matrix_train_array:
@@ -408,13 +756,16 @@ class LoadData():
 
         self.survival = self.survival[new_index]
 
-        self.metadata_frame = self.metadata_frame.T[list(samples_subset)].T
-        self.metadata_mat = convert_metadata_frame_to_matrix(
-            self.metadata_frame)
+        # the subset defines the training metadata of the encoding
+        self.metadata_frame = self.metadata_frame.loc[samples_subset]
+        self.metadata_encoder = MetadataEncoder().fit(self.metadata_frame)
+        self.metadata_mat = self.metadata_encoder.transform(self.metadata_frame)
 
-        self.sample_ids = list(samples_subset)
+        self.sample_ids = samples_subset
 
         if self.survival_cv is not None:
+            samples_subset_cv = SampleIndex(self.sample_ids_cv).intersection(
+                samples_subset_cv).tolist()
             new_index_cv = translate_index(self.sample_ids_cv,
                                            samples_subset_cv)
             for key in self.matrix_cv_array:
@@ -424,12 +775,11 @@ class LoadData():
                     self.matrix_cv_unormalized_array[key] = self.matrix_cv_unormalized_array[
                         key][new_index_cv]
 
-            self.metadata_frame_cv = self.metadata_frame_cv.T[
-                list(samples_subset_cv)].T
-            self.metadata_mat_cv = convert_metadata_frame_to_matrix(
+            self.metadata_frame_cv = self.metadata_frame_cv.loc[samples_subset_cv]
+            self.metadata_mat_cv = self.metadata_encoder.transform(
                 self.metadata_frame_cv)
 
-            self.sample_ids_cv = list(samples_subset_cv)
+            self.sample_ids_cv = samples_subset_cv
             self.survival_cv = self.survival_cv[new_index_cv]
 
     def load_new_test_dataset(self, tsv_dict,
@@ -475,15 +825,97 @@ class LoadData():
         features_train = self.feature_train_array[key]
         matrix_train = self.matrix_ref_array[key]
 
-        test_dict = {feat: pos for pos, feat in enumerate(features_test)}
-        train_dict = {feat: pos for pos, feat in enumerate(features_train)}
-
-        index = [train_dict[feat] for feat in features_test]
+        index = features_train.get_indexer(features_test)
 
         self.feature_ref_array[key] = self.feature_test_array[key]
-        self.matrix_ref_array[key] = np.nan_to_num(matrix_train.T[index].T)
+        self.matrix_ref_array[key] = select_columns(matrix_train, index)
+
+        self.feature_ref_index[key] = features_test
+
+    def load_training_samples(self):
+        """
+        load the training matrices, the survival and the metadata
+        before any fold split. When a shared dataset is defined, its
+        arrays are referenced instead of parsing the input files again
+        """
+        shared = self._shared_dataset
+
+        if shared is None:
+            self.load_array()
+            self.load_survival()
+            self.load_meta_data()
+            self.subset_training_sets()
+            return
+
+        if not isinstance(shared, LoadData):
+            # reference to a shared dataset put in the ray object store:
+            # its numpy arrays are read without copy from the store
+            import ray
+            shared = ray.get(shared)
+
+        shared.load_shared_training_samples()
+
+        # the split and normalization steps reassign these attributes
+        # instead of modifying them inplace: the shared arrays are not altered
+        self.sample_ids = shared.sample_ids
+        self.feature_array = dict(shared.feature_array)
+        self.matrix_array = dict(shared.matrix_array)
+        self.survival = shared.survival
+        self.metadata_frame = shared.metadata_frame
+        self.metadata_mat = shared.metadata_mat
+        self.metadata_encoder = shared.metadata_encoder
+
+        if _used_steps(shared.normalization) == _used_steps(self.normalization):
+            self.matrix_row_norm_array = shared.matrix_row_norm_array
+
+    def load_shared_training_samples(self):
+        """
+        load only once the training samples of a dataset shared
+        by several instances
+        """
+        if self._shared_loaded:
+            return
+
+        self.load_training_samples()
+        self.normalize_rows()
+        self._shared_loaded = True
+
+    def normalize_rows(self):
+        """
+        compute once for all the loaded samples the leading row-wise steps
+        of the normalization. They do not depend on the fold split, so the
+        instances only compute the remaining steps on their training and
+        test folds
+        """
+        for key in self.matrix_array:
+            pipeline = NormalizationPipeline(self.normalization, dtype=self.dtype)
+
+            if not pipeline.row_wise_steps():
+                continue
+
+            self.matrix_row_norm_array[key] = pipeline.transform_rows(
+                self.matrix_array[key])
+
+    def _get_matrix_rows(self, key, fold=0):
+        """
+        return the rows of the training (fold=0) or of the test (fold=1)
+        samples of the matrix normalized with normalize_rows (None if
+        this matrix is not available)
+        """
+        matrix = self.matrix_row_norm_array.get(key)
 
-        self.feature_ref_index[key] = test_dict
+        if matrix is None:
+            return None
+
+        if self._row_norm_index is not None:
+            matrix = matrix[self._row_norm_index[fold]]
+        elif fold:
+            return None
+
+        if fold == 0 and len(matrix) != len(self.sample_ids):
+            return None
+
+        return matrix
 
     def load_array(self):
         """ """
@@ -495,26 +927,30 @@ class LoadData():
         self.feature_array = {}
         self.matrix_array = {}
 
+        loaded_array = self._load_matrices([
+            {'f_name': self.training_tsv[data],
+             'key': data,
+             'path_data': self.path_data,
+             'path_cache': self.path_cache,
+             'nb_features': self.nb_features_to_load,
+             'f_type': self.dtype,
+             'sparse': data in self.sparse_omics}
+            for data in self.data_type])
+
         data = list(self.data_type)[0]
         f_name = self.training_tsv[data]
 
-        self.sample_ids, feature_ids, matrix = load_data_from_tsv(
-            f_name=f_name,
-            key=data,
-            path_data=self.path_data)
+        self.sample_ids, feature_ids, matrix = loaded_array[0]
 
         if self.verbose:
             print('{0} loaded of dim:{1}'.format(f_name, matrix.shape))
 
-        self.feature_array[data] = feature_ids
+        self.feature_array[data] = FeatureIndex(feature_ids)
         self.matrix_array[data] = matrix
 
-        for data in self.data_type[1:]:
+        for data, loaded in zip(self.data_type[1:], loaded_array[1:]):
             f_name = self.training_tsv[data]
-            sample_ids, feature_ids, matrix = load_data_from_tsv(
-                f_name=f_name,
-                key=data,
-                path_data=self.path_data)
+            sample_ids, feature_ids, matrix = loaded
 
             if self.sample_ids != sample_ids:
                 print('#### Different patient ID for {0} matrix ####'.format(data))
@@ -528,7 +964,7 @@ class LoadData():
                 for data2 in self.matrix_array:
                     self.matrix_array[data2] = self.matrix_array[data2][index1]
 
-            self.feature_array[data] = feature_ids
+            self.feature_array[data] = FeatureIndex(feature_ids)
             self.matrix_array[data] = matrix
 
             if self.verbose:
@@ -539,6 +975,24 @@ class LoadData():
         if self.verbose:
             print('data loaded in {0} s'.format(time() - t))
 
+    def _load_matrices(self, kwargs_array):
+        """
+        parse the input matrices defined by the load_data_from_tsv
+        arguments of kwargs_array, in parallel if nb_threads_loading > 1
+        """
+        nb_threads = min(self.nb_threads_loading, len(kwargs_array))
+
+        if nb_threads < 2 or current_process().daemon:
+            return [load_data_from_tsv(**kwargs) for kwargs in kwargs_array]
+
+        pool = Pool(nb_threads)
+
+        try:
+            return pool.map(_process_parallel_load_data, kwargs_array)
+        finally:
+            pool.close()
+            pool.join()
+
     def _discard_training_samples(self):
         """
         """
@@ -557,10 +1011,11 @@ class LoadData():
 
     def reorder_matrix_array(self, new_sample_ids):
         """
+        reorder the training matrices and survival according to
+        new_sample_ids, which can be a subset of the loaded samples
+        (when fewer omics are loaded, their sample intersection is larger)
         """
-        assert(set(new_sample_ids) == set(self.sample_ids))
-        index_dict = {sample: pos for pos, sample in enumerate(self.sample_ids)}
-        index = [index_dict[sample] for sample in new_sample_ids]
+        index = SampleIndex(self.sample_ids).get_indexer(new_sample_ids)
 
         self.sample_ids = np.asarray(self.sample_ids)[index].tolist()
 
@@ -569,6 +1024,11 @@ class LoadData():
 
         self.survival = self.survival[index]
 
+        if self.metadata_frame is not None:
+            self.metadata_frame = self.metadata_frame.iloc[index]
+            self.metadata_mat = self.metadata_mat.iloc[index].reset_index(
+                drop=True)
+
     def create_a_cv_split(self):
         """ """
         if not self.cross_validation_instance:
@@ -594,20 +1054,20 @@ class LoadData():
             self.matrix_cv_array[key] = self.matrix_array[key][test]
             self.matrix_array[key] = self.matrix_array[key][train]
 
-        self.survival_cv = self.survival.copy()[test]
+        self._row_norm_index = (train, test)
+
+        self.survival_cv = self.survival[test]
         self.survival = self.survival[train]
 
         if self.metadata_frame is not None:
             # cv
-            self.metadata_frame_cv = self.metadata_frame.T[
-                list(np.asarray(self.sample_ids)[test])].T
-            self.metadata_mat_cv = self.metadata_mat.T[test].T
-            self.metadata_mat_cv.index = range(len(test))
+            self.metadata_frame_cv = self.metadata_frame.iloc[test]
+            self.metadata_mat_cv = self.metadata_mat.iloc[test].reset_index(
+                drop=True)
             # train
-            self.metadata_frame = self.metadata_frame.T[
-                list(np.asarray(self.sample_ids)[train])].T
-            self.metadata_mat = self.metadata_mat.T[train].T
-            self.metadata_mat.index = range(len(train))
+            self.metadata_frame = self.metadata_frame.iloc[train]
+            self.metadata_mat = self.metadata_mat.iloc[train].reset_index(
+                drop=True)
 
         self.sample_ids_cv = np.asarray(self.sample_ids)[test].tolist()
         self.sample_ids = np.asarray(self.sample_ids)[train].tolist()
@@ -629,12 +1089,12 @@ class LoadData():
         if not self._cv_loaded:
             self.load_matrix_test_fold()
 
-        for key in self.matrix_train_array:
-            self.matrix_full_array[key] = vstack([self.matrix_train_array[key],
-                                                  self.matrix_cv_array[key]])
+        # the full matrices are stacked only when they are used
+        self.matrix_full_array = StackedMatrices(self.matrix_train_array,
+                                                 self.matrix_cv_array)
 
         self.sample_ids_full = self.sample_ids[:] + self.sample_ids_cv[:]
-        self.survival_full = vstack([self.survival, self.survival_cv])
+        self.survival_full = Survival.concatenate([self.survival, self.survival_cv])
 
         if self.metadata_frame is not None:
             self.metadata_frame_full = pd.concat([self.metadata_frame,
@@ -662,7 +1122,7 @@ class LoadData():
             retained_samples.append(ids)
             matrix.append(survival[sample])
 
-        self.survival = np.asmatrix(matrix)
+        self.survival = Survival.from_records(matrix)
 
         if sample_removed:
             for key in self.matrix_array:
@@ -676,10 +1136,7 @@ class LoadData():
     def load_survival_test(self, survival_flag=None):
         """ """
         if self.survival_tsv_test is None:
-            self.survival_test = np.empty(
-                shape=(len(self.sample_ids_test), 2))
-
-            self.survival_test[:] = np.nan
+            self.survival_test = Survival.unknown(len(self.sample_ids_test))
 
             return
 
@@ -702,7 +1159,7 @@ class LoadData():
             retained_samples.append(ids)
             matrix.append(survival[sample])
 
-        self.survival_test = np.asmatrix(matrix)
+        self.survival_test = Survival.from_records(matrix)
 
         if sample_removed:
             for key in self.matrix_test_array:
@@ -715,33 +1172,44 @@ class LoadData():
 
     def _define_train_features(self, key):
         """ """
-        self.feature_train_array[key] = self.feature_array[key][:]
+        self.feature_train_array[key] = self.feature_array[key]
 
         if self.normalization['TRAIN_CORR_REDUCTION']:
-            self.feature_train_array[key] = ['{0}_{1}'.format(key, sample)
-                                             for sample in self.sample_ids]
+            self.feature_train_array[key] = self._sample_feature_index(key)
         elif self.normalization['NB_FEATURES_TO_KEEP']:
-            self.feature_train_array[key] = np.array(self.feature_train_array[key])[
-                self.variance_reducer.index_to_keep].tolist()
+            self.feature_train_array[key] = self.feature_train_array[key].subset(
+                self.variance_reducer.index_to_keep)
 
         self.feature_ref_array[key] = self.feature_train_array[key]
 
-        self.feature_train_index[key] = {key: id for id, key in enumerate(
-            self.feature_train_array[key])}
+        self.feature_train_index[key] = self.feature_train_array[key]
         self.feature_ref_index[key] = self.feature_train_index[key]
 
+    def _sample_feature_index(self, key):
+        """
+        FeatureIndex of the features created by the correlation reduction,
+        one per training sample or per landmark
+        """
+        names = self.sample_ids
+
+        pipeline = self.normalization_pipeline_array.get(key)
+
+        if pipeline is not None and pipeline.corr_reducer is not None:
+            names = pipeline.corr_reducer.get_landmark_names(names)
+
+        return FeatureIndex(['{0}_{1}'.format(key, name) for name in names])
+
     def _define_test_features(self, key, normalization=None):
         """ """
         if normalization is None:
             normalization = self.normalization
 
         if normalization['TRAIN_CORR_REDUCTION']:
-            self.feature_test_array[key] = ['{0}_{1}'.format(key, sample)
-                                             for sample in self.sample_ids]
+            self.feature_test_array[key] = self._sample_feature_index(key)
 
         elif normalization['NB_FEATURES_TO_KEEP']:
-            self.feature_test_array[key] = np.array(self.feature_test_array[key])[
-                self.variance_reducer.index_to_keep].tolist()
+            self.feature_test_array[key] = self.feature_test_array[key].subset(
+                self.variance_reducer.index_to_keep)
 
     def _define_ref_features(self, key, normalization=None):
         """ """
@@ -749,21 +1217,22 @@ class LoadData():
             normalization = self.normalization
 
         if normalization['TRAIN_CORR_REDUCTION']:
-            self.feature_ref_array[key] = ['{0}_{1}'.format(key, sample)
-                                           for sample in self.sample_ids]
-
-            self.feature_ref_index[key] = {feat:pos for pos, feat in
-                                           enumerate(self.feature_ref_array[key])}
+            self.feature_ref_array[key] = self.feature_test_array[key]
+            self.feature_ref_index[key] = self.feature_ref_array[key]
 
         elif normalization['NB_FEATURES_TO_KEEP']:
-            self.feature_ref_index[key] = {feat: pos for pos, feat in
-                                           enumerate(self.feature_ref_array[key])}
+            self.feature_ref_index[key] = self.feature_ref_array[key]
 
     def normalize_training_array(self):
         """ """
         for key in self.matrix_array:
-            matrix = self.matrix_array[key].copy()
-            matrix = self._normalize(matrix, key)
+            matrix_rows = self._get_matrix_rows(key)
+
+            if matrix_rows is not None:
+                matrix = self._normalize(self.matrix_array[key], key,
+                                         matrix_rows=matrix_rows)
+            else:
+                matrix = self._normalize(self.matrix_array[key], key)
 
             self.matrix_train_array[key] = matrix
             self.matrix_ref_array[key] = self.matrix_train_array[key]
@@ -779,156 +1248,96 @@ class LoadData():
         if not self.do_stack_multi_omic:
             return
 
-        index = {'STACKED':{}}
-        count = 0
-
-        for key in self.feature_train_index:
-            for feature in self.feature_train_index[key]:
-                index['STACKED'][feature] = count + self.feature_train_index[key][feature]
-
-            count += len(self.feature_train_index[key])
+        index = {'STACKED': FeatureIndex.concatenate(
+            self.feature_train_index.values())}
 
         self.feature_train_index = index
         self.feature_ref_index = self.feature_train_index
 
-    def _normalize(self, matrix, key):
+    def _normalize(self, matrix, key, matrix_rows=None):
         """ """
         if self.verbose:
             print('normalizing for {0}...'.format(key))
 
-        if self.normalization['NB_FEATURES_TO_KEEP']:
-            self.variance_reducer.nb_features = self.normalization[
-                'NB_FEATURES_TO_KEEP']
-            matrix = self.variance_reducer.fit_transform(matrix)
+        pipeline = NormalizationPipeline(self.normalization, dtype=self.dtype,
+                                         training=True)
+        matrix = pipeline.fit_transform(matrix, survival=self.survival,
+                                        matrix_rows=matrix_rows)
 
-        if self.normalization['CUSTOM']:
-            custom_norm = self.normalization['CUSTOM']()
-            assert(hasattr(custom_norm, 'fit') and hasattr(
-                custom_norm, 'fit_transform'))
-            matrix = custom_norm.fit_transform(matrix)
-
-        if self.normalization['TRAIN_MIN_MAX']:
-            matrix = MinMaxScaler().fit_transform(matrix.T).T
+        self.normalization_pipeline_array[key] = pipeline
+        self.variance_reducer = pipeline.variance_reducer
 
-        if self.normalization['TRAIN_MAD_SCALE']:
-            matrix = self.mad_scaler.fit_transform(matrix.T).T
+        return matrix
 
-        if self.normalization['TRAIN_ROBUST_SCALE'] or\
-           self.normalization['TRAIN_ROBUST_SCALE_TWO_WAY']:
-            matrix = self.robust_scaler.fit_transform(matrix)
-
-        if self.normalization['TRAIN_NORM_SCALE']:
-            matrix = self.normalizer.fit_transform(matrix)
-
-        if self.normalization['TRAIN_QUANTILE_TRANSFORM']:
-            matrix = quantile_transform(matrix, **QUANTILE_OPTION)
+    def _get_normalization_pipeline(self, key, matrix_ref, normalization):
+        """
+        return the pipeline fitted on the training matrix of the omic if
+        matrix_ref is this matrix and if its training steps give the
+        test normalization (None otherwise)
+        """
+        pipeline = self.normalization_pipeline_array.get(key)
 
-        if self.normalization['TRAIN_RANK_NORM']:
-            matrix = RankNorm().fit_transform(
-                matrix)
+        if pipeline is None or not pipeline.is_fitted_on(
+                matrix_ref, normalization):
+            return None
 
-        if self.normalization['TRAIN_CORR_REDUCTION']:
-            args = self.normalization['TRAIN_CORR_REDUCTION']
-            if args == True:
-                args = {}
+        if pipeline.training and not _same_step_order(normalization):
+            return None
 
-            if self.verbose:
-                print('dim reduction for {0}...'.format(key))
+        return pipeline
 
-            reducer = CorrelationReducer(**args)
-            matrix = reducer.fit_transform(
-                matrix)
+    def _get_landmark_groups(self, key, matrix_ref, normalization):
+        """
+        return the landmarks of the correlation reducer fitted on the
+        training matrix of the omic, to keep the same landmarks when the
+        reference has other features
+        """
+        pipeline = self.normalization_pipeline_array.get(key)
 
-            if self.normalization['TRAIN_CORR_RANK_NORM']:
-                matrix = RankNorm().fit_transform(
-                    matrix)
+        if pipeline is None or pipeline.corr_reducer is None:
+            return None
 
-            if self.normalization['TRAIN_CORR_QUANTILE_NORM']:
-                matrix = quantile_transform(matrix, **QUANTILE_OPTION)
+        reducer = pipeline.corr_reducer
 
-            if self.normalization['TRAIN_CORR_NORM_SCALE']:
-                matrix = self.normalizer.fit_transform(matrix)
+        if pipeline.normalization['TRAIN_CORR_REDUCTION'] != \
+           normalization['TRAIN_CORR_REDUCTION'] or \
+           reducer.landmark_groups is None or \
+           len(reducer.landmark_groups) != len(matrix_ref):
+            return None
 
-        return np.nan_to_num(matrix)
+        return reducer.landmark_groups
 
     def transform_matrices(self, matrix_ref, matrix, key, normalization=None):
-        """ """
+        """
+        normalization: normalization of the matrices (self.normalization
+                       if None). The steps of _DATASET_STEPS are still
+                       those of self.normalization
+        """
         if normalization is None:
             normalization = self.normalization
 
-        if self.verbose:
-            print('Scaling/Normalising dataset...')
-
-        if normalization['LOG_REF_MATRIX']:
-            matrix_ref = np.log2(1.0 + matrix_ref)
-
-        if normalization['LOG_TEST_MATRIX']:
-            matrix = np.log2(1.0 +  matrix)
-
-        if self.normalization['CUSTOM']:
-            custom_norm = self.normalization['CUSTOM']()
-            assert(hasattr(custom_norm, 'fit') and hasattr(
-                custom_norm, 'fit_transform'))
-            matrix_ref = custom_norm.fit_transform(matrix_ref)
-            matrix = custom_norm.transform(matrix)
-
-        if normalization['NB_FEATURES_TO_KEEP']:
-            self.variance_reducer.nb_features = normalization[
-                'NB_FEATURES_TO_KEEP']
-            matrix_ref = self.variance_reducer.fit_transform(matrix_ref)
-            matrix = self.variance_reducer.transform(matrix)
-
-        if normalization['TRAIN_MIN_MAX']:
-            matrix_ref = self.min_max_scaler.fit_transform(matrix_ref.T).T
-            matrix = self.min_max_scaler.fit_transform(matrix.T).T
+        normalization = defaultdict(bool, normalization)
 
-        if normalization['TRAIN_MAD_SCALE']:
-            matrix_ref = self.mad_scaler.fit_transform(matrix_ref.T).T
-            matrix = self.mad_scaler.fit_transform(matrix.T).T
+        for step in _DATASET_STEPS:
+            normalization[step] = self.normalization[step]
 
-        if normalization['TRAIN_ROBUST_SCALE']:
-            matrix_ref = self.robust_scaler.fit_transform(matrix_ref)
-            matrix = self.robust_scaler.transform(matrix)
-
-        if normalization['TRAIN_ROBUST_SCALE_TWO_WAY']:
-            matrix_ref = self.robust_scaler.fit_transform(matrix_ref)
-            matrix = self.robust_scaler.transform(matrix)
-
-        if normalization['TRAIN_NORM_SCALE']:
-            matrix_ref = self.normalizer.fit_transform(matrix_ref)
-            matrix = self.normalizer.transform(matrix)
-
-        if self.normalization['TRAIN_QUANTILE_TRANSFORM']:
-            matrix_ref = quantile_transform(matrix_ref, **QUANTILE_OPTION)
-            matrix = quantile_transform(matrix, **QUANTILE_OPTION)
-
-        if normalization['TRAIN_RANK_NORM']:
-            matrix_ref = RankNorm().fit_transform(matrix_ref)
-            matrix = RankNorm().fit_transform(matrix)
-
-        if normalization['TRAIN_CORR_REDUCTION']:
-            args = normalization['TRAIN_CORR_REDUCTION']
-
-            if args == True:
-                args = {}
-
-            reducer = CorrelationReducer(**args)
-            matrix_ref = reducer.fit_transform(matrix_ref)
-            matrix = reducer.transform(matrix)
+        if self.verbose:
+            print('Scaling/Normalising dataset...')
 
-            if normalization['TRAIN_CORR_RANK_NORM']:
-                matrix_ref = RankNorm().fit_transform(matrix_ref)
-                matrix = RankNorm().fit_transform(matrix)
+        pipeline = self._get_normalization_pipeline(key, matrix_ref, normalization)
 
-            if self.normalization['TRAIN_CORR_QUANTILE_TRANSFORM']:
-                matrix_ref = quantile_transform(matrix_ref, **QUANTILE_OPTION)
-                matrix = quantile_transform(matrix, **QUANTILE_OPTION)
+        if pipeline is None:
+            pipeline = NormalizationPipeline(normalization, dtype=self.dtype)
+            matrix_ref = pipeline.fit_transform(
+                matrix_ref, survival=self.survival,
+                landmark_groups=self._get_landmark_groups(
+                    key, matrix_ref, normalization))
+        else:
+            matrix_ref = pipeline.transform(matrix_ref, reference=True)
 
-            if self.normalization['TRAIN_CORR_NORM_SCALE']:
-                matrix_ref = self.normalizer.fit_transform(matrix_ref)
-                matrix = self.normalizer.fit_transform(matrix)
+        self.variance_reducer = pipeline.variance_reducer
 
-        return np.nan_to_num(matrix_ref), np.nan_to_num(matrix)
+        return matrix_ref, pipeline.transform(matrix)
 
     def save_ref_matrix(self, path_folder, project_name):
         """
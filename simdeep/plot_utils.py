@@ -187,12 +187,12 @@ def plot_kernel_plots(
             alpha=0.7
         )
 
-    survival_test = np.nan_to_num(dataset.survival_test)
+    survival_test = dataset.survival_test
 
     labels = [SampleHTML(
         name=dataset.sample_ids_test[i],
         label=test_labels[i],
-        survival=np.asarray(survival_test[i])[0],
+        survival=(np.nan_to_num(survival_test.time[i]), survival_test.event[i]),
         proba=test_labels_proba[i][test_labels[i]]).html
               for i in range(len(test_labels))]
 
@@ -27,6 +27,7 @@ from simdeep.config import CLASSIFICATION_METHOD
 from simdeep.config import CLUSTER_EVAL_METHOD
 from simdeep.config import CLUSTER_METHOD
 from simdeep.config import NB_THREADS_COXPH
+from simdeep.config import CINDEX_NODES_CHUNK_SIZE
 from simdeep.config import NB_SELECTED_FEATURES
 from simdeep.config import LOAD_EXISTING_MODELS
 from simdeep.config import NODES_SELECTION
@@ -38,6 +39,7 @@ from simdeep.config import USE_R_PACKAGES_FOR_SURVIVAL
 
 from simdeep.survival_utils import _process_parallel_coxph
 from simdeep.survival_utils import _process_parallel_cindex
+from simdeep.survival_utils import _process_parallel_cindex_columns
 from simdeep.survival_utils import _process_parallel_feature_importance
 from simdeep.survival_utils import _process_parallel_feature_importance_per_cluster
 from simdeep.survival_utils import select_best_classif_params
@@ -48,6 +50,7 @@ from simdeep.simdeep_utils import feature_selection_usage_type
 from simdeep.simdeep_utils import load_labels_file
 
 from simdeep.coxph_from_r import coxph
+from simdeep.coxph_from_r import coxph_columns
 from simdeep.coxph_from_r import c_index
 from simdeep.coxph_from_r import c_index_multiple
 
@@ -328,10 +331,7 @@ class SimDeep(DeepBase):
         self.use_autoencoders = False
         self.feature_surv_analysis = False
 
-        self.dataset.load_array()
-        self.dataset.load_survival()
-        self.dataset.load_meta_data()
-        self.dataset.subset_training_sets()
+        self.dataset.load_training_samples()
 
         labels_dict = load_labels_file(label_file)
 
@@ -360,7 +360,7 @@ class SimDeep(DeepBase):
         self.matrix_train_array = self.dataset.matrix_train_array
 
         for key in self.matrix_train_array:
-            self.matrix_train_array[key] = self.matrix_train_array[key].astype('float32')
+            self.matrix_train_array[key] = self.matrix_train_array[key].astype('float32', copy=False)
 
         self.training_omic_list = self.dataset.training_tsv.keys()
 
@@ -381,7 +381,9 @@ class SimDeep(DeepBase):
         nb_clusters = len(set(self.labels))
         self.labels_proba = np.array([labels_proba for _ in range(nb_clusters)]).T
 
-        nbdays, isdead = self.dataset.survival.T.tolist()
+        nbdays, isdead = self.dataset.survival.time, self.dataset.survival.event
+
+        design = self.dataset.survival.design
 
         pvalue = coxph(self.labels, isdead, nbdays,
                        isfactor=False,
@@ -389,11 +391,13 @@ class SimDeep(DeepBase):
                        png_path=self.path_results,
                        seed=self.seed,
                        use_r_packages=self.use_r_packages,
+                       design=design,
                        fig_name='{0}_KM_plot_training_dataset'.format(self.project_name))
 
         pvalue_proba = coxph(self.labels_proba.T[0], isdead, nbdays,
                              seed=self.seed,
                              use_r_packages=self.use_r_packages,
+                             design=design,
                              isfactor=False)
 
         if not self._isboosting:
@@ -443,7 +447,7 @@ class SimDeep(DeepBase):
 
         self.dataset.load_matrix_test_fold()
 
-        nbdays, isdead = self.dataset.survival_cv.T.tolist()
+        nbdays, isdead = self.dataset.survival_cv.time, self.dataset.survival_cv.event
         self.activities_cv = self._predict_survival_nodes(
             self.dataset.matrix_cv_array)
 
@@ -465,7 +469,8 @@ class SimDeep(DeepBase):
                                                         nbdays, isdead,
                                                         self.cv_labels,
                                                         self.cv_labels_proba,
-                                                        metadata_mat=metadata_mat)
+                                                        metadata_mat=metadata_mat,
+                                                        design=self.dataset.survival_cv.design)
         self.cv_pvalue = pvalue
         self.cv_pvalue_proba = pvalue_proba
 
@@ -481,7 +486,7 @@ class SimDeep(DeepBase):
         """
         self.dataset.load_matrix_full()
 
-        nbdays, isdead = self.dataset.survival_full.T.tolist()
+        nbdays, isdead = self.dataset.survival_full.time, self.dataset.survival_full.event
 
         self.activities_full = self._predict_survival_nodes(
             self.dataset.matrix_full_array)
@@ -504,7 +509,8 @@ class SimDeep(DeepBase):
                                                         nbdays, isdead,
                                                         self.full_labels,
                                                         self.full_labels_proba,
-                                                        metadata_mat=metadata_mat)
+                                                        metadata_mat=metadata_mat,
+                                                        design=self.dataset.survival_full.design)
         self.full_pvalue = pvalue
         self.full_pvalue_proba = pvalue_proba
 
@@ -519,7 +525,8 @@ class SimDeep(DeepBase):
         """
         """
         if self.dataset.survival_test is not None:
-            nbdays, isdead = self.dataset.survival_test.T.tolist()
+            nbdays, isdead = self.dataset.survival_test.time, self.dataset.survival_test.event
+            design = self.dataset.survival_test.design
 
         self.test_omic_list = list(self.dataset.matrix_test_array.keys())
         self.test_omic_list = list(set(self.test_omic_list).intersection(
@@ -553,7 +560,8 @@ class SimDeep(DeepBase):
                                                         nbdays, isdead,
                                                         self.test_labels,
                                                         self.test_labels_proba,
-                                                        metadata_mat=metadata_mat)
+                                                        metadata_mat=metadata_mat,
+                                                        design=design)
         self.test_pvalue = pvalue
         self.test_pvalue_proba = pvalue_proba
 
@@ -562,7 +570,8 @@ class SimDeep(DeepBase):
                 pvalue, pvalue_proba = self._compute_test_coxph(
                     'KM_plot_test',
                     nbdays, isdead,
-                    self.test_labels, self.test_labels_proba)
+                    self.test_labels, self.test_labels_proba,
+                    design=design)
 
                 self.test_pvalue = pvalue
                 self.test_pvalue_proba = pvalue_proba
@@ -580,7 +589,8 @@ class SimDeep(DeepBase):
                             isdead,
                             labels,
                             labels_proba,
-                            metadata_mat=None):
+                            metadata_mat=None,
+                            design=None):
         """ """
         pvalue = coxph(
             labels, isdead, nbdays,
@@ -590,6 +600,7 @@ class SimDeep(DeepBase):
             seed=self.seed,
             use_r_packages=self.use_r_packages,
             metadata_mat=metadata_mat,
+            design=design,
             fig_name='{0}_{1}'.format(self.project_name, fname_base))
 
         if self.verbose:
@@ -604,6 +615,7 @@ class SimDeep(DeepBase):
             seed=self.seed,
             use_r_packages=self.use_r_packages,
             metadata_mat=metadata_mat,
+            design=design,
             fig_name='{0}_{1}_proba'.format(self.project_name, fname_base))
 
         if self.verbose:
@@ -770,11 +782,10 @@ class SimDeep(DeepBase):
             matrix = []
 
             for key in matrices:
-                index = [self.dataset.feature_ref_index[key][feature]
-                         for feature, pvalue in
-                         self.feature_scores[key][:self.nb_selected_features]
-                         if feature in self.dataset.feature_ref_index[key]
-                ]
+                index = self.dataset.feature_ref_index[key].get_indexer(
+                    [feature for feature, pvalue in
+                     self.feature_scores[key][:self.nb_selected_features]])
+                index = index[index != -1]
 
                 matrix.append(matrices[key].T[index].T)
 
@@ -880,7 +891,7 @@ class SimDeep(DeepBase):
             )
 
         elif self.cluster_method == "coxPH":
-            nbdays, isdead = self.dataset.survival.T.tolist()
+            nbdays, isdead = self.dataset.survival.time, self.dataset.survival.event
 
             self.clustering = ClusterWithSurvival(
                 n_clusters=self.nb_clusters,
@@ -888,7 +899,7 @@ class SimDeep(DeepBase):
                 nbdays=nbdays)
 
         elif self.cluster_method == "coxPHMixture":
-            nbdays, isdead = self.dataset.survival.T.tolist()
+            nbdays, isdead = self.dataset.survival.time, self.dataset.survival.event
 
             self.clustering = ClusterWithSurvival(
                 n_clusters=self.nb_clusters,
@@ -940,7 +951,7 @@ class SimDeep(DeepBase):
                 print('cluster label: {0}\t number of samples:{1}'.format(key, value))
             print('\n')
 
-        nbdays, isdead = self.dataset.survival.T.tolist()
+        nbdays, isdead = self.dataset.survival.time, self.dataset.survival.event
 
         if self.metadata_usage in ['all', 'labels'] and \
            self.dataset.metadata_mat is not None:
@@ -955,6 +966,7 @@ class SimDeep(DeepBase):
                        seed=self.seed,
                        use_r_packages=self.use_r_packages,
                        metadata_mat=metadata_mat,
+                       design=self.dataset.survival.design,
                        fig_name='{0}_KM_plot_training_dataset'.format(self.project_name))
 
         pvalue_proba = coxph(self.labels_proba.T[0],
@@ -962,6 +974,7 @@ class SimDeep(DeepBase):
                              seed=self.seed,
                              use_r_packages=self.use_r_packages,
                              metadata_mat=metadata_mat,
+                             design=self.dataset.survival.design,
                              isfactor=False)
 
         if not self._isboosting:
@@ -1119,8 +1132,8 @@ class SimDeep(DeepBase):
         """
         return c-index using labels as predicat
         """
-        days, dead = np.asarray(self.dataset.survival).T
-        days_test, dead_test = np.asarray(self.dataset.survival_test).T
+        days, dead = self.dataset.survival.time, self.dataset.survival.event
+        days_test, dead_test = self.dataset.survival_test.time, self.dataset.survival_test.event
 
         activities_test = {}
 
@@ -1148,6 +1161,7 @@ class SimDeep(DeepBase):
             warnings.simplefilter("ignore")
             cindex = c_index_multiple(activities_train, dead, days,
                                       activities_test, dead_test, days_test,
+                                      design_test=self.dataset.survival_test.design,
                                       seed=self.seed,)
 
         if self.verbose:
@@ -1159,8 +1173,8 @@ class SimDeep(DeepBase):
         """
         return c-index using test-fold labels as predicat
         """
-        days, dead = np.asarray(self.dataset.survival).T
-        days_cv, dead_cv = np.asarray(self.dataset.survival_cv).T
+        days, dead = self.dataset.survival.time, self.dataset.survival.event
+        days_cv, dead_cv = self.dataset.survival_cv.time, self.dataset.survival_cv.event
 
         activities_cv = {}
 
@@ -1184,6 +1198,7 @@ class SimDeep(DeepBase):
             warnings.simplefilter("ignore")
             cindex = c_index_multiple(self.activities_for_pred_train, dead, days,
                                       activities_cv, dead_cv, days_cv,
+                                      design_test=self.dataset.survival_cv.design,
                                       seed=self.seed,)
 
         if self.verbose:
@@ -1283,13 +1298,15 @@ class SimDeep(DeepBase):
         """
         labels_old = labels.copy()
 
-        days, dead = np.asarray(self.dataset.survival).T
+        days, dead = self.dataset.survival.time, self.dataset.survival.event
+        design = self.dataset.survival.design
 
         self._label_ordered_dict = {}
 
         for label in set(labels_old):
             mean = surv_median(dead[labels_old == label],
-                             days[labels_old == label])
+                               days[labels_old == label],
+                               design=design.subset(labels_old == label))
             self._label_ordered_dict[label] = mean
 
         label_ordered = [label for label, _ in
@@ -1325,10 +1342,10 @@ class SimDeep(DeepBase):
         else:
             assert(activities is not None)
 
-        if survival is not None:
-            nbdays, isdead = survival.T.tolist()
-        else:
-            nbdays, isdead = self.dataset.survival.T.tolist()
+        if survival is None:
+            survival = self.dataset.survival
+
+        nbdays, isdead = survival.time, survival.event
 
         if self.feature_selection_usage == 'lasso':
             cws = ClusterWithSurvival(
@@ -1340,29 +1357,38 @@ class SimDeep(DeepBase):
 
         else:
             return self._get_survival_features_parallel(
-                isdead, nbdays, metadata_mat, activities, key)
+                isdead, nbdays, metadata_mat, activities, key,
+                design=survival.design)
 
     def _get_survival_features_parallel(
-            self, isdead, nbdays, metadata_mat, activities, key):
+            self, isdead, nbdays, metadata_mat, activities, key, design=None):
         """ """
         pool = None
 
-        if not self._isboosting:
-            pool = Pool(self.nb_threads_coxph)
-            mapf = pool.map
+        if metadata_mat is None and not self.use_r_packages:
+            # univariate models of all the nodes fitted at once
+            if self.seed:
+                np.random.seed(int(self.seed))
+
+            pvalue_list = enumerate(coxph_columns(
+                activities, isdead, nbdays, design=design))
         else:
-            mapf = map
+            if not self._isboosting:
+                pool = Pool(self.nb_threads_coxph)
+                mapf = pool.map
+            else:
+                mapf = map
 
-        input_list = iter((node_id,
-                           activity,
-                           isdead,
-                           nbdays,
-                           self.seed,
-                           metadata_mat, self.use_r_packages)
+            input_list = iter((node_id,
+                               activity,
+                               isdead,
+                               nbdays,
+                               self.seed,
+                               metadata_mat, self.use_r_packages)
 
-                          for node_id, activity in enumerate(activities.T))
+                              for node_id, activity in enumerate(activities.T))
 
-        pvalue_list = mapf(_process_parallel_coxph, input_list)
+            pvalue_list = mapf(_process_parallel_coxph, input_list)
 
         pvalue_list = list(filter(lambda x: not np.isnan(x[1]), pvalue_list))
         pvalue_list.sort(key=lambda x: x[1], reverse=True)
@@ -1383,8 +1409,15 @@ class SimDeep(DeepBase):
     def _look_for_prediction_nodes(self, key):
         """
         """
-        nbdays, isdead = self.dataset.survival.T.tolist()
-        nbdays_cv, isdead_cv = self.dataset.survival_cv.T.tolist()
+        if not self.dataset.cross_validation_instance:
+            raise Exception('C-index node selection needs a test fold:'\
+                            ' no cross_validation_instance defined!')
+
+        # the test fold is normalized as the training samples
+        self.dataset.load_matrix_test_fold()
+
+        nbdays, isdead = self.dataset.survival.time, self.dataset.survival.event
+        nbdays_cv, isdead_cv = self.dataset.survival_cv.time, self.dataset.survival_cv.event
 
         matrix_train = self.matrix_train_array[key]
         matrix_cv = self.dataset.matrix_cv_array[key]
@@ -1400,14 +1433,20 @@ class SimDeep(DeepBase):
             activities_train = np.asarray( matrix_train)
             activities_cv = np.asarray( matrix_cv)
 
-        input_list = iter((node_id,
-                           activities_train.T[node_id], isdead, nbdays,
-                           activities_cv.T[node_id], isdead_cv, nbdays_cv, self.use_r_packages)
-                           for node_id in range(activities_train.shape[1]))
+        if self.use_r_packages:
+            input_list = iter((node_id,
+                               activities_train.T[node_id], isdead, nbdays,
+                               activities_cv.T[node_id], isdead_cv, nbdays_cv,
+                               self.use_r_packages, None)
+                              for node_id in range(activities_train.shape[1]))
 
-        score_list = map(_process_parallel_cindex, input_list)
+            score_list = map(_process_parallel_cindex, input_list)
+        else:
+            # c-indexes of all the nodes computed together
+            score_list = self._get_cindex_nodes(activities_train, activities_cv)
 
-        score_list = filter(lambda x: not np.isnan(x[1]), score_list)
+        score_list = [(node_id, score) for node_id, score in score_list
+                      if not np.isnan(score)]
         score_list.sort(key=lambda x:x[1], reverse=True)
 
         valid_node_ids = [node_id for node_id, cindex in score_list
@@ -1423,12 +1462,48 @@ class SimDeep(DeepBase):
 
         return valid_node_ids
 
+    def _get_cindex_nodes(self, activities_train, activities_cv):
+        """
+        return the (node id, c-index) of the nodes, scored by chunks of
+        CINDEX_NODES_CHUNK_SIZE nodes, in parallel for the wide embeddings
+        """
+        nbdays, isdead = self.dataset.survival.time, self.dataset.survival.event
+        nbdays_cv, isdead_cv = self.dataset.survival_cv.time, self.dataset.survival_cv.event
+
+        nb_nodes = activities_train.shape[1]
+        chunks = np.array_split(np.arange(nb_nodes),
+                                max(int(np.ceil(nb_nodes / CINDEX_NODES_CHUNK_SIZE)), 1))
+
+        input_list = [(node_ids,
+                       activities_train[:, node_ids], isdead, nbdays,
+                       activities_cv[:, node_ids], isdead_cv, nbdays_cv,
+                       self.dataset.survival.design,
+                       self.dataset.survival_cv.design)
+                      for node_ids in chunks]
+
+        pool = None
+
+        if len(input_list) > 1 and not self._isboosting:
+            pool = Pool(self.nb_threads_coxph)
+            mapf = pool.map
+        else:
+            mapf = map
+
+        score_list = [score for scores in mapf(
+            _process_parallel_cindex_columns, input_list) for score in scores]
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        return score_list
+
     def compute_c_indexes_for_full_dataset(self):
         """
         return c-index using labels as predicat
         """
-        days, dead = np.asarray(self.dataset.survival).T
-        days_full, dead_full = np.asarray(self.dataset.survival_full).T
+        days, dead = self.dataset.survival.time, self.dataset.survival.event
+        days_full, dead_full = self.dataset.survival_full.time, self.dataset.survival_full.event
 
         try:
             with warnings.catch_warnings():
@@ -1436,6 +1511,8 @@ class SimDeep(DeepBase):
                 cindex = c_index(self.labels, dead, days,
                                  self.full_labels, dead_full, days_full,
                                  use_r_packages=self.use_r_packages,
+                                 design=self.dataset.survival.design,
+                                 design_test=self.dataset.survival_full.design,
                                  seed=self.seed,)
         except Exception as e:
             print('Exception while computing the c-index: {0}'.format(e))
@@ -1450,7 +1527,7 @@ class SimDeep(DeepBase):
         """
         return c-index using labels as predicat
         """
-        days, dead = np.asarray(self.dataset.survival).T
+        days, dead = self.dataset.survival.time, self.dataset.survival.event
 
         try:
             with warnings.catch_warnings():
@@ -1458,6 +1535,8 @@ class SimDeep(DeepBase):
                 cindex = c_index(self.labels, dead, days,
                                  self.labels, dead, days,
                                  use_r_packages=self.use_r_packages,
+                                 design=self.dataset.survival.design,
+                                 design_test=self.dataset.survival.design,
                                  seed=self.seed,)
         except Exception as e:
             print('Exception while computing the c-index: {0}'.format(e))
@@ -1472,8 +1551,8 @@ class SimDeep(DeepBase):
         """
         return c-index using labels as predicat
         """
-        days, dead = np.asarray(self.dataset.survival).T
-        days_test, dead_test = np.asarray(self.dataset.survival_test).T
+        days, dead = self.dataset.survival.time, self.dataset.survival.event
+        days_test, dead_test = self.dataset.survival_test.time, self.dataset.survival_test.event
 
         try:
             with warnings.catch_warnings():
@@ -1481,6 +1560,8 @@ class SimDeep(DeepBase):
                 cindex = c_index(self.labels, dead, days,
                                  self.test_labels, dead_test, days_test,
                                  use_r_packages=self.use_r_packages,
+                                 design=self.dataset.survival.design,
+                                 design_test=self.dataset.survival_test.design,
                                  seed=self.seed,)
         except Exception as e:
             print('Exception while computing the c-index: {0}'.format(e))
@@ -1497,13 +1578,15 @@ class SimDeep(DeepBase):
         """
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
-            days, dead = np.asarray(self.dataset.survival).T
-            days_cv, dead_cv= np.asarray(self.dataset.survival_cv).T
+            days, dead = self.dataset.survival.time, self.dataset.survival.event
+            days_cv, dead_cv = self.dataset.survival_cv.time, self.dataset.survival_cv.event
 
             try:
                 cindex =  c_index(self.labels, dead, days,
                                   self.cv_labels, dead_cv, days_cv,
                                   use_r_packages=self.use_r_packages,
+                                  design=self.dataset.survival.design,
+                                  design_test=self.dataset.survival_cv.design,
                                   seed=self.seed,)
             except Exception as e:
                 print('Exception while computing the c-index: {0}'.format(e))
@@ -36,6 +36,11 @@ from simdeep.config import CLASSIFICATION_METHOD
 from simdeep.config import TRAINING_TSV
 from simdeep.config import SURVIVAL_TSV
 from simdeep.config import PATH_DATA
+from simdeep.config import PATH_CACHE
+from simdeep.config import NB_FEATURES_TO_LOAD
+from simdeep.config import NB_THREADS_LOADING
+from simdeep.config import DTYPE
+from simdeep.config import SPARSE_OMICS
 from simdeep.config import SURVIVAL_FLAG
 from simdeep.config import NODES_SELECTION
 from simdeep.config import CINDEX_THRESHOLD
@@ -75,7 +80,6 @@ import gc
 from time import time
 
 from numpy import hstack
-from numpy import vstack
 
 import pandas as pd
 
@@ -83,6 +87,12 @@ from simdeep.survival_utils import \
     _process_parallel_feature_importance_per_cluster
 from simdeep.survival_utils import \
     _process_parallel_survival_feature_importance_per_cluster
+from simdeep.survival_utils import to_dense
+from simdeep.survival_utils import SampleIndex
+from simdeep.survival_utils import Survival
+from simdeep.survival_utils import vstack_matrices
+
+from scipy.sparse import issparse
 
 
 
@@ -200,6 +210,13 @@ class SimDeepBoosting():
         self.survival_tsv = survival_tsv
         self.survival_flag = survival_flag
         self.path_data = path_data
+        self.path_cache = additional_dataset_args.get('path_cache', PATH_CACHE)
+        self.nb_features_to_load = additional_dataset_args.get(
+            'nb_features_to_load', NB_FEATURES_TO_LOAD)
+        self.nb_threads_loading = additional_dataset_args.get(
+            'nb_threads_loading', NB_THREADS_LOADING)
+        self.dtype = additional_dataset_args.get('dtype', DTYPE)
+        self.sparse_omics = additional_dataset_args.get('sparse_omics', SPARSE_OMICS)
         self.dataset = None
         self.cindex_thres = cindex_thres
         self.node_selection = node_selection
@@ -345,6 +362,13 @@ class SimDeepBoosting():
 
         self.split_n_fold = split_n_fold
 
+        # The input files are parsed only once in this dataset and
+        # the instances below only differ by their fold split
+        self.shared_dataset = LoadData(cross_validation_instance=None,
+                                       verbose=False,
+                                       normalization=self.normalization,
+                                       **additional_dataset_args)
+
         for it in range(nb_it):
             if self.split_n_fold:
                 split = KFold(n_splits=split_n_fold,
@@ -357,6 +381,7 @@ class SimDeepBoosting():
             dataset = LoadData(cross_validation_instance=split,
                                verbose=False,
                                normalization=self.normalization,
+                               _shared_dataset=self.shared_dataset,
                                _autoencoder_parameters=autoencoder_parameters.copy(),
                                **additional_dataset_args)
 
@@ -498,31 +523,46 @@ class SimDeepBoosting():
         self.ray = ray
 
         try:
-            self.models = [SimDeepDistributed.remote(
-                nb_clusters=self.nb_clusters,
-                nb_selected_features=self.nb_selected_features,
-                pvalue_thres=self.pvalue_thres,
-                dataset=dataset,
-                load_existing_models=False,
-                verbose=dataset.verbose,
-                _isboosting=True,
-                do_KM_plot=False,
-                cluster_method=self.cluster_method,
-                clustering_omics=self.clustering_omics,
-                use_autoencoders=self.use_autoencoders,
-                use_r_packages=self.use_r_packages,
-                feature_surv_analysis=self.feature_surv_analysis,
-                path_results=self.path_results,
-                project_name=self.project_name,
-                classification_method=self.classification_method,
-                cindex_thres=self.cindex_thres,
-                alternative_embedding=self.alternative_embedding,
-                kwargs_alternative_embedding=self.kwargs_alternative_embedding,
-                node_selection=self.node_selection,
-                metadata_usage=self.metadata_usage,
-                feature_selection_usage=self.feature_selection_usage,
-                deep_model_additional_args=dataset._autoencoder_parameters)
-                           for dataset in self.datasets]
+            # parsed before dispatching the datasets to the workers and
+            # stored once in the object store: only a reference to it
+            # is sent with each dataset
+            self.shared_dataset.load_shared_training_samples()
+            shared_dataset_ref = ray.put(self.shared_dataset)
+
+            for dataset in self.datasets:
+                dataset._shared_dataset = shared_dataset_ref
+
+            try:
+                self.models = [SimDeepDistributed.remote(
+                    nb_clusters=self.nb_clusters,
+                    nb_selected_features=self.nb_selected_features,
+                    pvalue_thres=self.pvalue_thres,
+                    dataset=dataset,
+                    load_existing_models=False,
+                    verbose=dataset.verbose,
+                    _isboosting=True,
+                    do_KM_plot=False,
+                    cluster_method=self.cluster_method,
+                    clustering_omics=self.clustering_omics,
+                    use_autoencoders=self.use_autoencoders,
+                    use_r_packages=self.use_r_packages,
+                    feature_surv_analysis=self.feature_surv_analysis,
+                    path_results=self.path_results,
+                    project_name=self.project_name,
+                    classification_method=self.classification_method,
+                    cindex_thres=self.cindex_thres,
+                    alternative_embedding=self.alternative_embedding,
+                    kwargs_alternative_embedding=self.kwargs_alternative_embedding,
+                    node_selection=self.node_selection,
+                    metadata_usage=self.metadata_usage,
+                    feature_selection_usage=self.feature_selection_usage,
+                    deep_model_additional_args=dataset._autoencoder_parameters)
+                               for dataset in self.datasets]
+            finally:
+                # the actor arguments are serialized when dispatched: the
+                # datasets of the driver keep the parsed shared dataset
+                for dataset in self.datasets:
+                    dataset._shared_dataset = self.shared_dataset
 
             if pretrained_labels_files:
                 nb_files = len(pretrained_labels_files)
@@ -650,7 +690,8 @@ class SimDeepBoosting():
         for key, value in sorted(Counter(self.test_labels).items()):
             print('class: {0}, number of samples :{1}'.format(key, value))
 
-        nbdays, isdead = self._from_model_dataset(self.models[0], "survival_test").T.tolist()
+        survival_test = self._from_model_dataset(self.models[0], "survival_test")
+        nbdays, isdead = survival_test.time, survival_test.event
 
         if np.isnan(nbdays).all():
             return np.nan, np.nan
@@ -659,7 +700,8 @@ class SimDeepBoosting():
             'KM_plot_boosting_test',
             nbdays, isdead,
             self.test_labels, self.test_labels_proba,
-            self.project_name)
+            self.project_name,
+            design=survival_test.design)
 
         self.log['pvalue test {0}'.format(self.test_fname_key)] = pvalue
         self.log['pvalue proba test {0}'.format(self.test_fname_key)] = pvalue_proba
@@ -681,7 +723,7 @@ class SimDeepBoosting():
         """
         print('predict labels on test fold datasets...')
 
-        isdead_cv, nbdays_cv, labels_cv = [], [], []
+        survival_cv_list, labels_cv = [], []
 
         if self.metadata_usage in ['all', 'labels'] and \
            self.metadata_tsv:
@@ -696,9 +738,7 @@ class SimDeepBoosting():
                 print('No survival dataset for CV fold returning')
                 return
 
-            nbdays, isdead = survival_cv.T.tolist()
-            nbdays_cv += nbdays
-            isdead_cv += isdead
+            survival_cv_list.append(survival_cv)
             labels_cv += self._from_model_attr(model, "cv_labels").tolist()
 
             if metadata_mat is not None:
@@ -711,14 +751,17 @@ class SimDeepBoosting():
 
                 metadata_mat = metadata_mat.fillna(0)
 
+        survival_cv = Survival.concatenate(survival_cv_list)
+
         pvalue = coxph(
-            labels_cv, isdead_cv, nbdays_cv,
+            labels_cv, survival_cv.event, survival_cv.time,
             isfactor=False,
             do_KM_plot=self.do_KM_plot,
             png_path=self.path_results,
             fig_name='cv_analysis', seed=self.seed,
             use_r_packages=self.use_r_packages,
-            metadata_mat=metadata_mat
+            metadata_mat=metadata_mat,
+            design=survival_cv.design,
         )
 
         print('Pvalue for test fold concatenated: {0}'.format(pvalue))
@@ -930,14 +973,15 @@ class SimDeepBoosting():
         for key, value in sorted(Counter(self.full_labels).items()):
             print('class: {0}, number of samples :{1}'.format(key, value))
 
-        nbdays, isdead = self.survival_full.T.tolist()
+        nbdays, isdead = self.survival_full.time, self.survival_full.event
 
 
         pvalue, pvalue_proba, pvalue_cat = self._compute_test_coxph(
             'KM_plot_boosting_full',
             nbdays, isdead,
             self.full_labels, self.full_labels_proba,
-            self._project_name)
+            self._project_name,
+            design=self.survival_full.design)
 
         self.log['pvalue full'] = pvalue
         self.log['pvalue proba full'] = pvalue_proba
@@ -997,27 +1041,28 @@ class SimDeepBoosting():
         """
         """
         survival_old = self._from_model_dataset(self.models[0], 'survival_full')
-        sample_ids = self._from_model_dataset(self.models[0], 'sample_ids_full')
-
-        surv_dict = {sample: surv for sample, surv in zip(sample_ids, survival_old)}
+        index = self._get_index_full()
 
-        self.survival_full = np.asarray([np.asarray(surv_dict[sample])[0]
-                                         for sample in self.sample_ids_full])
+        self.survival_full = survival_old[index]
 
         metadata = self._from_model_dataset(self.models[0], 'metadata_mat_full')
 
         if metadata is not None:
-
-            index_dict = {sample: pos for pos, sample in enumerate(sample_ids)}
-            index = np.asarray([index_dict[sample] for sample in self.sample_ids_full])
             self.metadata_mat_full = metadata.T[index].T
 
-    def _reorder_matrix_full(self):
+    def _get_index_full(self):
         """
+        positions of the samples of sample_ids_full in the full dataset
+        of the first model
         """
         sample_ids = self._from_model_dataset(self.models[0], 'sample_ids_full')
-        index_dict = {sample: ids for ids, sample in enumerate(sample_ids)}
-        index = [index_dict[sample] for sample in self.sample_ids_full]
+
+        return SampleIndex(sample_ids).get_indexer(self.sample_ids_full)
+
+    def _reorder_matrix_full(self):
+        """
+        """
+        index = self._get_index_full()
 
         self.matrix_with_cv_array = self._from_model_dataset(
             self.models[0], 'matrix_array').copy()
@@ -1027,12 +1072,16 @@ class SimDeepBoosting():
 
         for key in self.matrix_with_cv_array:
             if len(matrix_cv_unormalized_array):
-                self.matrix_with_cv_array[key] = vstack(
+                self.matrix_with_cv_array[key] = vstack_matrices(
                     [self.matrix_with_cv_array[key],
                      matrix_cv_unormalized_array[key]])
 
             self.matrix_with_cv_array[key] = self.matrix_with_cv_array[key][index]
 
+            if issparse(self.matrix_with_cv_array[key]):
+                # the features are read as the rows of the transposed matrix
+                self.matrix_with_cv_array[key] = self.matrix_with_cv_array[key].tocsc()
+
     def _get_probas_for_full_models(self):
         """
         """
@@ -1058,7 +1107,7 @@ class SimDeepBoosting():
 
     def _compute_test_coxph(self, fname_base, nbdays,
                             isdead, labels, labels_proba,
-                            project_name, metadata_mat=None):
+                            project_name, metadata_mat=None, design=None):
         """ """
         pvalue = coxph(
             labels, isdead, nbdays,
@@ -1068,7 +1117,8 @@ class SimDeepBoosting():
             fig_name='{0}_{1}'.format(project_name, fname_base),
             use_r_packages=self.use_r_packages,
             metadata_mat=metadata_mat,
-            seed=self.seed)
+            seed=self.seed,
+            design=design)
 
         if self.verbose:
             print('Cox-PH p-value (Log-Rank) for inferred labels: {0}'.format(pvalue))
@@ -1079,7 +1129,8 @@ class SimDeepBoosting():
             isfactor=False,
             use_r_packages=self.use_r_packages,
             metadata_mat=metadata_mat,
-            seed=self.seed)
+            seed=self.seed,
+            design=design)
 
         if self.verbose:
             print('Cox-PH proba p-value (Log-Rank) for inferred labels: {0}'.format(pvalue_proba))
@@ -1094,7 +1145,8 @@ class SimDeepBoosting():
             use_r_packages=self.use_r_packages,
             fig_name='{0}_proba_{1}'.format(project_name, fname_base),
             metadata_mat=metadata_mat,
-            seed=self.seed)
+            seed=self.seed,
+            design=design)
 
         if self.verbose:
             print('Cox-PH categorical p-value (Log-Rank) for inferred labels: {0}'.format(
@@ -1120,8 +1172,9 @@ class SimDeepBoosting():
         """
         return c-index using labels as predicat
         """
-        days_full, dead_full = np.asarray(self.survival_full).T
-        days_test, dead_test = self._from_model_dataset(self.models[0], 'survival_test').T
+        days_full, dead_full = self.survival_full.time, self.survival_full.event
+        survival_test = self._from_model_dataset(self.models[0], 'survival_test')
+        days_test, dead_test = survival_test.time, survival_test.event
 
         if np.isnan(days_test).all():
             print("Cannot compute C-index for test dataset. Need test survival file")
@@ -1129,26 +1182,26 @@ class SimDeepBoosting():
 
         labels_test_categorical = self._labels_proba_to_labels(self.test_labels_proba)
 
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            if isinstance(days_test, np.matrix):
-                days_test = np.asarray(days_test)[0]
-                dead_test = np.asarray(dead_test)[0]
-
         cindex = c_index(self.full_labels, dead_full, days_full,
                          self.test_labels, dead_test, days_test,
                          use_r_packages=self.use_r_packages,
-                         seed=self.seed)
+                         seed=self.seed,
+                         design=self.survival_full.design,
+                         design_test=survival_test.design)
 
         cindex_cat = c_index(self.full_labels, dead_full, days_full,
                              labels_test_categorical, dead_test, days_test,
                              use_r_packages=self.use_r_packages,
-                             seed=self.seed)
+                             seed=self.seed,
+                             design=self.survival_full.design,
+                             design_test=survival_test.design)
 
         cindex_proba = c_index(self.full_labels_proba.T[0], dead_full, days_full,
                                self.test_labels_proba.T[0], dead_test, days_test,
                                use_r_packages=self.use_r_packages,
-                               seed=self.seed)
+                               seed=self.seed,
+                               design=self.survival_full.design,
+                               design_test=survival_test.design)
 
         if self.verbose:
             print('c-index for boosting test dataset:{0}'.format(cindex))
@@ -1165,23 +1218,29 @@ class SimDeepBoosting():
         """
         return c-index using labels as predicat
         """
-        days_full, dead_full = np.asarray(self.survival_full).T
+        days_full, dead_full = self.survival_full.time, self.survival_full.event
         labels_categorical = self._labels_proba_to_labels(self.full_labels_proba)
 
         cindex = c_index(self.full_labels, dead_full, days_full,
                          self.full_labels, dead_full, days_full,
                          use_r_packages=self.use_r_packages,
-                         seed=self.seed)
+                         seed=self.seed,
+                         design=self.survival_full.design,
+                         design_test=self.survival_full.design)
 
         cindex_cat = c_index(labels_categorical, dead_full, days_full,
                              labels_categorical, dead_full, days_full,
                              use_r_packages=self.use_r_packages,
-                             seed=self.seed)
+                             seed=self.seed,
+                             design=self.survival_full.design,
+                             design_test=self.survival_full.design)
 
         cindex_proba = c_index(self.full_labels_proba.T[0], dead_full, days_full,
                                self.full_labels_proba.T[0], dead_full, days_full,
                                use_r_packages=self.use_r_packages,
-                               seed=self.seed)
+                               seed=self.seed,
+                               design=self.survival_full.design,
+                               design_test=self.survival_full.design)
 
         if self.verbose:
             print('c-index for boosting full dataset:{0}'.format(cindex))
@@ -1204,10 +1263,11 @@ class SimDeepBoosting():
         matrix_array_train = self._from_model_dataset(self.models[0], 'matrix_ref_array')
         matrix_array_test = self._from_model_dataset(self.models[0], 'matrix_test_array')
 
-        nbdays, isdead = self._from_model_dataset(self.models[0],
-                                                  'survival').T.tolist()
-        nbdays_test, isdead_test = self._from_model_dataset(self.models[0],
-                                                            'survival_test').T.tolist()
+        survival = self._from_model_dataset(self.models[0], 'survival')
+        survival_test = self._from_model_dataset(self.models[0], 'survival_test')
+
+        nbdays, isdead = survival.time, survival.event
+        nbdays_test, isdead_test = survival_test.time, survival_test.event
 
         activities_train, activities_test = [], []
 
@@ -1352,13 +1412,24 @@ class SimDeepBoosting():
 
             return encoder_key
 
+        # only the omics of the test dataset are used for the plot:
+        # the other training matrices are not loaded
+        training_tsv = {key: self.training_tsv[key]
+                        for key in self.test_tsv_dict
+                        if key in self.training_tsv}
+
         self.dataset = LoadData(
             cross_validation_instance=None,
-            training_tsv=self.training_tsv,
+            training_tsv=training_tsv,
             survival_tsv=self.survival_tsv,
             metadata_tsv=self.metadata_tsv,
             survival_flag=self.survival_flag,
             path_data=self.path_data,
+            path_cache=self.path_cache,
+            nb_features_to_load=self.nb_features_to_load,
+            nb_threads_loading=self.nb_threads_loading,
+            dtype=self.dtype,
+            sparse_omics=self.sparse_omics,
             verbose=False,
             normalization=self.test_normalization,
             subset_training_with_meta=self.subset_training_with_meta
@@ -1367,10 +1438,7 @@ class SimDeepBoosting():
         if self.verbose:
             print('preparing data for plotting...')
 
-        self.dataset.load_array()
-        self.dataset.load_survival()
-        self.dataset.load_meta_data()
-        self.dataset.subset_training_sets()
+        self.dataset.load_training_samples()
         self.dataset.reorder_matrix_array(self.sample_ids_full)
         self.dataset.create_a_cv_split()
         self.dataset.normalize_training_array()
@@ -1471,29 +1539,34 @@ class SimDeepBoosting():
         for label in set(self.full_labels):
             self.survival_feature_scores_per_cluster[label] = []
 
+        # risk sets computed once, before the survival is sent to the workers
+        self.survival_full.design
+
         feature_dict = self._from_model_dataset(self.models[0], 'feature_array')
 
-        def generator(feature_list, matrix, feature_index):
-            for feat in feature_list:
-                i = feature_index[feat[0]]
+        def generator(feature_list, matrix, feature_pos):
+            for feat, i in zip(feature_list, feature_pos):
                 yield (feat,
-                       np.asarray(matrix[i]).reshape(-1),
+                       np.asarray(to_dense(matrix[i])).reshape(-1),
                        self.survival_full,
                        metadata_mat,
                        pval_thres,
                        self.use_r_packages)
 
         for key in self.matrix_with_cv_array:
-            feature_index = {feat: i for i, feat in enumerate(feature_dict[key])}
+            feature_index = feature_dict[key]
 
             for label in self.feature_scores_per_cluster:
                 matrix = self.matrix_with_cv_array[key][:]
 
                 feature_list =  self.feature_scores_per_cluster[label]
-                feature_list = [feat for feat in feature_list
-                                if feat[0] in feature_index]
+                feature_pos = feature_index.get_indexer(
+                    [feat[0] for feat in feature_list])
+                feature_list = [feat for feat, i in zip(feature_list, feature_pos)
+                                if i != -1]
+                feature_pos = feature_pos[feature_pos != -1]
 
-                input_list = generator(feature_list, matrix.T, feature_index)
+                input_list = generator(feature_list, matrix.T, feature_pos)
 
                 features_scored = mapf(
                     _process_parallel_survival_feature_importance_per_cluster,
@@ -1520,7 +1593,7 @@ class SimDeepBoosting():
 
         def generator(labels, feature_list, matrix):
             for i in range(len(feature_list)):
-                yield feature_list[i], matrix[i], labels, pval_thres
+                yield feature_list[i], to_dense(matrix[i]), labels, pval_thres
 
         feature_dict = self._from_model_dataset(self.models[0], 'feature_array')
 
@@ -1674,7 +1747,7 @@ class SimDeepBoosting():
 
             seed = self._from_model_attr(model, 'seed')
 
-            nbdays, isdead = survival.T.tolist()
+            nbdays, isdead = survival.time, survival.event
 
             if not seed:
                 seed = i
@@ -1807,9 +1880,4 @@ def _weighted_max(proba, weights):
 def _reorder_labels(labels, sample_ids):
     """
     """
-    sample_dict = {sample: id for id, sample in enumerate(sample_ids)}
-    sample_ordered = set(sample_ids)
-
-    index = [sample_dict[sample] for sample in sample_ordered]
-
-    return labels[index]
+    return np.asarray(labels)[SampleIndex(sample_ids).argsort()]
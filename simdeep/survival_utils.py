@@ -1,6 +1,11 @@
 """
 """
 import re
+import hashlib
+import warnings
+import gzip
+import bz2
+import lzma
 
 import pandas as pd
 
@@ -10,31 +15,57 @@ from simdeep.config import SEPARATOR
 from simdeep.config import ENTREZ_TO_ENSG_FILE
 from simdeep.config import USE_INPUT_TRANSPOSE
 from simdeep.config import DEFAULTSEP
+from simdeep.config import PARSING_CHUNK_SIZE
+from simdeep.config import NORMALIZATION_CHUNK_SIZE
+from simdeep.config import PATH_CACHE
+from simdeep.config import CACHE_MAX_SIZE
 from simdeep.config import CLASSIFIER
 
 import  numpy as np
 
 from os.path import isfile
+from os.path import splitext
 
-from scipy.stats import rankdata
+from itertools import islice
 
-from numpy import hstack
+from contextlib import contextmanager
+
+
+from numpy import vstack
+
+from scipy.sparse import issparse
+from scipy.sparse import csr_matrix
+from scipy.sparse import hstack as sparse_hstack
+from scipy.sparse import vstack as sparse_vstack
 
 from sklearn.metrics import pairwise_distances
 
-from sklearn.preprocessing import LabelBinarizer
 from sklearn.preprocessing import RobustScaler
 
 from collections import defaultdict
+from collections.abc import Mapping
 
 from simdeep.coxph_from_r import coxph
 from simdeep.coxph_from_r import c_index
+from simdeep.coxph_from_r import SurvivalDesign
+from simdeep.coxph_from_r import c_index_columns
 
 from scipy.stats import kruskal
 from scipy.stats import ranksums
 
 from os.path import isdir
+from os.path import abspath
+from os.path import getsize
+from os.path import getmtime
 from os import mkdir
+from os import makedirs
+from os import remove
+from os import replace
+from os import stat
+from os import utime
+from os import getpid
+
+from glob import glob
 
 
 ################ DEBUG ################
@@ -42,40 +73,94 @@ from os import mkdir
 MAX_FEATURE = None
 #######################################
 
+# compressed text files are decompressed on the fly
+COMPRESSED_FORMATS = {'.gz': gzip, '.bz2': bz2, '.xz': lzma}
+# matrix formats loaded without text parsing
+BINARY_FORMATS = ['.npy', '.npz', '.h5', '.hdf5', '.parquet', '.feather']
+
 
 class MadScaler():
-    def __init__(self):
+    """
+    scale each row of a matrix by its median and its median absolute
+    deviation
+    """
+    def __init__(self, chunk_size=NORMALIZATION_CHUNK_SIZE, inplace=False):
         """
+        chunk_size: number of matrix cells scaled at once
+        inplace: overwrite the input array instead of a copy
         """
-        pass
+        self.chunk_size = chunk_size
+        self.inplace = inplace
+
     def fit_transform(self, X):
         """ """
-        X = np.asarray(X)
+        X = np.asarray(X) if self.inplace else np.array(X)
+
+        for chunk in _iter_row_chunks(X, self.chunk_size):
+            med = np.median(X[chunk], axis=1, keepdims=True)
+            mad = np.median(np.abs(X[chunk] - med), axis=1, keepdims=True)
 
-        for i in range(len(X)):
-            med = np.median(X[i])
-            mad = np.median(np.abs(X[i] - med))
-            X[i] = (X[i] - med) / mad
+            with np.errstate(divide='ignore', invalid='ignore'):
+                X[chunk] = (X[chunk] - med) / mad
 
-        return np.nan_to_num(np.matrix(X))
+        return np.nan_to_num(X, copy=False)
 
 class RankNorm():
     """
+    replace the values of each row of a matrix by their ranks, divided by
+    the number of columns (ties get their average rank)
     """
-    def __init__(self):
+    def __init__(self, chunk_size=NORMALIZATION_CHUNK_SIZE, inplace=False):
         """
+        chunk_size: number of matrix cells ranked at once
+        inplace: overwrite the input array instead of a copy
         """
-        pass
+        self.chunk_size = chunk_size
+        self.inplace = inplace
 
     def fit_transform(self, X):
         """ """
-        X = np.asarray(X)
-        shape = list(map(float, X.shape))
+        X = np.asarray(X) if self.inplace else np.array(X)
+
+        for chunk in _iter_row_chunks(X, self.chunk_size):
+            X[chunk] = _rank_rows(X[chunk]) / float(X.shape[1])
 
-        for i in range(len(X)):
-            X[i] = rankdata(X[i]) / shape[1]
+        return X
+
+def _rank_rows(X):
+    """
+    vectorized scipy.stats.rankdata applied to each row of X (average
+    ranks for the ties, nan for the rows with missing values)
+    """
+    nb_cols = X.shape[1]
+    order = np.argsort(X, axis=1)
+    sorted_x = np.take_along_axis(X, order, axis=1)
 
-        return np.matrix(X)
+    # first and last positions of the groups of tied values
+    is_first = np.ones(sorted_x.shape, dtype=bool)
+    is_first[:, 1:] = sorted_x[:, 1:] != sorted_x[:, :-1]
+    is_last = np.ones(sorted_x.shape, dtype=bool)
+    is_last[:, :-1] = is_first[:, 1:]
+
+    pos = np.arange(nb_cols)
+    first = np.maximum.accumulate(np.where(is_first, pos, 0), axis=1)
+    last = np.minimum.accumulate(
+        np.where(is_last, pos, nb_cols - 1)[:, ::-1], axis=1)[:, ::-1]
+
+    ranks = np.empty(X.shape, dtype=np.float64)
+    np.put_along_axis(ranks, order, (first + last) / 2.0 + 1.0, axis=1)
+    ranks[np.isnan(X).any(axis=1)] = np.nan
+
+    return ranks
+
+def _iter_row_chunks(X, chunk_size):
+    """
+    yield the slices of consecutive rows of X holding about chunk_size cells
+    """
+    nb_rows = max(1, chunk_size // max(1, X.shape[1]))
+
+    for start in range(0, len(X), nb_rows):
+        yield slice(start, start + nb_rows)
 
 class SampleReducer():
     """
@@ -109,10 +194,13 @@ class SampleReducer():
 class VarianceReducer():
     """
     """
-    def __init__(self, nb_features=200):
+    def __init__(self, nb_features=200, chunk_size=NORMALIZATION_CHUNK_SIZE):
         """
+        chunk_size: number of matrix cells of the column blocks used to
+                    compute the variances
         """
         self.nb_features = nb_features
+        self.chunk_size = chunk_size
         self.index_to_keep = []
 
     def fit(self, dataset):
@@ -121,16 +209,38 @@ class VarianceReducer():
         if self.nb_features > dataset.shape[1]:
             self.nb_features = dataset.shape[1]
 
-        variances = [np.var(array) for array in dataset.T]
-        threshold = sorted(enumerate(variances),
-                           reverse=True,
-                           key=lambda x:x[1],
-        )
-        self.index_to_keep = [pos for pos, var in threshold[:self.nb_features]]
+        if issparse(dataset):
+            mean = np.asarray(dataset.mean(axis=0)).reshape(-1)
+            variances = np.asarray(dataset.multiply(dataset).mean(axis=0)).reshape(-1) \
+                - mean ** 2
+        else:
+            variances = self._column_variances(np.asarray(dataset))
+
+        # features sorted by decreasing variance, the ties in column order
+        order = np.argsort(-variances, kind='stable')
+        self.index_to_keep = order[:self.nb_features].tolist()
+
+    def _column_variances(self, dataset):
+        """
+        variance of each column, computed on contiguous blocks of
+        transposed columns: the values are identical to np.var applied to
+        each column
+        """
+        variances = np.empty(dataset.shape[1])
+        nb_cols = max(1, self.chunk_size // max(1, dataset.shape[0]))
+
+        for start in range(0, dataset.shape[1], nb_cols):
+            block = np.ascontiguousarray(dataset[:, start:start + nb_cols].T)
+            variances[start:start + nb_cols] = np.var(block, axis=1)
+
+        return variances
 
     def transform(self, dataset):
         """
         """
+        if issparse(dataset):
+            return dataset[:, self.index_to_keep]
+
         return dataset.T[self.index_to_keep].T
 
     def fit_transform(self, dataset):
@@ -141,34 +251,201 @@ class VarianceReducer():
 
 class CorrelationReducer():
     """
+    replace the features of a matrix by the correlations of its rows
+    with the rows of the reference dataset used to fit the reducer, or
+    with a fixed number of landmarks summarizing the reference
     """
-    def __init__(self, distance='correlation', threshold=None):
+    def __init__(self, distance='correlation', threshold=None,
+                 dtype=None, chunk_size=NORMALIZATION_CHUNK_SIZE,
+                 nb_landmarks=0, landmark_method='random', seed=None):
         """
+        dtype: floating point type of the correlations (None: type of the
+               input matrices, or float64 for non floating matrices)
+        chunk_size: number of cells of the blocks used to compute the
+                    correlations
+        nb_landmarks: number of reference landmarks (0: all the reference
+                      samples are used)
+        landmark_method: 'random' (random reference samples), 'kmeans'
+                         (centroids of the reference samples) or 'survival'
+                         (reference samples evenly spread over the samples
+                         sorted by event and survival time)
+        seed: seed of the random and kmeans landmark selections
         """
         self.distance = distance
         self.dataset = None
         self.threshold = threshold
+        self.dtype = dtype
+        self.chunk_size = chunk_size
+        self.nb_landmarks = nb_landmarks
+        self.landmark_method = landmark_method
+        self.seed = seed
 
-    def fit(self, dataset):
-        """ """
-        self.dataset = dataset
+        # landmark of each reference sample (-1: unused sample)
+        self.landmark_groups = None
+        # position of the reference samples used as landmarks
+        self.landmark_index = None
 
+        self._normalized_ref = None
+
+    def fit(self, dataset, survival=None, landmark_groups=None):
+        """
+        survival: Survival of the reference samples,
+                  for the 'survival' landmark selection
+        landmark_groups: landmarks of a previous fit on the same samples
+        """
         if self.threshold:
-            self.dataset[self.dataset < self.threshold] = 0
+            dataset = np.where(dataset < self.threshold, 0, dataset)
+
+        dtype = self._get_dtype(np.asarray(dataset))
+        self._define_landmarks(dataset, survival, landmark_groups)
+
+        if self.landmark_groups is not None:
+            dataset = self._landmark_matrix(dataset)
+
+        if self.distance != 'correlation':
+            self.dataset = dataset
+            return
+
+        # the reference is centred and normalized once, then used by all
+        # the transform calls
+        self._normalized_ref = self._center_and_normalize(dataset, dtype)
 
     def transform(self, dataset):
         """ """
         if self.threshold:
-            dataset[dataset < self.threshold] = 0
+            dataset = np.where(dataset < self.threshold, 0, dataset)
 
-        return 1.0 - pairwise_distances(dataset,
-                                        self.dataset,
-                                        self.distance)
+        if self.distance != 'correlation':
+            return 1.0 - pairwise_distances(dataset,
+                                            self.dataset,
+                                            self.distance)
 
-    def fit_transform(self, dataset):
+        return self._correlate(self._center_and_normalize(
+            dataset, self._normalized_ref.dtype))
+
+    def fit_transform(self, dataset, survival=None, landmark_groups=None):
         """ """
-        self.fit(dataset)
-        return self.transform(dataset)
+        self.fit(dataset, survival, landmark_groups)
+
+        if self.distance != 'correlation' or self.landmark_groups is not None:
+            return self.transform(dataset)
+
+        return self._correlate(self._normalized_ref)
+
+    def get_landmark_names(self, sample_ids):
+        """
+        return the names of the reference rows: the sample ids, or the
+        landmark numbers for the kmeans centroids
+        """
+        if self.landmark_groups is None:
+            return list(sample_ids)
+
+        if self.landmark_index is None:
+            return ['landmark_{0}'.format(i) for i in range(self.nb_landmarks)]
+
+        return np.asarray(sample_ids)[self.landmark_index].tolist()
+
+    def _define_landmarks(self, dataset, survival, landmark_groups):
+        """ """
+        nb_samples = len(dataset)
+
+        if landmark_groups is not None:
+            self.landmark_groups = np.asarray(landmark_groups)
+        elif not self.nb_landmarks or self.nb_landmarks >= nb_samples:
+            self.landmark_groups = None
+            self.landmark_index = None
+            return
+
+        elif self.landmark_method == 'kmeans':
+            from sklearn.cluster import KMeans
+
+            kmeans = KMeans(n_clusters=self.nb_landmarks, n_init=3,
+                            random_state=self.seed)
+            self.landmark_groups = kmeans.fit_predict(np.asarray(dataset))
+
+        else:
+            if self.landmark_method == 'random':
+                index = np.random.RandomState(self.seed).choice(
+                    nb_samples, self.nb_landmarks, replace=False)
+            elif self.landmark_method == 'survival':
+                if survival is None or len(survival) != nb_samples:
+                    raise(Exception("Error! the survival of the {0} reference samples"\
+                                    " is needed for the survival landmarks".format(nb_samples)))
+
+                days, events = survival.time, survival.event
+                order = np.lexsort((days, events))
+                index = order[np.linspace(0, nb_samples - 1, self.nb_landmarks).round().astype(int)]
+            else:
+                raise(Exception("Error! unknown landmark method: {0}".format(
+                    self.landmark_method)))
+
+            self.landmark_groups = np.full(nb_samples, -1)
+            self.landmark_groups[np.sort(index)] = np.arange(self.nb_landmarks)
+
+        if self.landmark_method == 'kmeans':
+            self.landmark_index = None
+        else:
+            self.landmark_index = np.flatnonzero(self.landmark_groups >= 0)
+            self.landmark_index = self.landmark_index[
+                np.argsort(self.landmark_groups[self.landmark_index])]
+
+    def _landmark_matrix(self, dataset):
+        """
+        return the landmarks: the selected rows of dataset, or the averaged
+        rows of each kmeans cluster
+        """
+        if self.landmark_index is not None:
+            return np.asarray(dataset)[self.landmark_index]
+
+        groups = self.landmark_groups
+        used = np.flatnonzero(groups >= 0)
+
+        indicator = csr_matrix((np.ones(len(used)), (groups[used], used)),
+                               shape=(self.nb_landmarks, len(groups)))
+        counts = np.asarray(indicator.sum(axis=1))
+
+        return np.asarray(indicator.dot(np.asarray(dataset))) / counts
+
+    def _get_dtype(self, dataset):
+        """ """
+        if self.dtype is not None:
+            return np.dtype(self.dtype)
+
+        if np.issubdtype(dataset.dtype, np.floating):
+            return dataset.dtype
+
+        return np.dtype('float64')
+
+    def _center_and_normalize(self, dataset, dtype):
+        """
+        centre the rows of dataset and divide them by their norm
+        """
+        dataset = np.asarray(dataset)
+        normalized = np.empty(dataset.shape, dtype=dtype)
+
+        for chunk in _iter_row_chunks(dataset, self.chunk_size):
+            block = dataset[chunk].astype(normalized.dtype, order='C')
+            block -= block.mean(axis=1, keepdims=True)
+            norm = np.sqrt(np.einsum('ij,ij->i', block, block))
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                normalized[chunk] = block / norm[:, None]
+
+        return normalized
+
+    def _correlate(self, normalized):
+        """
+        blocked product of the normalized rows with the normalized reference
+        """
+        ref = self._normalized_ref
+        correlations = np.empty((len(normalized), len(ref)), dtype=ref.dtype)
+        nb_rows = max(1, self.chunk_size // max(1, len(ref), normalized.shape[1]))
+
+        for start in range(0, len(normalized), nb_rows):
+            chunk = slice(start, start + nb_rows)
+            np.dot(normalized[chunk], ref.T, out=correlations[chunk])
+
+        return correlations
 
 
 class RankCorrNorm():
@@ -180,6 +457,81 @@ class RankCorrNorm():
         self.dataset = dataset
 
 
+class Survival():
+    """
+    survival of a set of samples, stored as two contiguous arrays: the
+    survival times (float64) and the events (int8, 1 if the event occurred)
+    """
+    def __init__(self, time, event):
+        """ """
+        self.time = np.ascontiguousarray(time, dtype=np.float64).reshape(-1)
+        self.event = np.ascontiguousarray(event, dtype=np.int8).reshape(-1)
+
+        assert(len(self.time) == len(self.event))
+
+        self._design = None
+
+    @property
+    def design(self):
+        """
+        SurvivalDesign (sort order and risk sets) of the samples, built
+        once and shared by the survival tests
+        """
+        if self._design is None:
+            self._design = SurvivalDesign(self.event, self.time)
+
+        return self._design
+
+    @staticmethod
+    def from_records(records):
+        """
+        records: sequence of (time, event) pairs, or (n_samples, 2) array
+        """
+        records = np.asarray(records, dtype=np.float64).reshape(-1, 2)
+
+        return Survival(records[:, 0], records[:, 1])
+
+    @staticmethod
+    def unknown(nb_samples):
+        """
+        survival of samples without survival data (NaN times)
+        """
+        return Survival(np.full(nb_samples, np.nan), np.zeros(nb_samples))
+
+    @staticmethod
+    def concatenate(survivals):
+        """ """
+        survivals = list(survivals)
+
+        return Survival(np.concatenate([surv.time for surv in survivals]),
+                        np.concatenate([surv.event for surv in survivals]))
+
+    def __getitem__(self, index):
+        """
+        survival of the samples at index
+        """
+        return Survival(self.time[index], self.event[index])
+
+    def __len__(self):
+        """ """
+        return len(self.time)
+
+    def __array__(self, dtype=None):
+        """
+        (n_samples, 2) array of the times and events
+        """
+        array = np.column_stack([self.time, self.event])
+
+        if dtype is not None:
+            array = array.astype(dtype, copy=False)
+
+        return array
+
+    def copy(self):
+        """ """
+        return Survival(self.time.copy(), self.event.copy())
+
+
 def load_survival_file(f_name,
                        path_data=PATH_DATA,
                        sep=DEFAULTSEP,
@@ -195,7 +547,7 @@ def load_survival_file(f_name,
     if not isfile(filename):
         raise Exception('## Error wirh unexisting file: {0}'.format(filename))
 
-    with open(filename, 'r') as f_surv:
+    with _open_file(filename) as f_surv:
         first_line = f_surv.readline().strip(' \n\r\t').split(sep)
         for field in survival_flag.values():
             try:
@@ -223,63 +575,856 @@ def load_survival_file(f_name,
     return survival
 
 
+def _object_index(ids):
+    """
+    return the pandas Index of object dtype of the ids
+    """
+    if isinstance(ids, (set, frozenset)):
+        ids = sorted(ids)
+
+    return pd.Index(list(ids), dtype=object)
+
+
+class SampleIndex():
+    """
+    ordered and hashable index of sample ids, backed by a pandas
+    Index, used to align matrices, survival and metadata of datasets.
+    As with FeatureIndex, the last occurrence of a duplicated sample id
+    is used for the lookups
+    """
+    def __init__(self, sample_ids):
+        """
+        """
+        if isinstance(sample_ids, SampleIndex):
+            self.index = sample_ids.index
+            self._lookup = sample_ids._lookup
+            self._hash = sample_ids._hash
+            return
+
+        self.index = _object_index(sample_ids)
+        self._lookup = None
+        self._hash = None
+
+        if not self.index.is_unique:
+            warnings.warn('duplicated sample ids: {0}... the last occurrence is used'.format(
+                self.index[self.index.duplicated()][:2].tolist()))
+
+    def __len__(self):
+        """ """
+        return len(self.index)
+
+    def __iter__(self):
+        """ """
+        return iter(self.index)
+
+    def __contains__(self, sample):
+        """ """
+        return sample in self.index
+
+    def __eq__(self, other):
+        """ """
+        return isinstance(other, SampleIndex) and self.index.equals(other.index)
+
+    def __ne__(self, other):
+        """ """
+        return not self == other
+
+    def __hash__(self):
+        """ """
+        if self._hash is None:
+            self._hash = hash(tuple(self.index))
+
+        return self._hash
+
+    def __repr__(self):
+        """ """
+        return 'SampleIndex({0} samples)'.format(len(self))
+
+    def tolist(self):
+        """ """
+        return self.index.tolist()
+
+    def _get_lookup(self):
+        """
+        return the unique sample ids, at their last position, and
+        these positions
+        """
+        if self._lookup is None:
+            if self.index.is_unique:
+                self._lookup = (self.index, np.arange(len(self.index)))
+            else:
+                to_keep = ~self.index.duplicated(keep='last')
+                self._lookup = (self.index[to_keep], np.flatnonzero(to_keep))
+
+        return self._lookup
+
+    def get_indexer(self, sample_ids):
+        """
+        return the positions of sample_ids in the index. With duplicated
+        ids, the last position is used
+        """
+        if isinstance(sample_ids, SampleIndex):
+            sample_ids = sample_ids.index
+        else:
+            sample_ids = _object_index(sample_ids)
+
+        lookup, positions = self._get_lookup()
+        index = lookup.get_indexer(sample_ids)
+
+        if (index == -1).any():
+            raise(Exception("Error! sample ids not found in the index: {0}...".format(
+                sample_ids[index == -1][:2].tolist())))
+
+        return positions[index]
+
+    def intersection(self, sample_ids):
+        """
+        return the SampleIndex of the samples also in sample_ids,
+        following the order of this index
+        """
+        if isinstance(sample_ids, SampleIndex):
+            sample_ids = sample_ids.index
+        else:
+            sample_ids = _object_index(sample_ids)
+
+        lookup, _ = self._get_lookup()
+
+        return SampleIndex(lookup[lookup.isin(sample_ids)])
+
+    def intersection_indexes(self, sample_ids):
+        """
+        return the positions of the common samples in this index and in
+        sample_ids, and the common SampleIndex
+        """
+        inter = self.intersection(sample_ids)
+
+        return self.get_indexer(inter), SampleIndex(sample_ids).get_indexer(inter), inter
+
+    def argsort(self):
+        """
+        return the positions ordering the sample ids alphabetically
+        """
+        return self.index.argsort()
+
+
+class FeatureIndex():
+    """
+    immutable and array-backed index of the feature ids of an omic, with a
+    vectorized lookup of the feature positions. Subsets and references
+    share the feature ids instead of copying them
+    """
+    def __init__(self, feature_ids):
+        """
+        """
+        if isinstance(feature_ids, FeatureIndex):
+            feature_ids = feature_ids.index
+
+        self.index = pd.Index(feature_ids, dtype=object)
+        self._lookup = None
+        self._hash = None
+
+    def __len__(self):
+        """ """
+        return len(self.index)
+
+    def __iter__(self):
+        """ """
+        return iter(self.index)
+
+    def __contains__(self, feature):
+        """ """
+        return feature in self.index
+
+    def __getitem__(self, item):
+        """
+        return a feature id for an integer position, and a FeatureIndex
+        for a slice or an array of positions
+        """
+        if isinstance(item, (int, np.integer)):
+            return self.index[item]
+
+        return FeatureIndex(self.index[item])
+
+    def __eq__(self, other):
+        """ """
+        if not isinstance(other, FeatureIndex):
+            try:
+                other = FeatureIndex(other)
+            except TypeError:
+                return False
+
+        return self.index.equals(other.index)
+
+    def __ne__(self, other):
+        """ """
+        return not self == other
+
+    def __hash__(self):
+        """ """
+        if self._hash is None:
+            self._hash = hash(tuple(self.index))
+
+        return self._hash
+
+    def __repr__(self):
+        """ """
+        return 'FeatureIndex({0} features)'.format(len(self))
+
+    def tolist(self):
+        """ """
+        return self.index.tolist()
+
+    def subset(self, index):
+        """
+        return the FeatureIndex of the features at the positions of index
+        """
+        return FeatureIndex(self.index[index])
+
+    def get_indexer(self, features):
+        """
+        return the positions of features in the index (-1 for the
+        missing features). With duplicated ids, the last position is used
+        """
+        if isinstance(features, FeatureIndex):
+            features = features.index
+        elif not isinstance(features, pd.Index):
+            features = pd.Index(list(features), dtype=object)
+
+        if self.index.is_unique:
+            return self.index.get_indexer(features)
+
+        if self._lookup is None:
+            to_keep = ~self.index.duplicated(keep='last')
+            self._lookup = (self.index[to_keep], np.flatnonzero(to_keep))
+
+        lookup, positions = self._lookup
+        index = lookup.get_indexer(features)
+
+        return np.where(index >= 0, positions[index], -1)
+
+    def get_loc(self, feature):
+        """
+        return the position of a feature
+        """
+        index = self.get_indexer([feature])[0]
+
+        if index == -1:
+            raise KeyError(feature)
+
+        return index
+
+    @staticmethod
+    def concatenate(feature_indexes):
+        """
+        return the FeatureIndex of the features of all the feature_indexes
+        """
+        feature_indexes = [FeatureIndex(features).index
+                           for features in feature_indexes]
+
+        if not feature_indexes:
+            return FeatureIndex([])
+
+        return FeatureIndex(feature_indexes[0].append(feature_indexes[1:]))
+
+
 def translate_index(original_ids, new_ids):
     """ """
-    index1d = {ids: pos for pos, ids in enumerate(original_ids)}
-
-    return np.asarray([index1d[sample] for sample in new_ids])
+    return SampleIndex(original_ids).get_indexer(new_ids)
 
 
 def return_intersection_indexes(ids_1, ids_2):
     """ """
-    index1d = {ids: pos for pos, ids in enumerate(ids_1)}
-    index2d = {ids: pos for pos, ids in enumerate(ids_2)}
-
-    inter = set(ids_1).intersection(ids_2)
+    index1, index2, inter = SampleIndex(ids_1).intersection_indexes(ids_2)
 
     if len(inter) == 0:
         raise(Exception("Error! No common sample index between: {0}... and {1}...".format(
             ids_1[:2], ids_2[:2])))
 
-    index1 = np.asarray([index1d[sample] for sample in inter])
-    index2 = np.asarray([index2d[sample] for sample in inter])
+    return index1, index2, inter.tolist()
+
+
+def to_dense(matrix):
+    """
+    return a dense array from a scipy sparse matrix (dense matrices are
+    returned unchanged)
+    """
+    if issparse(matrix):
+        return matrix.toarray()
+
+    return matrix
+
+
+def log2_1p(matrix):
+    """
+    log2(1 + matrix), keeping the sparsity of scipy sparse matrices
+    """
+    if issparse(matrix):
+        return matrix.log1p() / np.log(2)
+
+    return np.log2(1.0 + matrix)
+
+
+def vstack_matrices(matrices):
+    """
+    vstack dense or scipy sparse matrices
+    """
+    if any(issparse(matrix) for matrix in matrices):
+        return sparse_vstack(matrices, format='csr')
+
+    return vstack(matrices)
+
+
+def select_columns(matrix, index):
+    """
+    return the columns of matrix at the positions of index (negative
+    positions give columns of 0), with the NaN values replaced by 0.
+    The columns are taken directly into a single new array, and matrix
+    itself is returned if index keeps all its columns in order and it
+    does not contain NaN values
+    """
+    index = np.asarray(index, dtype=int)
+    missing = index < 0
+
+    if issparse(matrix):
+        if missing.any():
+            zeros = csr_matrix((matrix.shape[0], 1), dtype=matrix.dtype)
+            matrix = sparse_hstack([matrix, zeros], format='csr')
+            index = np.where(missing, matrix.shape[1] - 1, index)
+
+        matrix = csr_matrix(matrix)[:, index]
+        np.nan_to_num(matrix.data, copy=False)
+
+        return matrix
+
+    matrix = np.asarray(matrix)
+    is_float = np.issubdtype(matrix.dtype, np.floating)
+
+    if len(index) == matrix.shape[1] and \
+       (index == np.arange(len(index))).all():
+        if is_float and np.isnan(matrix).any():
+            return np.nan_to_num(matrix)
+
+        return matrix
+
+    out = np.empty((matrix.shape[0], len(index)), dtype=matrix.dtype)
+    np.take(matrix, np.where(missing, 0, index), axis=1, out=out)
+    out[:, missing] = 0
+
+    if is_float:
+        np.nan_to_num(out, copy=False)
+
+    return out
+
+
+class StackedMatrices(Mapping):
+    """
+    read-only dict of the matrices of several dicts (with the same keys)
+    stacked vertically. Each matrix is concatenated when it is first
+    accessed, then kept until one of its stacked matrices is replaced in
+    the dicts: the matrices of unused keys are never copied
+    """
+    def __init__(self, *arrays):
+        """
+        arrays: dicts of matrices stacked in this order
+        """
+        self.arrays = arrays
+        # key => (stacked matrices, concatenated matrix)
+        self._stacked = {}
+
+    def __getitem__(self, key):
+        """ """
+        matrices = [array[key] for array in self.arrays]
+
+        if key in self._stacked:
+            previous, stacked = self._stacked[key]
+
+            if all(matrix is matrix_prev
+                   for matrix, matrix_prev in zip(matrices, previous)):
+                return stacked
+
+        stacked = vstack_matrices(matrices)
+        self._stacked[key] = (matrices, stacked)
+
+        return stacked
+
+    def __iter__(self):
+        """ """
+        return iter(self.arrays[0])
+
+    def __len__(self):
+        """ """
+        return len(self.arrays[0])
+
+
+class MetadataEncoder():
+    """
+    encode a metadata frame into a numerical matrix: the categorical
+    (string) columns are one-hot encoded (one column for the binary ones)
+    and the numerical columns are robust scaled. The categories and the
+    scaling are fitted once (on the training metadata) and used to encode
+    any other frame with the same columns
+    """
+    def __init__(self):
+        """ """
+        self.keys = []
+        self.categories = {}
+        self.positions = {}
+        self.numeric_keys = []
+        self.scaler = None
+
+    def fit(self, frame):
+        """ """
+        self.keys = []
+        self.categories = {}
+        self.positions = {}
+        self.numeric_keys = []
+
+        for key in frame.keys():
+            self.positions[key] = len(self.keys)
+
+            if not _is_categorical(frame[key]):
+                self.numeric_keys.append(key)
+                self.keys.append(key)
+                continue
+
+            classes = np.unique(np.asarray(
+                frame[key].astype('string').dropna(), dtype=str))
+
+            if len(classes) > 2:
+                categories = classes
+            else:
+                # binary column: only the second class is encoded
+                categories = classes[1:]
+
+            self.categories[key] = categories
+            self.keys += ["{0}_{1}".format(key, category)
+                          for category in (categories if len(categories)
+                                           else classes)]
+
+        if self.numeric_keys:
+            self.scaler = RobustScaler().fit(
+                np.asarray(frame[self.numeric_keys], dtype=float))
+
+        return self
+
+    def fit_transform(self, frame):
+        """ """
+        return self.fit(frame).transform(frame)
+
+    def transform(self, frame):
+        """
+        encode frame into a single preallocated matrix. The categories
+        not seen in the fitted frame are encoded with 0
+        """
+        matrix = np.zeros((frame.shape[0], len(self.keys)))
+
+        for key, categories in self.categories.items():
+            codes = pd.Categorical(frame[key].astype('string'),
+                                   categories=categories).codes
+            rows = np.flatnonzero(codes >= 0)
+            matrix[rows, self.positions[key] + codes[rows]] = 1
+
+        if self.numeric_keys:
+            positions = [self.positions[key] for key in self.numeric_keys]
+            matrix[:, positions] = self.scaler.transform(
+                np.asarray(frame[self.numeric_keys], dtype=float))
 
-    return index1, index2, list(inter)
+        return pd.DataFrame(matrix, columns=self.keys, copy=False)
+
+
+def _is_categorical(column):
+    """ """
+    return str(column.dtype) == 'object' or str(column.dtype) == 'string'
 
 
 def convert_metadata_frame_to_matrix(frame):
     """ """
-    lbl = LabelBinarizer()
+    return MetadataEncoder().fit_transform(frame)
 
-    normed_matrix = np.zeros((frame.shape[0], 0))
-    keys = []
 
-    for key in frame.keys():
-        if str(frame[key].dtype) == 'object' or str(frame[key].dtype) == 'string':
-            matrix = lbl.fit_transform(frame[key].astype('string'))
-            if lbl.y_type_ == "binary":
-                keys += list(["{0}_{1}".format(key, lbl.classes_[lbl.pos_label])])
-            else:
-                keys += ["{0}_{1}".format(key, k) for k in lbl.classes_]
-        else:
-            rbs = RobustScaler()
-            matrix = np.asarray(frame[key]).reshape((frame.shape[0], 1))
-            matrix = rbs.fit_transform(matrix)
-            keys.append(key)
+def load_data_from_tsv(use_transpose=USE_INPUT_TRANSPOSE,
+                       path_cache=PATH_CACHE,
+                       cache_max_size=CACHE_MAX_SIZE,
+                       **kwargs):
+    """
+    Parse an input matrix file and return (sample_ids, feature_ids, matrix)
+    the file can be a tsv file (possibly compressed with gzip, bz2 or xz)
+    or a binary matrix (see _load_data_from_binary)
+    if sparse is True, the matrix is returned as a scipy CSR matrix
+    if nb_features is given, only the nb_features features with the highest
+    variance are kept in memory (the variances are computed in a first pass)
+    if path_cache is defined, the parsed matrix is saved in this folder
+    and memory-mapped from it for the next loadings of the same file
+    """
+    if _is_binary_format(kwargs.get('f_name', '')):
+        return _load_data_from_binary(use_transpose=use_transpose, **kwargs)
 
-        normed_matrix = hstack([normed_matrix, matrix])
+    if use_transpose:
+        func = _load_data_from_tsv_transposee
+    else:
+        func = _load_data_from_tsv
+
+    if not path_cache or kwargs.get('sparse'):
+        return func(**kwargs)
 
-    return pd.DataFrame(normed_matrix, columns=keys)
+    return _load_data_from_cache(func, path_cache, cache_max_size,
+                                 use_transpose=use_transpose, **kwargs)
 
 
-def load_data_from_tsv(use_transpose=USE_INPUT_TRANSPOSE, **kwargs):
+def _cache_fingerprint(use_transpose=USE_INPUT_TRANSPOSE,
+                       f_name='',
+                       key='',
+                       path_data=PATH_DATA,
+                       f_type=float,
+                       sep=DEFAULTSEP,
+                       nan_to_num=True,
+                       nb_features=0):
     """
+    return a key identifying an input file (path, size, modification time)
+    and the options used to parse it
     """
     if use_transpose:
-        return _load_data_from_tsv_transposee(**kwargs)
+        filename = path_data + f_name
+    else:
+        filename = '{0}/{1}'.format(path_data, f_name)
+
+    if f_name in SEPARATOR:
+        sep = SEPARATOR[f_name]
+
+    f_stat = stat(filename)
+
+    fingerprint = repr((
+        abspath(filename), f_stat.st_size, f_stat.st_mtime_ns,
+        bool(use_transpose), key, sep, np.dtype(f_type).str,
+        nan_to_num, MAX_FEATURE, nb_features))
+
+    return hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
+
+
+def _load_data_from_cache(func, path_cache, cache_max_size,
+                          use_transpose=USE_INPUT_TRANSPOSE, **kwargs):
+    """
+    load a matrix from the cache folder or parse it with func and cache it
+    """
+    digest = _cache_fingerprint(use_transpose=use_transpose, **kwargs)
+    paths = ['{0}/{1}{2}.npy'.format(path_cache, digest, suffix)
+             for suffix in ['', '_samples', '_features']]
+
+    if all(isfile(path) for path in paths):
+        try:
+            f_matrix = np.load(paths[0], mmap_mode='c').view(np.ndarray)
+            sample_ids = np.load(paths[1]).tolist()
+            feature_ids = np.load(paths[2]).tolist()
+
+            for path in paths:
+                utime(path)
+
+        except Exception as e:
+            print('#### cannot load cached matrix {0}: {1}'.format(paths[0], e))
+        else:
+            return sample_ids, feature_ids, f_matrix
+
+    sample_ids, feature_ids, f_matrix = func(**kwargs)
+
+    try:
+        if not isdir(path_cache):
+            makedirs(path_cache)
+
+        for path, array in zip(paths, [f_matrix,
+                                       np.asarray(sample_ids, dtype=str),
+                                       np.asarray(feature_ids, dtype=str)]):
+            path_tmp = '{0}.{1}.tmp'.format(path, getpid())
+
+            with open(path_tmp, 'wb') as f_npy:
+                np.save(f_npy, array)
+
+            replace(path_tmp, path)
+
+        _evict_cache(path_cache, cache_max_size)
+
+    except Exception as e:
+        print('#### cannot cache matrix in {0}: {1}'.format(path_cache, e))
+
+    return sample_ids, feature_ids, f_matrix
+
+
+def _evict_cache(path_cache, cache_max_size=CACHE_MAX_SIZE):
+    """
+    remove the least recently used matrices until the size of
+    the cache folder is below cache_max_size
+    """
+    entries = []
+    total_size = 0
+
+    for path in glob('{0}/*_samples.npy'.format(path_cache)):
+        digest = path[:-len('_samples.npy')]
+        paths = [digest + suffix for suffix in ['.npy', '_samples.npy', '_features.npy']]
+        paths = [path for path in paths if isfile(path)]
+
+        size = sum(getsize(path) for path in paths)
+        total_size += size
+        entries.append((max(getmtime(path) for path in paths), size, paths))
+
+    entries.sort(key=lambda x: x[0])
+
+    for last_used, size, paths in entries:
+        if total_size <= cache_max_size:
+            break
+
+        for path in paths:
+            remove(path)
+
+        total_size -= size
+
+
+def _open_file(filename, mode='r'):
+    """
+    open a text file, decompressed on the fly if its extension
+    is one of COMPRESSED_FORMATS
+    """
+    extension = splitext(filename)[1].lower()
+
+    if extension in COMPRESSED_FORMATS:
+        if 'b' not in mode:
+            mode += 't'
+
+        return COMPRESSED_FORMATS[extension].open(filename, mode)
+
+    return open(filename, mode)
+
+def _is_binary_format(f_name):
+    """
+    """
+    return splitext(f_name)[1].lower() in BINARY_FORMATS
+
+def _decode_ids(array):
+    """
+    """
+    return [ids.decode('utf-8') if isinstance(ids, bytes) else str(ids)
+            for ids in array]
+
+@contextmanager
+def _open_binary_matrix(filename, use_transpose=USE_INPUT_TRANSPOSE):
+    """
+    yield (sample_ids, feature_ids, matrix) from a binary matrix file.
+    For npy and HDF5 files, the matrix is not read yet (memory-mapped array
+    or h5py dataset) so that a subset of columns can be read first
+    """
+    extension = splitext(filename)[1].lower()
+
+    if extension in ['.parquet', '.feather']:
+        if extension == '.parquet':
+            frame = pd.read_parquet(filename)
+        else:
+            frame = pd.read_feather(filename)
+
+        if isinstance(frame.index, pd.RangeIndex):
+            frame = frame.set_index(frame.columns[0])
+
+        if use_transpose:
+            yield (_format_sample_name(_decode_ids(frame.columns)),
+                   _decode_ids(frame.index), frame.values.T)
+        else:
+            yield _decode_ids(frame.index), _decode_ids(frame.columns), frame.values
+
+    elif extension in ['.h5', '.hdf5']:
+        import h5py
+
+        with h5py.File(filename, 'r') as f_h5:
+            yield (_decode_ids(f_h5['sample_ids'][:]),
+                   _decode_ids(f_h5['feature_ids'][:]), f_h5['matrix'])
+
+    elif extension == '.npz':
+        with np.load(filename) as f_npz:
+            yield (_decode_ids(f_npz['sample_ids']),
+                   _decode_ids(f_npz['feature_ids']), f_npz['matrix'])
+
+    else:
+        prefix = filename[:-len(extension)]
+
+        yield (_decode_ids(np.load('{0}_samples.npy'.format(prefix))),
+               _decode_ids(np.load('{0}_features.npy'.format(prefix))),
+               np.load(filename, mmap_mode='r'))
+
+def _clean_block(block, f_type=float, nan_to_num=True):
+    """
+    copy a matrix block as a f_type array. nan and inf values are set to 0
+    if nan_to_num
+    """
+    block = np.array(block, dtype=f_type)
+
+    if nan_to_num:
+        block[np.isnan(block) | (block == np.inf)] = 0
+
+    return block
+
+def _load_data_from_binary(
+        f_name,
+        key,
+        path_data=PATH_DATA,
+        f_type=float,
+        sep=DEFAULTSEP,
+        nan_to_num=True,
+        nb_features=0,
+        sparse=False,
+        use_transpose=USE_INPUT_TRANSPOSE):
+    """
+    load a binary input matrix of samples x features:
+        * .npy: the matrix, with the ids in the <name>_samples.npy
+          and <name>_features.npy files
+        * .npz / .h5 / .hdf5: 'matrix', 'sample_ids' and 'feature_ids' arrays
+        * .parquet / .feather: table with the same layout as the tsv files
+          (features x samples if use_transpose)
+    """
+    filename = '{0}/{1}'.format(path_data, f_name)
+
+    with _open_binary_matrix(filename, use_transpose) as (
+            sample_ids, feature_ids, matrix):
+        feature_ids = ['{0}_{1}'.format(key, feature)
+                       for feature in feature_ids[:MAX_FEATURE]]
+        width = len(feature_ids)
+
+        if nb_features and nb_features < width:
+            nb_rows = max(1, PARSING_CHUNK_SIZE // width)
+            variances = _column_variances(
+                _clean_block(matrix[pos:pos + nb_rows, :width], f_type, nan_to_num)
+                for pos in range(0, len(sample_ids), nb_rows))
+            columns = _top_variance_index(variances, nb_features)
+
+            feature_ids = [feature_ids[column] for column in columns]
+            f_matrix = _clean_block(matrix[:, columns], f_type, nan_to_num)
+        else:
+            f_matrix = _clean_block(matrix[:, :width], f_type, nan_to_num)
+
+    if sparse:
+        f_matrix = csr_matrix(f_matrix)
+
+    assert(f_matrix.shape[1] == len(feature_ids))
+    assert(f_matrix.shape[0] == len(sample_ids))
+
+    return sample_ids, feature_ids, f_matrix
+
+def _count_lines(filename, buffer_size=2 ** 20):
+    """
+    count the number of lines of a file without parsing it
+    """
+    nb_lines = 0
+    last = b'\n'
+
+    with _open_file(filename, 'rb') as f_bin:
+        for buf in iter(lambda: f_bin.read(buffer_size), b''):
+            nb_lines += buf.count(b'\n')
+            last = buf[-1:]
+
+    if last != b'\n':
+        nb_lines += 1
+
+    return nb_lines
+
+def _read_first_lines(filename, sep, nb_lines=2):
+    """
+    return the first lines of a file, stripped and split as the tsv parsers do
+    """
+    lines = []
+
+    with _open_file(filename) as f_tsv:
+        for line in f_tsv:
+            lines.append(line.strip(sep + '\n').split(sep))
+
+            if len(lines) == nb_lines:
+                break
+
+    return lines
+
+def _iter_tsv_blocks(
+        filename,
+        nb_columns,
+        sep=DEFAULTSEP,
+        f_type=float,
+        nan_to_num=True,
+        chunk_size=PARSING_CHUNK_SIZE,
+        columns=None):
+    """
+    parse the rows of a tsv file (header excluded) per block of rows with
+    the numpy C parser. Yield (row ids, matrix block) tuples.
+    Only the first `nb_columns` columns (ids included) are parsed or,
+    if given, the `columns` positions of the matrix (ids excluded)
+    """
+    nb_rows = max(1, chunk_size // max(nb_columns, 1))
+
+    if columns is None:
+        usecols = range(1, nb_columns)
     else:
-        return _load_data_from_tsv(**kwargs)
+        usecols = [column + 1 for column in columns]
+
+    with _open_file(filename) as f_tsv:
+        f_tsv.readline()
+
+        while True:
+            lines = list(islice(f_tsv, nb_rows))
 
+            if not lines:
+                break
+
+            ids = [line.split(sep, 1)[0].strip('\n') for line in lines]
+
+            try:
+                block = np.loadtxt(lines, delimiter=sep, usecols=usecols,
+                                   comments=None, dtype=f_type, ndmin=2)
+            except ValueError:
+                block = _parse_tsv_lines(lines, nb_columns, sep, f_type, nan_to_num)
+
+                if columns is not None:
+                    block = block[:, columns]
+
+            if nan_to_num:
+                block[np.isnan(block) | (block == np.inf)] = 0
+
+            yield ids, block
+
+def _parse_tsv_lines(lines, nb_columns, sep, f_type=float, nan_to_num=True):
+    """
+    slow parsing of tsv lines containing non numerical values
+    """
+    f_matrix = []
+
+    for line in lines:
+        line = line.strip(sep + '\n').split(sep)[1:nb_columns]
+
+        if nan_to_num:
+            line = [0 if (l.isalpha() or not l) else l for l in line]
+
+        f_matrix.append(list(map(float, line)))
+
+    return np.array(f_matrix, dtype=f_type)
+
+def _column_variances(blocks):
+    """
+    compute the variance of each column of a matrix given per block of rows,
+    by merging the mean and sum of squares of the blocks (Chan et al.)
+    """
+    count, mean, m2 = 0, 0.0, 0.0
+
+    for block in blocks:
+        nb_rows = block.shape[0]
+        block_mean = block.mean(axis=0)
+        delta = block_mean - mean
+        total = count + nb_rows
+
+        mean = mean + delta * nb_rows / total
+        m2 = m2 + ((block - block_mean) ** 2).sum(axis=0) \
+            + delta ** 2 * count * nb_rows / total
+        count = total
+
+    return m2 / max(count, 1)
+
+def _top_variance_index(variances, nb_features):
+    """
+    return the sorted positions of the nb_features highest variances
+    """
+    index = np.argsort(-np.asarray(variances), kind='stable')[:nb_features]
+
+    return np.sort(index)
 
 def _load_data_from_tsv(
         f_name,
@@ -287,41 +1432,68 @@ def _load_data_from_tsv(
         path_data=PATH_DATA,
         f_type=float,
         sep=DEFAULTSEP,
-        nan_to_num=True):
+        nan_to_num=True,
+        nb_features=0,
+        sparse=False):
     """ """
     f_short = key
 
     if f_name in SEPARATOR:
         sep = SEPARATOR[f_name]
 
-    f_tsv = open("{0}/{1}".format(path_data, f_name))
-    header = f_tsv.readline().strip(sep + '\n').split(sep)
+    filename = "{0}/{1}".format(path_data, f_name)
+    lines = _read_first_lines(filename, sep)
+    header = lines[0]
 
     feature_ids = ['{0}_{1}'.format(f_short, head)
                    for head in header][:MAX_FEATURE]
-    sample_ids = []
-    f_matrix = []
 
-    for line in f_tsv:
-        line = line.strip(sep + '\n').split(sep)
-        sample_ids.append(line[0])
+    nb_columns = len(range(len(lines[-1]))[:MAX_FEATURE])
+    nb_rows = _count_lines(filename) - 1
+    width = max(nb_columns - 1, 0)
 
-        if nan_to_num:
-            line[1:] = [0 if (l.isalpha() or not l) else l
-                        for l in line[1:MAX_FEATURE]]
+    if width == len(feature_ids) - 1:
+        feature_ids = feature_ids[1:]
 
-        f_matrix.append(list(map(f_type, line[1:MAX_FEATURE])))
+    columns = None
 
-    f_matrix = np.array(f_matrix)
+    if nb_features and nb_features < width:
+        variances = _column_variances(
+            block for ids, block in _iter_tsv_blocks(
+                filename, nb_columns, sep=sep, f_type=f_type,
+                nan_to_num=nan_to_num))
+        columns = _top_variance_index(variances, nb_features)
 
-    if f_matrix.shape[1] == len(feature_ids) - 1:
-        feature_ids = feature_ids[1:]
+        width = len(columns)
+        feature_ids = [feature_ids[column] for column in columns]
+
+    sample_ids = []
+    blocks = []
+    pos = 0
+
+    if not sparse:
+        f_matrix = np.empty((nb_rows, width), dtype=f_type)
+
+    for ids, block in _iter_tsv_blocks(filename, nb_columns, sep=sep,
+                                       f_type=f_type, nan_to_num=nan_to_num,
+                                       columns=columns):
+        if sparse:
+            blocks.append(csr_matrix(block))
+        else:
+            f_matrix[pos:pos + len(ids)] = block
+
+        sample_ids += ids
+        pos += len(ids)
+
+    if sparse:
+        f_matrix = sparse_vstack(blocks + [csr_matrix((0, width), dtype=f_type)],
+                                 format='csr')
+    elif pos < nb_rows:
+        f_matrix = f_matrix[:pos]
 
     assert(f_matrix.shape[1] == len(feature_ids))
     assert(f_matrix.shape[0] == len(sample_ids))
 
-    f_tsv.close()
-
     return sample_ids, feature_ids, f_matrix
 
 def _format_sample_name(sample_ids):
@@ -338,20 +1510,41 @@ def _load_data_from_tsv_transposee(
         path_data=PATH_DATA,
         f_type=float,
         sep=DEFAULTSEP,
-        nan_to_num=True):
+        nan_to_num=True,
+        nb_features=0,
+        sparse=False):
     """ """
     if f_name in SEPARATOR:
         sep = SEPARATOR[f_name]
 
-    f_tsv = open(path_data + f_name)
-    header = f_tsv.readline().strip(sep + '\n').split(sep)
+    filename = path_data + f_name
+    header = _read_first_lines(filename, sep, nb_lines=1)[0]
 
     sample_ids = header[1:]
 
     sample_ids = _format_sample_name(sample_ids)
 
+    nb_rows = _count_lines(filename) - 1
+    nb_columns = len(sample_ids) + 1
+    to_keep = None
+
+    if nb_features and nb_features < nb_rows:
+        variances = np.concatenate([
+            block.var(axis=1) for ids, block in _iter_tsv_blocks(
+                filename, nb_columns, sep=sep, f_type=f_type,
+                nan_to_num=nan_to_num)])
+
+        to_keep = np.zeros(len(variances), dtype=bool)
+        to_keep[_top_variance_index(variances, nb_features)] = True
+        nb_rows = int(to_keep.sum())
+
     feature_ids = []
-    f_matrix = []
+    blocks = []
+    pos = 0
+    row = 0
+
+    if not sparse:
+        f_matrix = np.empty((len(sample_ids), nb_rows), dtype=f_type)
 
     if f_name.lower().count('entrez'):
         ensg_dict = load_entrezID_to_ensg()
@@ -359,31 +1552,45 @@ def _load_data_from_tsv_transposee(
     else:
         use_ensg = False
 
-    for line in f_tsv:
-        line = line.strip(sep + '\n').split(sep)
-        feature = line[0].strip('"')
+    index = []
 
-        if nan_to_num:
-            line[1:] = [0 if (l.isalpha() or not l) else l
-                        for l in line[1:]]
+    for ids, block in _iter_tsv_blocks(filename, nb_columns, sep=sep,
+                                       f_type=f_type, nan_to_num=nan_to_num):
+        if to_keep is not None:
+            keep = to_keep[row:row + len(ids)]
+            row += len(ids)
+            ids = [feature for feature, kept in zip(ids, keep) if kept]
+            block = block[keep]
 
-        if use_ensg and feature in ensg_dict:
-            features = ensg_dict[feature]
+        if sparse:
+            blocks.append(csr_matrix(block.T))
         else:
-            features = [feature]
+            f_matrix[:, pos:pos + len(ids)] = block.T
 
-        for feature in features:
-            feature_ids.append('{0}_{1}'.format(key, feature))
-            f_matrix.append(list(map(f_type, line[1:])))
+        for ids_pos, feature in enumerate(ids):
+            feature = feature.strip('"')
 
+            if use_ensg and feature in ensg_dict:
+                features = ensg_dict[feature]
+            else:
+                features = [feature]
+
+            for feature in features:
+                feature_ids.append('{0}_{1}'.format(key, feature))
+                index.append(pos + ids_pos)
+
+        pos += len(ids)
+
+    if sparse:
+        f_matrix = sparse_hstack(
+            blocks + [csr_matrix((len(sample_ids), 0), dtype=f_type)], format='csr')
 
-    f_matrix = np.array(f_matrix).T
+    if len(index) != pos or (not sparse and pos < nb_rows):
+        f_matrix = f_matrix[:, index]
 
     assert(f_matrix.shape[1] == len(feature_ids))
     assert(f_matrix.shape[0] == len(sample_ids))
 
-    f_tsv.close()
-
     return sample_ids, feature_ids, f_matrix
 
 def select_best_classif_params(clf):
@@ -417,6 +1624,11 @@ def load_entrezID_to_ensg():
 
     return entrez_dict
 
+def _process_parallel_load_data(inp):
+    """
+    """
+    return load_data_from_tsv(**inp)
+
 def _process_parallel_coxph(inp):
     """
     """
@@ -435,15 +1647,30 @@ def _process_parallel_cindex(inp):
     """
     (node_id,
      act_ref, isdead_ref, nbdays_ref,
-     act_test, isdead_test, nbdays_test, use_r_packages) = inp
+     act_test, isdead_test, nbdays_test, use_r_packages, design) = inp
 
     score = c_index(act_ref, isdead_ref, nbdays_ref,
                     act_test, isdead_test, nbdays_test,
-                    use_r_packages=use_r_packages
+                    use_r_packages=use_r_packages,
+                    design=design,
                     )
 
     return node_id, score
 
+def _process_parallel_cindex_columns(inp):
+    """
+    """
+    (node_ids,
+     act_ref, isdead_ref, nbdays_ref,
+     act_test, isdead_test, nbdays_test, design, design_test) = inp
+
+    scores = c_index_columns(act_ref, isdead_ref, nbdays_ref,
+                             act_test, isdead_test, nbdays_test,
+                             design=design,
+                             design_test=design_test)
+
+    return list(zip(node_ids, scores))
+
 def _process_parallel_feature_importance(inp):
     """
     """
@@ -489,14 +1716,15 @@ def _process_parallel_survival_feature_importance_per_cluster(inp):
     """
 
     feature, array, survival, metadata_mat, pval_thres, use_r_packages = inp
-    nbdays, isdead = survival.T.tolist()
 
     pvalue = coxph(
         array,
-        isdead,
-        nbdays,
+        survival.event,
+        survival.time,
         metadata_mat=metadata_mat,
-        use_r_packages=use_r_packages
+        use_r_packages=use_r_packages,
+        design=survival.design,
+        labels_test='coxph',
     )
 
     if not np.isnan(pvalue) and pvalue < pval_thres:
@@ -17,6 +17,28 @@ from os import remove
 from shutil import rmtree
 
 
+def _load_example_dataset(**kwargs):
+    """
+    load and normalize the training and test fold matrices of the example data
+    """
+    from simdeep.extract_data import LoadData
+
+    dataset = LoadData(
+        path_data='{0}/../examples/data/'.format(split(abspath(__file__))[0]),
+        survival_tsv='survival_dummy.tsv',
+        training_tsv={'RNA': 'rna_dummy.tsv', 'METH': 'meth_dummy.tsv',
+                      'MIR': 'mir_dummy.tsv'},
+        verbose=False,
+        **kwargs)
+
+    dataset.load_training_samples()
+    dataset.create_a_cv_split()
+    dataset.normalize_training_array()
+    dataset.load_matrix_test_fold()
+
+    return dataset
+
+
 class TestPackage(unittest.TestCase):
     """ """
     def test_1_coxph_function(self):
@@ -33,6 +55,848 @@ class TestPackage(unittest.TestCase):
         self.assertTrue(isinstance(pvalue, float))
         self.assertTrue(pvalue < 0.05)
 
+    def test_2_load_data_from_tsv(self):
+        """test the bulk parsing of a tsv matrix with missing values"""
+        from simdeep.survival_utils import load_data_from_tsv
+        from tempfile import mkdtemp
+
+        path_data = mkdtemp()
+
+        with open('{0}/matrix.tsv'.format(path_data), 'w') as f_tsv:
+            f_tsv.write('Samples\tg1\tg2\tg3\n')
+            f_tsv.write('s1\t1.0\tNA\t3\n')
+            f_tsv.write('s2\t\t2.5\t-1e-3\n')
+
+        sample_ids, feature_ids, matrix = load_data_from_tsv(
+            f_name='matrix.tsv', key='RNA', path_data=path_data)
+
+        top_variance = load_data_from_tsv(
+            f_name='matrix.tsv', key='RNA', path_data=path_data,
+            nb_features=2)
+
+        sparse = load_data_from_tsv(
+            f_name='matrix.tsv', key='RNA', path_data=path_data,
+            sparse=True)
+
+        rmtree(path_data)
+
+        self.assertEqual(sample_ids, ['s1', 's2'])
+        self.assertEqual(feature_ids, ['RNA_g1', 'RNA_g2', 'RNA_g3'])
+        self.assertTrue(np.array_equal(
+            matrix, np.array([[1.0, 0.0, 3.0], [0.0, 2.5, -1e-3]])))
+
+        self.assertEqual(top_variance[1], ['RNA_g2', 'RNA_g3'])
+        self.assertTrue(np.array_equal(top_variance[2], matrix[:, 1:]))
+
+        self.assertTrue(np.array_equal(sparse[2].toarray(), matrix))
+
+    def test_3_load_data_from_compressed_and_binary_files(self):
+        """test that the compressed and binary inputs match the tsv one"""
+        from simdeep.survival_utils import load_data_from_tsv
+        from tempfile import mkdtemp
+        import gzip
+
+        path_data = mkdtemp()
+
+        with gzip.open('{0}/matrix.tsv.gz'.format(path_data), 'wt') as f_tsv:
+            f_tsv.write('Samples\tg1\tg2\n')
+            f_tsv.write('s1\t1.0\t2.0\n')
+            f_tsv.write('s2\t3.0\tNA\n')
+
+        sample_ids, feature_ids, matrix = load_data_from_tsv(
+            f_name='matrix.tsv.gz', key='RNA', path_data=path_data)
+
+        np.savez('{0}/matrix.npz'.format(path_data),
+                 matrix=np.array([[1.0, 2.0], [3.0, np.nan]]),
+                 sample_ids=['s1', 's2'], feature_ids=['g1', 'g2'])
+
+        binary = load_data_from_tsv(
+            f_name='matrix.npz', key='RNA', path_data=path_data)
+
+        rmtree(path_data)
+
+        self.assertEqual(sample_ids, ['s1', 's2'])
+        self.assertEqual(feature_ids, ['RNA_g1', 'RNA_g2'])
+        self.assertTrue(np.array_equal(matrix, [[1.0, 2.0], [3.0, 0.0]]))
+
+        self.assertEqual(binary[0], sample_ids)
+        self.assertEqual(binary[1], feature_ids)
+        self.assertTrue(np.array_equal(binary[2], matrix))
+
+    def test_3_load_data_from_cache(self):
+        """test that a cached matrix is identical to the parsed one"""
+        from simdeep.survival_utils import load_data_from_tsv
+        from tempfile import mkdtemp
+        from glob import glob
+
+        path_data = mkdtemp()
+        path_cache = '{0}/cache/'.format(path_data)
+
+        with open('{0}/matrix.tsv'.format(path_data), 'w') as f_tsv:
+            f_tsv.write('Samples\tg1\tg2\n')
+            f_tsv.write('s1\t1.0\t2.0\n')
+            f_tsv.write('s2\t3.0\tNA\n')
+
+        parsed = load_data_from_tsv(
+            f_name='matrix.tsv', key='RNA', path_data=path_data,
+            path_cache=path_cache)
+        nb_files = len(glob('{0}/*.npy'.format(path_cache)))
+        cached = load_data_from_tsv(
+            f_name='matrix.tsv', key='RNA', path_data=path_data,
+            path_cache=path_cache)
+
+        rmtree(path_data)
+
+        self.assertEqual(nb_files, 3)
+        self.assertEqual(parsed[0], cached[0])
+        self.assertEqual(parsed[1], cached[1])
+        self.assertTrue(np.array_equal(parsed[2], cached[2]))
+
+    def test_3_evict_cache(self):
+        """test that the least recently used matrix is removed from the cache"""
+        from simdeep.survival_utils import load_data_from_tsv
+        from simdeep.survival_utils import _cache_fingerprint
+        from tempfile import mkdtemp
+        from glob import glob
+        from os import utime
+        from os.path import getsize
+        from time import time
+
+        path_data = mkdtemp()
+        path_cache = '{0}/cache/'.format(path_data)
+
+        for name in ['a', 'b', 'c']:
+            with open('{0}/{1}.tsv'.format(path_data, name), 'w') as f_tsv:
+                f_tsv.write('Samples\tg1\tg2\n')
+                f_tsv.write('s1\t1.0\t2.0\n')
+                f_tsv.write('s2\t3.0\t4.0\n')
+
+        def load(name, cache_max_size):
+            load_data_from_tsv(f_name='{0}.tsv'.format(name), key='RNA',
+                               path_data=path_data, path_cache=path_cache,
+                               cache_max_size=cache_max_size)
+
+            return glob('{0}/{1}*.npy'.format(
+                path_cache, _cache_fingerprint(f_name='{0}.tsv'.format(name),
+                                               key='RNA', path_data=path_data)))
+
+        paths_a = load('a', 2 ** 30)
+        entry_size = sum(getsize(path) for path in paths_a)
+        cache_max_size = 2 * entry_size
+        paths_b = load('b', cache_max_size)
+
+        now = time()
+
+        for paths, last_used in [(paths_a, now - 100), (paths_b, now - 50)]:
+            for path in paths:
+                utime(path, (last_used, last_used))
+
+        # a cache hit refreshes the entry of a: b is the least recently used
+        self.assertEqual(load('a', cache_max_size), paths_a)
+        paths_c = load('c', cache_max_size)
+
+        remaining = glob('{0}/*.npy'.format(path_cache))
+
+        rmtree(path_data)
+
+        self.assertEqual(len(paths_c), 3)
+        self.assertEqual(sorted(remaining), sorted(paths_a + paths_c))
+
+    def test_3_sample_index(self):
+        """test the alignment of sample ids with SampleIndex"""
+        from simdeep.survival_utils import SampleIndex
+        from simdeep.survival_utils import return_intersection_indexes
+
+        index = SampleIndex(['s3', 's1', 's2'])
+
+        self.assertEqual(index.get_indexer(['s2', 's3']).tolist(), [2, 0])
+        self.assertEqual(index.intersection({'s1', 's3', 's4'}).tolist(),
+                         ['s3', 's1'])
+        self.assertEqual(index, SampleIndex(['s3', 's1', 's2']))
+        self.assertEqual(hash(index), hash(SampleIndex(['s3', 's1', 's2'])))
+
+        index1, index2, inter = return_intersection_indexes(
+            ['s3', 's1', 's2'], ['s1', 's4', 's3'])
+
+        self.assertEqual(inter, ['s3', 's1'])
+        self.assertEqual(index1.tolist(), [0, 1])
+        self.assertEqual(index2.tolist(), [2, 0])
+
+        with self.assertRaises(Exception):
+            index.get_indexer(['s4'])
+
+        # as the dict lookups replaced by SampleIndex, the last occurrence
+        # of a duplicated sample id is used
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            duplicated = SampleIndex(['s3', 's1', 's3', 's2'])
+
+        self.assertEqual(len(caught), 1)
+        self.assertEqual(len(duplicated), 4)
+        self.assertEqual(duplicated.get_indexer(['s3', 's2', 's3']).tolist(),
+                         [2, 3, 2])
+        self.assertEqual(duplicated.intersection(['s3', 's2']).tolist(),
+                         ['s3', 's2'])
+
+        index1, index2, inter = return_intersection_indexes(
+            ['s3', 's1', 's3'], ['s1', 's3'])
+
+        self.assertEqual(inter, ['s1', 's3'])
+        self.assertEqual(index1.tolist(), [1, 2])
+        self.assertEqual(index2.tolist(), [0, 1])
+
+    def test_3_load_data_in_parallel(self):
+        """test that the omics parsed in parallel give the same dataset"""
+        dataset = _load_example_dataset()
+        parallel = _load_example_dataset(nb_threads_loading=3)
+
+        self.assertEqual(parallel.sample_ids, dataset.sample_ids)
+        self.assertTrue(np.array_equal(parallel.survival.time, dataset.survival.time))
+
+        for key in dataset.matrix_array:
+            self.assertEqual(list(parallel.feature_array[key]),
+                             list(dataset.feature_array[key]))
+            self.assertTrue(np.array_equal(parallel.matrix_array[key],
+                                           dataset.matrix_array[key]))
+            self.assertTrue(np.array_equal(parallel.matrix_train_array[key],
+                                           dataset.matrix_train_array[key]))
+            self.assertTrue(np.array_equal(parallel.matrix_cv_array[key],
+                                           dataset.matrix_cv_array[key]))
+
+    def test_3_load_data_float32(self):
+        """test that the float32 matrices give the same normalized dataset"""
+        from simdeep.config import NORMALIZATION
+
+        # the ranks of the correlations are left out: float32 does not
+        # separate their ties as float64 does
+        normalization = dict(NORMALIZATION, TRAIN_CORR_RANK_NORM=False)
+
+        dataset = _load_example_dataset(normalization=normalization)
+        single = _load_example_dataset(normalization=normalization,
+                                       dtype='float32')
+
+        for key in dataset.matrix_array:
+            self.assertEqual(single.matrix_array[key].dtype, np.float32)
+            self.assertEqual(single.matrix_train_array[key].dtype, np.float32)
+            self.assertTrue(np.allclose(single.matrix_array[key],
+                                        dataset.matrix_array[key]))
+            self.assertTrue(np.allclose(single.matrix_train_array[key],
+                                        dataset.matrix_train_array[key],
+                                        atol=1e-5))
+            self.assertTrue(np.allclose(single.matrix_cv_array[key],
+                                        dataset.matrix_cv_array[key],
+                                        atol=1e-5))
+
+    def test_3_load_data_sparse(self):
+        """test that the sparse omics give the same normalized dataset"""
+        from scipy.sparse import issparse
+
+        dataset = _load_example_dataset()
+        sparse = _load_example_dataset(sparse_omics=['RNA', 'METH', 'MIR'])
+
+        for key in dataset.matrix_array:
+            self.assertTrue(issparse(sparse.matrix_array[key]))
+            self.assertTrue(np.array_equal(sparse.matrix_array[key].toarray(),
+                                           dataset.matrix_array[key]))
+            self.assertTrue(np.allclose(sparse.matrix_train_array[key],
+                                        dataset.matrix_train_array[key]))
+            self.assertTrue(np.allclose(sparse.matrix_cv_array[key],
+                                        dataset.matrix_cv_array[key]))
+
+    def test_3_shared_dataset(self):
+        """
+        test that the instances of a boosting parse the input files once
+        and that the shared dataset is sent to the ray workers by reference
+        """
+        from unittest import mock
+        from simdeep import extract_data
+        from simdeep.simdeep_boosting import SimDeepBoosting
+        from simdeep.simdeep_distributed import SimDeepDistributed
+
+        with mock.patch.object(extract_data, 'load_data_from_tsv',
+                               wraps=extract_data.load_data_from_tsv) as parser:
+            boosting = SimDeepBoosting(
+                nb_it=2,
+                distribute=True,
+                survival_tsv='survival_dummy.tsv',
+                training_tsv={'RNA': 'rna_dummy.tsv', 'METH': 'meth_dummy.tsv',
+                              'MIR': 'mir_dummy.tsv'},
+                path_data='{0}/../examples/data/'.format(split(abspath(__file__))[0]),
+                project_name='TestProjectShared',
+                normalization={'TRAIN_CORR_REDUCTION': True},
+                seed=3)
+
+            shared = boosting.shared_dataset
+            shared.load_shared_training_samples()
+            matrix_array = {key: matrix.copy()
+                            for key, matrix in shared.matrix_array.items()}
+
+            for dataset in boosting.datasets:
+                dataset.load_training_samples()
+                dataset.create_a_cv_split()
+                dataset.normalize_training_array()
+                dataset.load_matrix_test_fold()
+
+        self.assertEqual(parser.call_count, len(shared.training_tsv))
+
+        for key in matrix_array:
+            self.assertTrue(np.array_equal(shared.matrix_array[key],
+                                           matrix_array[key]))
+
+            for dataset in boosting.datasets:
+                self.assertEqual(len(dataset.matrix_train_array[key]) +
+                                 len(dataset.matrix_cv_array[key]),
+                                 len(matrix_array[key]))
+
+        ref = mock.sentinel.shared_dataset_ref
+        dispatched = []
+
+        def remote(dataset, **kwargs):
+            dispatched.append(dataset._shared_dataset)
+            return mock.Mock()
+
+        with mock.patch('ray.is_initialized', return_value=True), \
+             mock.patch('ray.put', return_value=ref) as put, \
+             mock.patch('ray.get', side_effect=lambda refs: [True] * len(refs)), \
+             mock.patch.object(SimDeepDistributed, 'remote', side_effect=remote):
+            boosting.fit()
+
+        put.assert_called_once_with(shared)
+        self.assertEqual(dispatched, [ref] * len(boosting.datasets))
+
+        for dataset in boosting.datasets:
+            self.assertIs(dataset._shared_dataset, shared)
+
+        def remote_error(dataset, **kwargs):
+            raise RuntimeError('dispatch error')
+
+        with mock.patch('ray.is_initialized', return_value=True), \
+             mock.patch('ray.put', return_value=ref), \
+             mock.patch.object(SimDeepDistributed, 'remote',
+                               side_effect=remote_error):
+            self.assertRaises(RuntimeError, boosting.fit)
+
+        for dataset in boosting.datasets:
+            self.assertIs(dataset._shared_dataset, shared)
+
+    def test_3_reorder_matrix_array(self):
+        """test that a reordered subset of samples keeps its metadata aligned"""
+        from simdeep.extract_data import LoadData
+
+        PATH_DATA = '{0}/../examples/data/'.format(split(abspath(__file__))[0])
+
+        dataset = LoadData(path_data=PATH_DATA,
+                           survival_tsv='survival_dummy.tsv',
+                           training_tsv={'RNA': 'rna_dummy.tsv'},
+                           metadata_tsv='metadata_dummy.tsv',
+                           cross_validation_instance=None,
+                           verbose=False)
+        dataset.load_training_samples()
+
+        sample_ids = dataset.sample_ids[::-2]
+        dataset.reorder_matrix_array(sample_ids)
+
+        self.assertEqual(dataset.matrix_array['RNA'].shape[0], len(sample_ids))
+        self.assertEqual(dataset.metadata_frame.index.tolist(), sample_ids)
+        self.assertTrue(dataset.metadata_mat.equals(
+            dataset.metadata_encoder.transform(dataset.metadata_frame)))
+
+    def test_3_feature_index(self):
+        """test the vectorized lookup of FeatureIndex"""
+        from simdeep.survival_utils import FeatureIndex
+
+        index = FeatureIndex(['RNA_g1', 'RNA_g2', 'RNA_g3'])
+        subset = index.subset([2, 0])
+
+        self.assertEqual(index.get_indexer(['RNA_g3', 'RNA_g4']).tolist(), [2, -1])
+        self.assertEqual(subset, ['RNA_g3', 'RNA_g1'])
+        self.assertEqual(subset.get_loc('RNA_g1'), 1)
+        self.assertEqual(index[1], 'RNA_g2')
+        self.assertEqual(FeatureIndex.concatenate([index, subset]).tolist(),
+                         ['RNA_g1', 'RNA_g2', 'RNA_g3', 'RNA_g3', 'RNA_g1'])
+
+    def test_3_rank_norm_and_mad_scaler(self):
+        """test the row-wise RankNorm and MadScaler against per-row loops"""
+        from scipy.stats import rankdata
+        from simdeep.survival_utils import RankNorm
+        from simdeep.survival_utils import MadScaler
+
+        np.random.seed(5)
+        # tied values, a constant row and a missing value
+        matrix = np.random.randint(0, 4, (7, 6)).astype(float)
+        matrix[2] = 1.0
+        matrix[4, 3] = np.nan
+        copy = matrix.copy()
+
+        ranks = np.array([rankdata(row) for row in matrix]) / 6.0
+        scaled = []
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for row in matrix:
+                med = np.median(row)
+                scaled.append((row - med) / np.median(np.abs(row - med)))
+
+        scaled = np.nan_to_num(np.array(scaled))
+
+        # one chunk, then chunks of two rows
+        for chunk_size in [2 ** 23, 12]:
+            self.assertTrue(np.array_equal(
+                RankNorm(chunk_size=chunk_size).fit_transform(matrix), ranks,
+                equal_nan=True))
+            self.assertTrue(np.allclose(
+                MadScaler(chunk_size=chunk_size).fit_transform(matrix), scaled))
+
+        self.assertTrue(np.array_equal(matrix, copy, equal_nan=True))
+
+        ranked = RankNorm(inplace=True, chunk_size=12).fit_transform(copy)
+        self.assertIs(ranked, copy)
+        self.assertTrue(np.array_equal(ranked, ranks, equal_nan=True))
+
+        copy = matrix.copy()
+        mad_scaled = MadScaler(inplace=True, chunk_size=12).fit_transform(copy)
+        self.assertIs(mad_scaled, copy)
+        self.assertTrue(np.allclose(mad_scaled, scaled))
+
+    def test_3_variance_reducer(self):
+        """test the features kept by VarianceReducer, ties in column order"""
+        from simdeep.survival_utils import VarianceReducer
+        from scipy.sparse import csr_matrix
+
+        np.random.seed(6)
+        matrix = np.random.randint(0, 3, (30, 40)).astype(float)
+
+        variances = [np.var(column) for column in matrix.T]
+        expected = [pos for pos, var in sorted(
+            enumerate(variances), reverse=True, key=lambda x:x[1])][:10]
+
+        # blocks of 3 columns
+        reducer = VarianceReducer(10, chunk_size=90)
+        reducer.fit(matrix)
+
+        self.assertEqual(reducer.index_to_keep, expected)
+        self.assertTrue(np.array_equal(reducer.transform(matrix),
+                                       matrix[:, expected]))
+
+        reducer = VarianceReducer(10)
+        reducer.fit(csr_matrix(matrix))
+        self.assertEqual(set(reducer.index_to_keep), set(expected))
+
+    def test_3_correlation_reducer(self):
+        """test the blocked correlations of CorrelationReducer"""
+        from simdeep.survival_utils import CorrelationReducer
+        from sklearn.metrics import pairwise_distances
+
+        ref = np.random.random((30, 20))
+        matrix = np.random.random((10, 20))
+
+        reducer = CorrelationReducer(chunk_size=100)
+        reducer.fit(ref)
+
+        self.assertTrue(np.allclose(
+            reducer.transform(matrix),
+            1.0 - pairwise_distances(matrix, ref, 'correlation')))
+
+        landmark_reducer = CorrelationReducer(nb_landmarks=5, seed=1)
+        reduced = landmark_reducer.fit_transform(ref)
+
+        self.assertEqual(reduced.shape, (30, 5))
+        self.assertTrue(np.allclose(
+            reduced, reducer.transform(ref)[:, landmark_reducer.landmark_index]))
+
+    def test_3_normalization_pipeline(self):
+        """test that a fitted and pickled pipeline transforms new matrices"""
+        from simdeep.extract_data import NormalizationPipeline
+        from simdeep.config import NORMALIZATION
+        import pickle
+
+        ref = np.random.random((30, 200))
+        matrix = np.random.random((10, 200))
+
+        pipeline = NormalizationPipeline(NORMALIZATION)
+        ref_norm = pipeline.fit_transform(ref)
+        loaded = pickle.loads(pickle.dumps(pipeline))
+
+        self.assertEqual(ref_norm.shape, (30, 30))
+        self.assertTrue(pipeline.is_fitted_on(ref, NORMALIZATION))
+        self.assertFalse(pipeline.is_fitted_on(ref.copy(), NORMALIZATION))
+        self.assertFalse(loaded.is_fitted_on(ref, NORMALIZATION))
+        self.assertTrue(np.allclose(loaded.transform(matrix),
+                                    pipeline.transform(matrix)))
+        self.assertTrue(np.allclose(loaded.transform(ref, reference=True),
+                                    ref_norm))
+
+        # row-wise steps computed once for all the samples
+        norm = {'TRAIN_MIN_MAX': True, 'TRAIN_RANK_NORM': True,
+                'TRAIN_CORR_REDUCTION': True}
+        pipeline = NormalizationPipeline(norm)
+        rows = pipeline.transform_rows(np.vstack([ref, matrix]))
+
+        self.assertEqual(pipeline.row_wise_steps(),
+                         ['TRAIN_MIN_MAX', 'TRAIN_RANK_NORM'])
+        self.assertTrue(np.allclose(
+            pipeline.fit_transform(ref, matrix_rows=rows[:30]),
+            NormalizationPipeline(norm).fit_transform(ref)))
+        self.assertTrue(np.allclose(
+            pipeline.transform(rows[30:], rows_normalized=True),
+            pipeline.transform(matrix)))
+
+    def test_3_normalization_steps(self):
+        """test the normalization steps against the training and test fold steps of LoadData"""
+        from sklearn.preprocessing import MinMaxScaler
+        from sklearn.preprocessing import Normalizer
+        from sklearn.preprocessing import RobustScaler
+        from sklearn.preprocessing import StandardScaler
+        from sklearn.preprocessing import quantile_transform
+        from collections import defaultdict
+
+        from simdeep.extract_data import LoadData
+        from simdeep.extract_data import QUANTILE_OPTION
+        from simdeep.survival_utils import CorrelationReducer
+        from simdeep.survival_utils import MadScaler
+        from simdeep.survival_utils import RankNorm
+        from simdeep.survival_utils import VarianceReducer
+
+        PATH_DATA = '{0}/../examples/data/'.format(split(abspath(__file__))[0])
+
+        def normalize_training(matrix, norm):
+            """steps of the training matrix"""
+            if norm['NB_FEATURES_TO_KEEP']:
+                matrix = VarianceReducer(norm['NB_FEATURES_TO_KEEP']).fit_transform(matrix)
+            if norm['CUSTOM']:
+                matrix = norm['CUSTOM']().fit_transform(matrix)
+            if norm['TRAIN_MIN_MAX']:
+                matrix = MinMaxScaler().fit_transform(matrix.T).T
+            if norm['TRAIN_MAD_SCALE']:
+                matrix = MadScaler().fit_transform(matrix.T).T
+            if norm['TRAIN_ROBUST_SCALE'] or norm['TRAIN_ROBUST_SCALE_TWO_WAY']:
+                matrix = RobustScaler().fit_transform(matrix)
+            if norm['TRAIN_NORM_SCALE']:
+                matrix = Normalizer().fit_transform(matrix)
+            if norm['TRAIN_QUANTILE_TRANSFORM']:
+                matrix = quantile_transform(matrix, **QUANTILE_OPTION)
+            if norm['TRAIN_RANK_NORM']:
+                matrix = RankNorm().fit_transform(matrix)
+            if norm['TRAIN_CORR_REDUCTION']:
+                matrix = CorrelationReducer().fit_transform(matrix)
+                if norm['TRAIN_CORR_RANK_NORM']:
+                    matrix = RankNorm().fit_transform(matrix)
+                if norm['TRAIN_CORR_QUANTILE_NORM']:
+                    matrix = quantile_transform(matrix, **QUANTILE_OPTION)
+                if norm['TRAIN_CORR_NORM_SCALE']:
+                    matrix = Normalizer().fit_transform(matrix)
+
+            return np.nan_to_num(matrix)
+
+        def normalize_test(matrix_ref, matrix, norm):
+            """steps of the test matrix, fitted on the reference matrix"""
+            if norm['LOG_REF_MATRIX']:
+                matrix_ref = np.log2(1.0 + matrix_ref)
+            if norm['LOG_TEST_MATRIX']:
+                matrix = np.log2(1.0 + matrix)
+            if norm['CUSTOM']:
+                custom_norm = norm['CUSTOM']()
+                matrix_ref = custom_norm.fit_transform(matrix_ref)
+                matrix = custom_norm.transform(matrix)
+            if norm['NB_FEATURES_TO_KEEP']:
+                reducer = VarianceReducer(norm['NB_FEATURES_TO_KEEP'])
+                matrix_ref = reducer.fit_transform(matrix_ref)
+                matrix = reducer.transform(matrix)
+            if norm['TRAIN_MIN_MAX']:
+                matrix_ref = MinMaxScaler().fit_transform(matrix_ref.T).T
+                matrix = MinMaxScaler().fit_transform(matrix.T).T
+            if norm['TRAIN_MAD_SCALE']:
+                matrix_ref = MadScaler().fit_transform(matrix_ref.T).T
+                matrix = MadScaler().fit_transform(matrix.T).T
+            if norm['TRAIN_ROBUST_SCALE'] or norm['TRAIN_ROBUST_SCALE_TWO_WAY']:
+                scaler = RobustScaler()
+                matrix_ref = scaler.fit_transform(matrix_ref)
+                matrix = scaler.transform(matrix)
+            if norm['TRAIN_NORM_SCALE']:
+                matrix_ref = Normalizer().fit_transform(matrix_ref)
+                matrix = Normalizer().fit_transform(matrix)
+            if norm['TRAIN_QUANTILE_TRANSFORM']:
+                matrix_ref = quantile_transform(matrix_ref, **QUANTILE_OPTION)
+                matrix = quantile_transform(matrix, **QUANTILE_OPTION)
+            if norm['TRAIN_RANK_NORM']:
+                matrix_ref = RankNorm().fit_transform(matrix_ref)
+                matrix = RankNorm().fit_transform(matrix)
+            if norm['TRAIN_CORR_REDUCTION']:
+                reducer = CorrelationReducer()
+                matrix_ref = reducer.fit_transform(matrix_ref)
+                matrix = reducer.transform(matrix)
+                if norm['TRAIN_CORR_RANK_NORM']:
+                    matrix = RankNorm().fit_transform(matrix)
+                if norm['TRAIN_CORR_QUANTILE_TRANSFORM']:
+                    matrix = quantile_transform(matrix, **QUANTILE_OPTION)
+                if norm['TRAIN_CORR_NORM_SCALE']:
+                    matrix = Normalizer().fit_transform(matrix)
+
+            return np.nan_to_num(matrix)
+
+        corr = {'TRAIN_CORR_REDUCTION': True}
+
+        for norm in [{'NB_FEATURES_TO_KEEP': 100},
+                     {'TRAIN_MIN_MAX': True},
+                     {'TRAIN_MAD_SCALE': True},
+                     {'TRAIN_ROBUST_SCALE': True},
+                     {'TRAIN_ROBUST_SCALE_TWO_WAY': True},
+                     {'TRAIN_NORM_SCALE': True},
+                     {'TRAIN_QUANTILE_TRANSFORM': True},
+                     {'TRAIN_RANK_NORM': True},
+                     dict(corr),
+                     dict(corr, TRAIN_CORR_RANK_NORM=True),
+                     dict(corr, TRAIN_CORR_QUANTILE_NORM=True),
+                     dict(corr, TRAIN_CORR_QUANTILE_TRANSFORM=True),
+                     dict(corr, TRAIN_CORR_NORM_SCALE=True),
+                     {'LOG_REF_MATRIX': True, 'LOG_TEST_MATRIX': True,
+                      'TRAIN_RANK_NORM': True},
+                     {'CUSTOM': StandardScaler, 'NB_FEATURES_TO_KEEP': 100}]:
+            dataset = LoadData(path_data=PATH_DATA,
+                               survival_tsv='survival_dummy.tsv',
+                               training_tsv={'RNA': 'rna_dummy.tsv'},
+                               normalization=norm,
+                               verbose=False)
+            dataset.load_training_samples()
+            dataset.create_a_cv_split()
+            dataset.normalize_training_array()
+            dataset.load_matrix_test_fold()
+
+            norm = dataset.normalization
+            matrix = dataset.matrix_array['RNA']
+            matrix_cv = dataset.matrix_cv_unormalized_array['RNA']
+
+            self.assertTrue(np.allclose(dataset.matrix_train_array['RNA'],
+                                        normalize_training(matrix, norm)), norm)
+            self.assertTrue(np.allclose(dataset.matrix_cv_array['RNA'],
+                                        normalize_test(matrix, matrix_cv, norm)), norm)
+
+        # the quantile and correlation scaling steps of another normalization
+        # are those of the dataset
+        dataset = LoadData(path_data=PATH_DATA,
+                           survival_tsv='survival_dummy.tsv',
+                           training_tsv={'RNA': 'rna_dummy.tsv'},
+                           normalization=dict(corr, TRAIN_QUANTILE_TRANSFORM=True,
+                                              TRAIN_CORR_NORM_SCALE=True),
+                           verbose=False)
+        dataset.load_training_samples()
+        dataset.create_a_cv_split()
+
+        matrix = dataset.matrix_array['RNA']
+        matrix_cv = dataset.matrix_cv_array['RNA']
+
+        norm = defaultdict(bool, dict(corr, TRAIN_RANK_NORM=True))
+        matrix_test = dataset.transform_matrices(matrix, matrix_cv, 'RNA',
+                                                 normalization=norm)[1]
+        norm.update(TRAIN_QUANTILE_TRANSFORM=True, TRAIN_CORR_NORM_SCALE=True)
+
+        self.assertTrue(np.allclose(matrix_test,
+                                    normalize_test(matrix, matrix_cv, norm)))
+
+    def test_3_select_columns(self):
+        """test the column selection and the stacked matrices"""
+        from simdeep.survival_utils import select_columns
+        from simdeep.survival_utils import StackedMatrices
+        from scipy.sparse import csr_matrix
+
+        matrix = np.random.random((5, 4))
+        matrix[0, 1] = np.nan
+        expected = np.nan_to_num(np.hstack([matrix.T[[3, 1]].T,
+                                            np.zeros((5, 1))]))
+
+        self.assertTrue(np.allclose(select_columns(matrix, [3, 1, -1]),
+                                    expected))
+        self.assertTrue(np.allclose(
+            select_columns(csr_matrix(matrix), [3, 1, -1]).toarray(), expected))
+        self.assertIs(select_columns(matrix[1:], range(4)).base, matrix)
+
+        arrays = {'A': matrix[:2]}
+        stacked = StackedMatrices(arrays, {'A': matrix[2:]})
+        self.assertEqual(list(stacked), ['A'])
+        self.assertTrue(np.array_equal(stacked['A'], matrix, equal_nan=True))
+        self.assertIs(stacked['A'], stacked['A'])
+
+        # a replaced matrix is stacked again
+        arrays['A'] = matrix[:1]
+        self.assertTrue(np.array_equal(stacked['A'], matrix[[0, 2, 3, 4]],
+                                       equal_nan=True))
+
+    def test_3_survival(self):
+        """test the survival container"""
+        from simdeep.survival_utils import Survival
+
+        survival = Survival.from_records([(10.0, 1.0), (25.5, 0.0), (3.0, 1.0)])
+
+        self.assertEqual(survival.time.dtype, np.float64)
+        self.assertEqual(survival.event.dtype, np.int8)
+        self.assertTrue(survival.time.flags['C_CONTIGUOUS'])
+
+        sub = survival[[2, 0]]
+        self.assertEqual(sub.time.tolist(), [3.0, 10.0])
+        self.assertEqual(len(Survival.concatenate([survival, sub])), 5)
+        self.assertTrue(np.array_equal(np.asarray(survival)[1], [25.5, 0.0]))
+        self.assertTrue(np.isnan(Survival.unknown(2).time).all())
+
+    def test_3_survival_design(self):
+        """test the risk sets and Kaplan-Meier statistics of a survival design"""
+        from lifelines import KaplanMeierFitter
+        from lifelines.utils import restricted_mean_survival_time
+        from simdeep.survival_utils import Survival
+        from simdeep.coxph_from_r import surv_median
+        from simdeep.coxph_from_r import surv_mean
+
+        survival = Survival([5, 5, 1, 7, 13, 14, 8], [1, 1, 0, 1, 0, 1, 1])
+        design = survival.design
+
+        self.assertIs(design, survival.design)
+        self.assertEqual(design.unique_time.tolist(), [1, 5, 7, 8, 13, 14])
+        self.assertEqual(design.nb_events.tolist(), [0, 2, 1, 1, 0, 1])
+        self.assertEqual(design.nb_at_risk.tolist(), [7, 6, 4, 3, 2, 1])
+
+        mask = survival.event == 1
+        subset = design.subset(mask)
+        self.assertEqual(subset.sorted_time.tolist(), [5, 5, 7, 8, 14])
+
+        self.assertEqual(surv_median(survival.event, survival.time,
+                                     use_r_packages=False, design=design), 7.0)
+        self.assertEqual(surv_median(survival.event[mask], survival.time[mask],
+                                     use_r_packages=False, design=subset), 7.0)
+
+        kaplan = KaplanMeierFitter().fit(survival.time, survival.event)
+        self.assertEqual(surv_median(survival.event, survival.time,
+                                     use_r_packages=False),
+                         kaplan.median_survival_time_)
+
+        # last sample with an event: finite restricted mean
+        self.assertTrue(np.isclose(
+            surv_mean(survival.event, survival.time, use_r_packages=False),
+            restricted_mean_survival_time(kaplan)))
+
+        # last sample censored
+        keep = survival.time != 14
+        kaplan = KaplanMeierFitter().fit(survival.time[keep], survival.event[keep])
+        self.assertEqual(
+            surv_mean(survival.event[keep], survival.time[keep],
+                      use_r_packages=False, design=design.subset(keep)),
+            restricted_mean_survival_time(kaplan))
+
+    def test_3_logrank(self):
+        """test the k-group log-rank test of the labels"""
+        from lifelines.statistics import multivariate_logrank_test
+        from simdeep.coxph_from_r import logrank
+        from simdeep.coxph_from_r import coxph
+
+        np.random.seed(3)
+        nbdays = np.random.randint(1, 30, 50).astype(float)
+        isdead = np.random.randint(0, 2, 50)
+        labels = np.random.randint(0, 3, 50)
+
+        pvalue = multivariate_logrank_test(nbdays, labels, isdead).p_value
+
+        self.assertTrue(np.isclose(logrank(labels, isdead, nbdays), pvalue))
+        self.assertTrue(np.isclose(
+            coxph(labels, isdead, nbdays, use_r_packages=False), pvalue))
+        self.assertTrue(np.isnan(logrank(np.zeros(50), isdead, nbdays)))
+
+    def test_3_concordance(self):
+        """test the concordance index engine"""
+        from lifelines.utils import concordance_index
+        from simdeep.coxph_from_r import concordance
+        from simdeep.coxph_from_r import concordance_columns
+
+        np.random.seed(4)
+        nbdays = np.random.randint(1, 10, 40).astype(float)
+        isdead = np.random.randint(0, 2, 40)
+        scores = np.random.randint(0, 5, (40, 3)).astype(float)
+
+        cindexes = concordance_columns(scores, isdead, nbdays)
+
+        for i in range(3):
+            self.assertTrue(np.isclose(
+                cindexes[i], concordance_index(nbdays, scores[:, i], isdead)))
+
+        # tied scores left out
+        self.assertEqual(concordance([1, 1, 2], [1, 1, 0], [1, 2, 3],
+                                     method='noether'), 1.0)
+        self.assertEqual(concordance([1, 1, 2], [1, 1, 0], [1, 2, 3],
+                                     method='harrell'), 5.0 / 6.0)
+
+    def test_3_metadata_encoder(self):
+        """test that the metadata encoding fitted on the training frame is reused"""
+        from simdeep.survival_utils import MetadataEncoder
+        import pandas as pd
+
+        frame = pd.DataFrame({'sex': ['M', 'F', 'M'],
+                              'stage': ['I', 'II', 'III'],
+                              'age': [40.0, 50.0, 70.0]})
+        encoder = MetadataEncoder()
+        matrix = encoder.fit_transform(frame)
+
+        self.assertEqual(list(matrix.columns),
+                         ['sex_M', 'stage_I', 'stage_II', 'stage_III', 'age'])
+        self.assertEqual(matrix['stage_II'].tolist(), [0.0, 1.0, 0.0])
+
+        test = encoder.transform(pd.DataFrame({'sex': ['F'], 'stage': ['IV'],
+                                               'age': [50.0]}))
+        self.assertEqual(test.values.tolist(), [[0.0, 0.0, 0.0, 0.0, 0.0]])
+
+    def test_3_coxph_columns(self):
+        """test the Cox-PH models fitted on all the columns at once"""
+        from lifelines import CoxPHFitter
+        import pandas as pd
+        from simdeep.coxph_from_r import coxph_columns
+        from simdeep.coxph_from_r import coxph
+
+        np.random.seed(1)
+        nbdays = np.random.randint(1, 20, 40).astype(float)
+        isdead = np.random.randint(0, 2, 40)
+        matrix = np.random.random((40, 4))
+        matrix[:, 1] += isdead
+        matrix[:, 3] = 1.0
+
+        pvalues = coxph_columns(matrix, isdead, nbdays)
+
+        self.assertTrue(np.isnan(pvalues[3]))
+
+        for i in range(3):
+            frame = pd.DataFrame({'values': matrix[:, i],
+                                  'isdead': isdead,
+                                  'nbdays': nbdays})
+
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                cph = CoxPHFitter().fit(frame, 'nbdays', 'isdead')
+
+            pvalue = cph.log_likelihood_ratio_test().p_value
+
+            self.assertTrue(np.isclose(pvalues[i], pvalue, rtol=1e-4))
+            # the python backend of coxph (no metadata) uses the same models
+            self.assertTrue(np.isclose(
+                coxph(matrix[:, i], isdead, nbdays, use_r_packages=False),
+                pvalue, rtol=1e-4))
+
+    def test_3_coxph_columns_separation(self):
+        """test the Cox-PH models of columns (quasi-)separating the events"""
+        from lifelines import CoxPHFitter
+        import pandas as pd
+        from simdeep.coxph_from_r import coxph_columns
+
+        # a single event: its value is the highest of its risk set
+        nbdays = np.arange(1, 8, dtype=float)
+        isdead = np.array([0, 0, 1, 0, 0, 0, 0])
+        values = np.array([0.61, 0.86, 0.89, 0.18, 0.76, 0.75, 0.61])
+
+        pvalue = coxph_columns(values, isdead, nbdays)[0]
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            cph = CoxPHFitter().fit(pd.DataFrame({
+                'values': values, 'isdead': isdead, 'nbdays': nbdays}),
+                                    'nbdays', 'isdead')
+
+        self.assertTrue(np.isfinite(pvalue))
+        self.assertTrue(np.isclose(
+            pvalue, cph.log_likelihood_ratio_test().p_value, rtol=1e-3))
+
     def test_4_keras_model_instantiation(self):
         """
         test if keras can be loaded and if that a model
@@ -107,6 +971,74 @@ class TestPackage(unittest.TestCase):
             elif isdir(fil):
                 rmtree(fil)
 
+    def test_5_cindex_node_selection(self):
+        """
+        test the C-index node selection against a per-node lifelines loop
+        """
+        import pandas as pd
+        from unittest import mock
+        from lifelines import CoxPHFitter
+        from lifelines.utils import concordance_index
+        from multiprocessing import Pool
+
+        import simdeep.simdeep_analysis as simdeep_analysis
+        from simdeep.simdeep_analysis import SimDeep
+        from simdeep.extract_data import LoadData
+
+        PATH_DATA = '{0}/../examples/data/'.format(split(abspath(__file__))[0])
+        CINDEX_THRES = 0.55
+
+        dataset = LoadData(path_data=PATH_DATA,
+                           survival_tsv='survival_dummy.tsv',
+                           training_tsv={'RNA': 'rna_dummy.tsv'})
+
+        simdeep = SimDeep(dataset=dataset,
+                          use_autoencoders=False,
+                          node_selection='C-index',
+                          cindex_thres=CINDEX_THRES,
+                          nb_threads_coxph=2,
+                          do_KM_plot=False)
+        simdeep.load_training_dataset()
+
+        # one chunk
+        valid_node_ids = simdeep._look_for_prediction_nodes('RNA')
+
+        matrix_train = simdeep.matrix_train_array['RNA'].astype('float64')
+        matrix_cv = dataset.matrix_cv_array['RNA'].astype('float64')
+        survival, survival_cv = dataset.survival, dataset.survival_cv
+
+        node_ids = []
+
+        for node_id in range(matrix_train.shape[1]):
+            cph = CoxPHFitter()
+
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                cph.fit(pd.DataFrame({'values': matrix_train[:, node_id],
+                                      'nbdays': survival.time,
+                                      'isdead': survival.event}),
+                        'nbdays', 'isdead')
+
+            cindex = concordance_index(
+                survival_cv.time,
+                -cph.params_['values'] * matrix_cv[:, node_id],
+                survival_cv.event)
+
+            if cindex > CINDEX_THRES:
+                node_ids.append(node_id)
+
+        self.assertTrue(node_ids)
+        self.assertEqual(set(valid_node_ids), set(node_ids))
+
+        # chunks of nodes scored in parallel
+        with mock.patch.object(simdeep_analysis, 'CINDEX_NODES_CHUNK_SIZE', 7), \
+             mock.patch.object(simdeep_analysis, 'Pool', wraps=Pool) as pool:
+            self.assertEqual(simdeep._look_for_prediction_nodes('RNA'), valid_node_ids)
+            pool.assert_called_once_with(2)
+
+        dataset.cross_validation_instance = None
+        self.assertRaises(Exception, simdeep._look_for_prediction_nodes, 'RNA')
+
     def test_6_simdeep_boosting(self):
         """
         test simdeep boosting